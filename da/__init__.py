@@ -10,11 +10,23 @@ from flask import Flask, got_request_exception
 
 from datetime import datetime, timezone
 
+from .commands import register_maintenance_commands
 from .config import get_config
 from .extensions import csrf, db, login_manager, migrate
+from .log_queue import JsonFormatter, start_log_queue, stop_log_queue
 from .models import User
 from .routes import register_blueprints
 from .seed import register_seed_commands
+from .services.audit_capture import register_audit_events
+from .services.counters import register_counter_events
+from .services.email import start_email_sender
+from .services.employee_search import register_employee_search_functions
+from .services.metrics import register_metrics
+from .services.profiler import register_profiler
+from .services.query_stats import register_query_stats
+from .services.reference_data import register_reference_data_events
+from .services.search import register_search_events
+from .services.slow_queries import register_slow_query_log
 
 
 @login_manager.user_loader
@@ -43,6 +55,17 @@ def create_app(config_name: Optional[str] = None) -> Flask:
 
     register_blueprints(app)
     register_seed_commands(app)
+    register_maintenance_commands(app)
+    register_counter_events()
+    register_audit_events()
+    register_reference_data_events()
+    register_search_events()
+    register_employee_search_functions()
+    register_query_stats(app)
+    register_slow_query_log(app)
+    register_metrics(app)
+    register_profiler(app)
+    start_email_sender(app)
 
     @app.context_processor
     def inject_globals():
@@ -63,7 +86,19 @@ def create_app(config_name: Optional[str] = None) -> Flask:
 def setup_logging(app: Flask) -> None:
     log_level = app.config.get("LOG_LEVEL", "INFO")
     log_file = app.config.get("LOG_FILE")
-
+    json_format = app.config.get("LOG_FORMAT") == "json"
+
+    loggers = {
+        "sqlalchemy.engine": {"level": "WARNING"},
+        "werkzeug": {"level": "WARNING"},
+    }
+    # Уровни отдельных логгеров из LOG_LEVELS. У обработчиков уровня нет:
+    # запись, пропущенную логгером с уровнем DEBUG, они не отсекают
+    for name, level in app.config.get("LOG_LEVELS", {}).items():
+        loggers[name] = {"level": level.upper()}
+
+    # Слушатель очереди держит обработчики прошлой конфигурации: сначала дописываем их
+    stop_log_queue()
     dictConfig(
         {
             "version": 1,
@@ -75,17 +110,18 @@ def setup_logging(app: Flask) -> None:
                 "detailed": {
                     "format": "%(asctime)s %(levelname)s [%(name)s:%(lineno)d] - %(message)s",
                 },
+                "json": {
+                    "()": JsonFormatter,
+                },
             },
             "handlers": {
                 "console": {
                     "class": "logging.StreamHandler",
-                    "formatter": "default",
-                    "level": log_level,
+                    "formatter": "json" if json_format else "default",
                 },
                 "file": {
                     "class": "logging.handlers.RotatingFileHandler",
-                    "formatter": "detailed",
-                    "level": log_level,
+                    "formatter": "json" if json_format else "detailed",
                     "filename": log_file,
                     "maxBytes": 5 * 1024 * 1024,
                     "backupCount": 5,
@@ -95,9 +131,8 @@ def setup_logging(app: Flask) -> None:
                 "level": log_level,
                 "handlers": ["console", "file"],
             },
-            "loggers": {
-                "sqlalchemy.engine": {"level": "WARNING"},
-                "werkzeug": {"level": "WARNING"},
-            },
+            "loggers": loggers,
         }
     )
+    if app.config.get("LOG_QUEUE", True):
+        start_log_queue()
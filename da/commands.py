@@ -0,0 +1,103 @@
+import click
+from flask import Flask
+
+from .services.audit_archive import archive_old_audit_logs, ensure_partitions
+from .services.counters import reconcile_counters
+from .services.email import send_pending_emails
+from .services.import_jobs import run_pending_jobs
+from .services.search import rebuild_search_index
+from .services.slow_queries import summarize_slow_queries
+
+
+def register_maintenance_commands(app: Flask) -> None:
+    @app.cli.command("inventory-counters")
+    @click.option("--dry-run", is_flag=True, help="Only report drift, do not fix it.")
+    def inventory_counters(dry_run: bool) -> None:
+        """Rebuild inventory counters from devices and report drift.
+
+        Safe to run periodically (e.g. from cron).
+        """
+        drift = reconcile_counters(dry_run=dry_run)
+        if not drift:
+            click.echo("Inventory counters are consistent")
+            return
+        for (dimension, ref), (stored, actual) in sorted(drift.items()):
+            click.echo(f"{dimension}={ref}: stored {stored}, actual {actual}")
+        action = "found" if dry_run else "fixed"
+        click.echo(f"Drift {action} in {len(drift)} counter(s)")
+
+    @app.cli.command("import-jobs")
+    def import_jobs() -> None:
+        """Run pending Excel import jobs in this process.
+
+        Use as a separate worker (e.g. with IMPORT_WORKERS=0 in the web app)
+        or to finish jobs queued before a restart.
+        """
+        count = run_pending_jobs()
+        click.echo(f"Processed {count} import job(s)")
+
+    @app.cli.command("search-reindex")
+    def search_reindex() -> None:
+        """Rebuild the full-text search index from devices, employees and warehouses.
+
+        Needed after writes that bypass the ORM or after restoring a backup.
+        """
+        count = rebuild_search_index()
+        click.echo(f"Indexed {count} document(s)")
+
+    @app.cli.command("audit-archive")
+    @click.option("--months", type=int, default=None,
+                  help="Keep this many full months (default: AUDIT_RETENTION_MONTHS).")
+    @click.option("--dry-run", is_flag=True, help="Only report months to archive.")
+    def audit_archive(months: int | None, dry_run: bool) -> None:
+        """Move audit log months past retention to compressed JSONL files.
+
+        On PostgreSQL also creates upcoming monthly partitions. Run monthly
+        (e.g. from cron); an interrupted run can be safely repeated.
+        """
+        if not dry_run:
+            for name in ensure_partitions():
+                click.echo(f"Created partition {name}")
+        archived = archive_old_audit_logs(retention_months=months, dry_run=dry_run)
+        if not archived:
+            click.echo("Nothing to archive")
+            return
+        for entry in archived:
+            if dry_run:
+                click.echo(f"{entry.month}: {entry.rows} row(s) to archive")
+            else:
+                click.echo(f"{entry.month}: {entry.rows} row(s) -> {entry.path}")
+
+    @app.cli.command("email-outbox")
+    def email_outbox() -> None:
+        """Send queued emails that are due in this process.
+
+        Use as a separate worker (e.g. with EMAIL_SENDER_THREAD=0 in the web app)
+        or to flush the queue after an SMTP outage.
+        """
+        count = send_pending_emails()
+        click.echo(f"Sent {count} email(s)")
+
+    @app.cli.command("slow-queries")
+    @click.option("--limit", type=int, default=10, show_default=True, help="Number of statements to show.")
+    @click.option("--hours", type=float, default=None, help="Only entries from the last N hours.")
+    @click.option("--plans", is_flag=True, help="Show parameters and plan of the slowest run.")
+    def slow_queries(limit: int, hours: float | None, plans: bool) -> None:
+        """Summarize the slow-query log by normalized statement, worst total time first."""
+        summaries = summarize_slow_queries(app.config["LOG_DIR"], hours=hours)
+        if not summaries:
+            click.echo("No slow queries logged")
+            return
+        for summary in summaries[:limit]:
+            endpoints = ", ".join(f"{name} ({count})" for name, count in summary.endpoints.most_common(3))
+            click.echo(
+                f"{summary.count}x total {summary.total_ms:.0f} ms, avg {summary.avg_ms:.0f} ms, "
+                f"max {summary.max_ms:.0f} ms  [{endpoints}]"
+            )
+            click.echo(f"  {summary.shape[:500]}")
+            if plans:
+                click.echo(f"  params: {summary.parameters}")
+                for line in (summary.plan or "(no plan)").splitlines():
+                    click.echo(f"    {line}")
+        if len(summaries) > limit:
+            click.echo(f"... {len(summaries) - limit} more statement(s)")
@@ -22,6 +22,17 @@ class Config:
     LOG_DIR = Path(os.getenv("LOG_DIR", BASE_DIR / "instance" / "logs"))
     LOG_FILE = str(LOG_DIR / "app.log")
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # Файл и консоль пишет отдельный поток, запросы только ставят записи в
+    # очередь (da/log_queue.py); LOG_QUEUE=0 — синхронная запись.
+    # LOG_FORMAT=json — одна JSON-строка на запись. LOG_LEVELS — уровни
+    # отдельных логгеров: "da.services.import_jobs=WARNING,da.services.email=DEBUG"
+    LOG_QUEUE = os.getenv("LOG_QUEUE", "1") == "1"
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_LEVELS = {
+        name.strip(): level.strip()
+        for name, _, level in (item.partition("=") for item in os.getenv("LOG_LEVELS", "").split(","))
+        if name.strip() and level.strip()
+    }
     
     # Email/SMTP settings
     # Письма отправляются с da@ittest-team.ru на email супер-админа
@@ -29,9 +40,80 @@ class Config:
     SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
     SMTP_USER = os.getenv("SMTP_USER", "da@ittest-team.ru")
     SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+    SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+    # Письма ставятся в таблицу email_outbox и отправляются фоновым потоком через
+    # одно SMTP-соединение; неудачные попытки повторяются с растущей паузой.
+    # Для отладки: SMTP_HOST=localhost SMTP_PORT=1025 SMTP_USER= и локальный
+    # отладочный SMTP-сервер. EMAIL_SENDER_THREAD=0 — отправка только `flask email-outbox`
+    EMAIL_SENDER_THREAD = os.getenv("EMAIL_SENDER_THREAD", "1") == "1"
+    EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "10"))
+    EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+    EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+    EMAIL_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+    EMAIL_RETRY_MAX_SECONDS = int(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+    # Уведомления об удалении за окно (минуты, от первого уведомления) уходят
+    # одним сводным письмом на получателя; 0 — письмо на каждое удаление
+    DELETION_DIGEST_MINUTES = int(os.getenv("DELETION_DIGEST_MINUTES", "5"))
+    
+    # Статистика SQL по запросам (services/query_stats.py): форма оператора,
+    # повторённая в запросе столько раз, считается N+1 и пишется в лог.
+    # Заголовки X-DB-* в ответе — в режиме отладки или при SQL_STATS_HEADER=1
+    SQL_STATS_ENABLED = os.getenv("SQL_STATS_ENABLED", "1") == "1"
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+    SQL_STATS_HEADER = os.getenv("SQL_STATS_HEADER") == "1" or None
+    # Метрики Prometheus на /metrics (services/metrics.py) — только с заголовком
+    # Authorization: Bearer <METRICS_TOKEN>, без токена эндпоинт закрыт. Общий
+    # каталог воркеров PROMETHEUS_MULTIPROC_DIR по умолчанию задаёт gunicorn.conf.py
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    # Журнал медленных SQL (services/slow_queries.py): операторы дольше
+    # SLOW_QUERY_MS мс (0 — выключено) с планом EXPLAIN пишутся в
+    # LOG_DIR/slow_queries.jsonl; сводка — `flask slow-queries`
+    SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", "500"))
+    SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+    SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    # Выборочное профилирование cProfile (services/profiler.py): в среднем
+    # один запрос из PROFILER_SAMPLE_RATE (0 — без выборки), endpoint из
+    # PROFILER_ENDPOINTS (через запятую) и запросы администраторов с заголовком
+    # PROFILER_HEADER: 1. Хранятся последние PROFILER_KEEP файлов в LOG_DIR/profiles
+    PROFILER_ENABLED = os.getenv("PROFILER_ENABLED") == "1"
+    PROFILER_SAMPLE_RATE = int(os.getenv("PROFILER_SAMPLE_RATE", "100"))
+    PROFILER_ENDPOINTS = [name.strip() for name in os.getenv("PROFILER_ENDPOINTS", "").split(",") if name.strip()]
+    PROFILER_HEADER = os.getenv("PROFILER_HEADER", "X-Profile")
+    PROFILER_KEEP = int(os.getenv("PROFILER_KEEP", "200"))
     
     # File upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB max file size
+    # Импорт из Excel обрабатывается пачками по указанному числу строк
+    IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+    # Число фоновых потоков для задач импорта; 0 — выполнять импорт сразу в запросе
+    IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+    # Задача RUNNING без отметки прогресса дольше этого времени (секунды)
+    # считается брошенной упавшим воркером и переводится в FAILED
+    IMPORT_JOB_STALE_SECONDS = int(os.getenv("IMPORT_JOB_STALE_SECONDS", "900"))
+
+    # Записи audit log пишутся фоновым потоком пачками; при заполненном буфере
+    # запись ждёт AUDIT_ENQUEUE_TIMEOUT секунд и отбрасывается. 0 — писать в транзакции изменений
+    AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+    AUDIT_ENQUEUE_TIMEOUT = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", "0.5"))
+    # Записи audit log старше AUDIT_RETENTION_MONTHS полных месяцев `flask audit-archive`
+    # переносит в gzip JSONL (по умолчанию instance/audit_archive); на PostgreSQL
+    # заранее создаются помесячные партиции на AUDIT_PARTITIONS_AHEAD месяцев вперёд
+    AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+    AUDIT_ARCHIVE_BATCH_SIZE = int(os.getenv("AUDIT_ARCHIVE_BATCH_SIZE", "5000"))
+    AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+    AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR")
+
+    # Сводка на главной странице кэшируется в процессе на указанное число секунд
+    DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "30"))
+    # Справочники для выпадающих списков форм кэшируются в процессе; изменения
+    # в этом процессе видны сразу, в остальных — не позже чем через TTL секунд
+    REFERENCE_CACHE_TTL = int(os.getenv("REFERENCE_CACHE_TTL", "60"))
+    # Как часто процесс перечитывает версии справочников (изменения из других
+    # процессов); 0 — при каждом обращении
+    REFERENCE_VERSION_POLL_SECONDS = float(os.getenv("REFERENCE_VERSION_POLL_SECONDS", "2"))
 
 
 class DevelopmentConfig(Config):
@@ -61,6 +143,12 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     WTF_CSRF_ENABLED = False
     LOG_LEVEL = "CRITICAL"
+    DASHBOARD_CACHE_TTL = 0
+    IMPORT_WORKERS = 0
+    AUDIT_BUFFER_SIZE = 0
+    EMAIL_SENDER_THREAD = False
+    DELETION_DIGEST_MINUTES = 0
+    SLOW_QUERY_MS = 0
 
 
 def get_config(env: str | None) -> type[Config]:
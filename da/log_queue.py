@@ -0,0 +1,97 @@
+"""Асинхронная запись логов через очередь.
+
+Корневой логгер получает единственный QueueHandler: поток, вызвавший
+logger.info, только кладёт запись в очередь. Обработчики файла и консоли
+принадлежат потоку QueueListener, поэтому запись на диск и ротация файла не
+задерживают запросы и импорт. Сообщение и traceback форматируются ещё в
+вызывающем потоке: аргументы записи к моменту вывода могут измениться.
+
+После fork (gunicorn с preload_app) поток слушателя в дочернем процессе не
+работает — слушатель запускается заново с теми же обработчиками.
+"""
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись (LOG_FORMAT = "json")."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В отличие от QueueHandler.prepare, traceback не склеивается с
+        # сообщением: форматтеры слушателя (в том числе JSON) выводят его сами
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: QueueListener | None = None
+
+
+def start_log_queue() -> None:
+    """Переносит обработчики корневого логгера в поток QueueListener."""
+    global _listener
+    root = logging.getLogger()
+    handlers = [handler for handler in root.handlers if not isinstance(handler, QueueHandler)]
+    stop_log_queue()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root.handlers = [_QueueHandler(log_queue)]
+    _listener.start()
+
+
+def stop_log_queue() -> None:
+    """Дописывает записи из очереди и останавливает слушателя."""
+    global _listener
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+    _listener = None
+
+
+def _restart_after_fork() -> None:
+    global _listener
+    if _listener is None:
+        return
+    handlers = _listener.handlers
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    # Поток родителя в дочернем процессе не существует: stop() не вызываем
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    logging.getLogger().handlers = [_QueueHandler(log_queue)]
+    _listener.start()
+
+
+atexit.register(stop_log_queue)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -5,7 +5,8 @@ from datetime import datetime, timezone
 from typing import Optional
 
 from flask_login import UserMixin
-from sqlalchemy import CheckConstraint, Enum
+from sqlalchemy import DDL, JSON, CheckConstraint, Enum, event, func, literal_column, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .extensions import db
@@ -15,6 +16,12 @@ def utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def live_index(name: str, *columns, **kwargs) -> db.Index:
+    """Частичный индекс только по не удалённым строкам (deleted_at IS NULL)."""
+    condition = text("deleted_at IS NULL")
+    return db.Index(name, *columns, postgresql_where=condition, sqlite_where=condition, **kwargs)
+
+
 class TimestampMixin:
     created_at: Mapped[datetime] = mapped_column(
         default=utcnow, nullable=False
@@ -25,7 +32,7 @@ class TimestampMixin:
         nullable=False,
     )
     deleted_at: Mapped[datetime | None] = mapped_column(
-        default=None, nullable=True
+        default=None, nullable=True, active_history=True
     )
 
 
@@ -121,6 +128,33 @@ class Employee(TimestampMixin, db.Model):
         return f"<Employee {self.full_name}>"
 
 
+# Регистронезависимая уникальность контактов и ФИО (отсутствующее отчество
+# приравнивается к пустой строке). Формы и импорт сотрудников полагаются на
+# эти индексы вместо предварительных запросов-проверок.
+db.Index("uq_employees_email_ci", func.lower(Employee.email), unique=True)
+db.Index("uq_employees_phone_ci", func.lower(Employee.phone), unique=True)
+db.Index("uq_employees_telegram_ci", func.lower(Employee.telegram), unique=True)
+db.Index(
+    "uq_employees_name_ci",
+    func.lower(Employee.last_name),
+    func.lower(Employee.first_name),
+    func.coalesce(func.lower(Employee.middle_name), ""),
+    unique=True,
+)
+
+
+# Поиск сотрудников по префиксу (автодополнение): LIKE 'abc%' по lower(колонка).
+# text_pattern_ops нужен PostgreSQL, чтобы LIKE использовал индекс при любой collation.
+EMPLOYEE_SEARCH_COLUMNS = ("last_name", "first_name", "middle_name", "email", "telegram")
+for _column in EMPLOYEE_SEARCH_COLUMNS:
+    live_index(
+        f"ix_employees_{_column}_prefix",
+        func.lower(getattr(Employee, _column)).label(f"{_column}_lower"),
+        postgresql_ops={f"{_column}_lower": "text_pattern_ops"},
+    )
+del _column
+
+
 class DeviceStatus(enum.Enum):
     IN_STOCK = "in_stock"
     ASSIGNED = "assigned"
@@ -134,12 +168,21 @@ class Device(TimestampMixin, db.Model):
     inventory_number: Mapped[str] = mapped_column(unique=True, nullable=False)
     model: Mapped[str] = mapped_column(nullable=False)
     serial_number: Mapped[str | None]
-    type_id: Mapped[int] = mapped_column(db.ForeignKey("device_types.id"), nullable=False)
-    warehouse_id: Mapped[int | None] = mapped_column(db.ForeignKey("warehouses.id"), nullable=True)
-    location_id: Mapped[int | None] = mapped_column(db.ForeignKey("locations.id"), nullable=True)
-    owner_id: Mapped[int | None] = mapped_column(db.ForeignKey("employees.id"), nullable=True)
+    # active_history: старые значения нужны счётчикам инвентаря (services/counters.py)
+    type_id: Mapped[int] = mapped_column(
+        db.ForeignKey("device_types.id"), nullable=False, active_history=True
+    )
+    warehouse_id: Mapped[int | None] = mapped_column(
+        db.ForeignKey("warehouses.id"), nullable=True, active_history=True
+    )
+    location_id: Mapped[int | None] = mapped_column(
+        db.ForeignKey("locations.id"), nullable=True, active_history=True
+    )
+    owner_id: Mapped[int | None] = mapped_column(
+        db.ForeignKey("employees.id"), nullable=True, active_history=True
+    )
     status: Mapped[str] = mapped_column(
-        Enum(DeviceStatus), nullable=False, default=DeviceStatus.IN_STOCK
+        Enum(DeviceStatus), nullable=False, default=DeviceStatus.IN_STOCK, active_history=True
     )
     notes: Mapped[str | None]
 
@@ -151,12 +194,52 @@ class Device(TimestampMixin, db.Model):
         "DeviceHistory", back_populates="device", cascade="all, delete-orphan"
     )
 
-    __table_args__ = (CheckConstraint("inventory_number != ''"),)
+    __table_args__ = (
+        CheckConstraint("inventory_number != ''"),
+        # Индексы под keyset-пагинацию списка девайсов (services/device_list.py)
+        live_index("ix_devices_live_created", "created_at", "id"),
+        live_index("ix_devices_live_model", "model", "id"),
+        live_index("ix_devices_live_type", "type_id", "created_at", "id"),
+        live_index("ix_devices_live_status", "status", "created_at", "id"),
+        live_index("ix_devices_live_location", "location_id", "created_at", "id"),
+        live_index("ix_devices_live_warehouse", "warehouse_id", "created_at", "id"),
+        live_index("ix_devices_live_owner", "owner_id", "created_at", "id"),
+    )
 
     def __repr__(self) -> str:  # pragma: no cover
         return f"<Device {self.inventory_number}>"
 
 
+class InventoryCounter(db.Model):
+    """Счётчики не удалённых девайсов по измерениям (склад, сотрудник, локация, тип, статус).
+
+    Поддерживаются инкрементально из services/counters.py и пересчитываются
+    командой `flask inventory-counters`.
+    """
+    __tablename__ = "inventory_counters"
+
+    dimension: Mapped[str] = mapped_column(primary_key=True)  # 'warehouse', 'owner', 'location', 'type', 'status', 'total'
+    ref: Mapped[str] = mapped_column(primary_key=True)  # id сущности или значение статуса
+    device_count: Mapped[int] = mapped_column(default=0, nullable=False)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<InventoryCounter {self.dimension}={self.ref}: {self.device_count}>"
+
+
+class ReferenceVersion(db.Model):
+    """Версии справочников для кэша выпадающих списков (см. services/reference_data.py).
+
+    Поднимается в транзакции, меняющей сущность, поэтому общая для всех процессов.
+    """
+    __tablename__ = "reference_versions"
+
+    entity: Mapped[str] = mapped_column(primary_key=True)  # 'type', 'location', 'warehouse'
+    version: Mapped[int] = mapped_column(default=0, nullable=False)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<ReferenceVersion {self.entity}: {self.version}>"
+
+
 class HistoryEvent(enum.Enum):
     CREATED = "created"
     UPDATED = "updated"
@@ -181,6 +264,11 @@ class DeviceHistory(db.Model):
 
     device: Mapped["Device"] = relationship("Device", back_populates="history_records")
 
+    __table_args__ = (
+        # Лента событий девайса (services/device_timeline.py)
+        db.Index("ix_device_history_device", "device_id", "created_at", "id"),
+    )
+
 
 class UserRole(enum.Enum):
     SUPER_ADMIN = "super_admin"
@@ -240,6 +328,9 @@ class AuditAction(enum.Enum):
 
 
 class AuditLog(db.Model):
+    # На PostgreSQL таблица секционирована по месяцам created_at (миграция
+    # a3c8e1f5b207, записи до неё — в партиции audit_logs_legacy), первичный
+    # ключ там (id, created_at); старые месяцы переносит в файлы services.audit_archive
     __tablename__ = "audit_logs"
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -248,13 +339,208 @@ class AuditLog(db.Model):
     entity_type: Mapped[str] = mapped_column(nullable=False)  # 'device', 'employee', 'location', etc.
     entity_id: Mapped[int | None] = mapped_column(nullable=True)
     entity_name: Mapped[str | None] = mapped_column(nullable=True)  # For deleted entities
-    changes: Mapped[str | None] = mapped_column(nullable=True)  # JSON string of changes
+    # {колонка: {"old": ..., "new": ...}} или значения при создании; JSONB на PostgreSQL
+    changes: Mapped[dict | None] = mapped_column(
+        JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"), nullable=True
+    )
     ip_address: Mapped[str | None] = mapped_column(nullable=True)
     user_agent: Mapped[str | None] = mapped_column(nullable=True)
     created_at: Mapped[datetime] = mapped_column(default=utcnow, nullable=False, index=True)
 
     user: Mapped["User"] = relationship("User", back_populates="audit_logs", foreign_keys=[user_id])
 
+    __table_args__ = (
+        # История одной сущности и действия одного пользователя (services/audit_list.py)
+        db.Index("ix_audit_logs_entity", "entity_type", "entity_id", "created_at", "id"),
+        db.Index("ix_audit_logs_user", "user_id", "created_at", "id"),
+    )
+
     def __repr__(self) -> str:  # pragma: no cover
         return f"<AuditLog {self.action.value} {self.entity_type} by {self.user.email}>"
 
+
+# Поиск по изменённым полям через ? и @> (services/audit_list.field_changed);
+# jsonb_path_ops оператор ? не поддерживает, поэтому класс операторов по умолчанию
+db.Index("ix_audit_logs_changes", AuditLog.changes, postgresql_using="gin").ddl_if(dialect="postgresql")
+
+
+
+class ImportJobStatus(enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class ImportJob(db.Model):
+    """Фоновый импорт из Excel: загруженный файл, прогресс и итоги (см. services/import_jobs.py)."""
+    __tablename__ = "import_jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(nullable=False)  # 'devices', 'employees'
+    status: Mapped[str] = mapped_column(
+        Enum(ImportJobStatus), nullable=False, default=ImportJobStatus.PENDING, index=True
+    )
+    filename: Mapped[str] = mapped_column(nullable=False)
+    # Содержимое файла хранится до завершения импорта; прогресс читается без него
+    file_data: Mapped[bytes | None] = mapped_column(db.LargeBinary, nullable=True, deferred=True)
+    user_id: Mapped[int] = mapped_column(db.ForeignKey("users.id"), nullable=False)
+    ip_address: Mapped[str | None] = mapped_column(nullable=True)
+    user_agent: Mapped[str | None] = mapped_column(nullable=True)
+    total_rows: Mapped[int | None] = mapped_column(nullable=True)  # оценка по размеру листа
+    processed_rows: Mapped[int] = mapped_column(default=0, nullable=False)
+    created_count: Mapped[int] = mapped_column(default=0, nullable=False)
+    updated_count: Mapped[int] = mapped_column(default=0, nullable=False)
+    skipped_count: Mapped[int] = mapped_column(default=0, nullable=False)
+    error_count: Mapped[int] = mapped_column(default=0, nullable=False)
+    error_message: Mapped[str | None] = mapped_column(nullable=True)  # причина падения всего импорта
+    created_at: Mapped[datetime] = mapped_column(default=utcnow, nullable=False)
+    started_at: Mapped[datetime | None] = mapped_column(nullable=True)
+    # Обновляется после каждой пачки; по нему находятся задачи умерших воркеров
+    heartbeat_at: Mapped[datetime | None] = mapped_column(nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(nullable=True)
+
+    user: Mapped["User"] = relationship("User")
+    errors: Mapped[list["ImportJobError"]] = relationship(
+        "ImportJobError", back_populates="job", order_by="ImportJobError.id", lazy="dynamic"
+    )
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (ImportJobStatus.DONE, ImportJobStatus.FAILED)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<ImportJob {self.id} {self.kind} {self.status.value}>"
+
+
+class ImportJobError(db.Model):
+    """Ошибка отдельной строки фонового импорта (для полного отчёта)."""
+    __tablename__ = "import_job_errors"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    job_id: Mapped[int] = mapped_column(db.ForeignKey("import_jobs.id"), nullable=False, index=True)
+    row_num: Mapped[int] = mapped_column(nullable=False)
+    message: Mapped[str] = mapped_column(nullable=False)
+
+    job: Mapped["ImportJob"] = relationship("ImportJob", back_populates="errors")
+
+
+class EmailStatus(enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class EmailOutbox(db.Model):
+    """Письмо в очереди на отправку фоновым отправителем (см. services/email.py)."""
+    __tablename__ = "email_outbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    recipient: Mapped[str] = mapped_column(nullable=False)
+    subject: Mapped[str] = mapped_column(nullable=False)
+    body: Mapped[str] = mapped_column(db.Text, nullable=False)
+    status: Mapped[str] = mapped_column(Enum(EmailStatus), nullable=False, default=EmailStatus.PENDING)
+    attempts: Mapped[int] = mapped_column(default=0, nullable=False)
+    # Время следующей попытки; при захвате письма отправителем сдвигается на время аренды
+    next_attempt_at: Mapped[datetime] = mapped_column(default=utcnow, nullable=False)
+    last_error: Mapped[str | None] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=utcnow, nullable=False)
+    sent_at: Mapped[datetime | None] = mapped_column(nullable=True)
+
+    __table_args__ = (
+        # Выборка писем, готовых к отправке
+        db.Index("ix_email_outbox_due", "status", "next_attempt_at"),
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<EmailOutbox {self.id} {self.status.value} {self.recipient}>"
+
+
+class DeletionNotice(db.Model):
+    """Уведомление об удалении, ожидающее сводного письма (см. services/email.py)."""
+    __tablename__ = "deletion_notices"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    recipient: Mapped[str] = mapped_column(nullable=False)
+    entity_type: Mapped[str] = mapped_column(nullable=False)
+    entity_name: Mapped[str] = mapped_column(nullable=False)
+    deleted_by: Mapped[str] = mapped_column(nullable=False)
+    is_soft_delete: Mapped[bool] = mapped_column(default=False, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(default=utcnow, nullable=False)
+    # Письмо, в которое попало уведомление; NULL — ещё ждёт сводки
+    email_id: Mapped[int | None] = mapped_column(db.ForeignKey("email_outbox.id"), nullable=True)
+
+    __table_args__ = (
+        # Выборка ожидающих уведомлений по получателю
+        db.Index("ix_deletion_notices_pending", "email_id", "recipient", "created_at"),
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<DeletionNotice {self.id} {self.entity_type}:{self.entity_name}>"
+
+
+class SearchEntry(db.Model):
+    """Документ глобального поиска по девайсам, сотрудникам и складам.
+
+    Строки поддерживаются слушателями сессии из services/search.py и
+    пересобираются командой `flask search-reindex`. На PostgreSQL поиск идёт по
+    GIN-индексам tsvector и pg_trgm, на SQLite — по FTS5-таблице search_index_fts.
+    """
+    __tablename__ = "search_index"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    entity_type: Mapped[str] = mapped_column(nullable=False)  # 'device', 'employee', 'warehouse'
+    entity_id: Mapped[int] = mapped_column(nullable=False)
+    title: Mapped[str] = mapped_column(nullable=False)
+    subtitle: Mapped[str | None] = mapped_column(nullable=True)
+    content: Mapped[str] = mapped_column(nullable=False)  # все индексируемые поля через пробел
+
+    __table_args__ = (
+        db.UniqueConstraint("entity_type", "entity_id", name="uq_search_index_entity"),
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<SearchEntry {self.entity_type}:{self.entity_id}>"
+
+
+# PostgreSQL: словарь 'simple' (без стемминга) подходит и для ФИО, и для
+# инвентарных/серийных номеров; триграммы находят фрагменты внутри слов.
+SEARCH_DOCUMENT = func.to_tsvector(literal_column("'simple'"), SearchEntry.content)
+db.Index("ix_search_index_document", SEARCH_DOCUMENT, postgresql_using="gin").ddl_if(
+    dialect="postgresql"
+)
+db.Index(
+    "ix_search_index_trgm",
+    SearchEntry.content,
+    postgresql_using="gin",
+    postgresql_ops={"content": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+
+# SQLite: внешняя FTS5-таблица поверх search_index, синхронизируется триггерами
+SEARCH_FTS_DDL = (
+    "CREATE VIRTUAL TABLE search_index_fts USING fts5("
+    "title, content, content='search_index', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER search_index_ai AFTER INSERT ON search_index BEGIN "
+    "INSERT INTO search_index_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER search_index_ad AFTER DELETE ON search_index BEGIN "
+    "INSERT INTO search_index_fts(search_index_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER search_index_au AFTER UPDATE ON search_index BEGIN "
+    "INSERT INTO search_index_fts(search_index_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO search_index_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+)
+event.listen(
+    SearchEntry.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+for _statement in SEARCH_FTS_DDL:
+    event.listen(SearchEntry.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+del _statement
+event.listen(
+    SearchEntry.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS search_index_fts").execute_if(dialect="sqlite"),
+)
@@ -7,7 +7,10 @@ from .deleted import deleted_bp
 from .device_types import device_types_bp
 from .devices import devices_bp
 from .employees import employees_bp
+from .imports import imports_bp
 from .locations import locations_bp
+from .profiles import profiles_bp
+from .search import search_bp
 from .users import users_bp
 from .warehouses import warehouses_bp
 
@@ -20,7 +23,10 @@ def register_blueprints(app: Flask) -> None:
     app.register_blueprint(device_types_bp, url_prefix="/device-types")
     app.register_blueprint(devices_bp, url_prefix="/devices")
     app.register_blueprint(employees_bp, url_prefix="/employees")
+    app.register_blueprint(imports_bp, url_prefix="/imports")
     app.register_blueprint(locations_bp, url_prefix="/locations")
+    app.register_blueprint(profiles_bp, url_prefix="/profiles")
+    app.register_blueprint(search_bp, url_prefix="/search")
     app.register_blueprint(users_bp, url_prefix="/users")
     app.register_blueprint(warehouses_bp, url_prefix="/warehouses")
 
@@ -1,18 +1,59 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, abort, render_template, request
 
-from ..services.audit import get_audit_logs
+from ..models import AuditAction, User
+from ..services.audit_archive import MONTH_RE, archived_page, list_archived_months
+from ..services.audit_list import AuditListParams, list_audit_page
+from ..services.export import FORMATS, audit_export, export_response
 from ..utils import super_admin_required
 
 audit_bp = Blueprint("audit", __name__, template_folder="../templates")
 
+ARCHIVE_PAGE_SIZE = 200
+
 
 @audit_bp.route("/")
 @super_admin_required
 def list_logs():
-    logs = get_audit_logs(limit=200)
-    return render_template("audit/list.html", logs=logs)
-
-
-
-
-
+    params = AuditListParams.from_args(request.args)
+    page = list_audit_page(params)
+    return render_template(
+        "audit/list.html",
+        logs=page.items,
+        page=page,
+        params=params,
+        actions=list(AuditAction),
+        users=User.query.order_by(User.full_name).all(),
+        archived_months=list_archived_months(),
+    )
+
+
+@audit_bp.route("/archive/<month>")
+@super_admin_required
+def archive(month: str):
+    """Записи месяца из холодного архива (файл читается по запросу)."""
+    if not MONTH_RE.match(month) or month not in list_archived_months():
+        abort(404)
+    page = max(request.args.get("page", 1, type=int), 1)
+    entity_type = request.args.get("entity_type") or None
+    entity_id = request.args.get("entity_id", type=int)
+    records, has_next = archived_page(
+        month, page, ARCHIVE_PAGE_SIZE, entity_type=entity_type, entity_id=entity_id
+    )
+    return render_template(
+        "audit/archive.html",
+        month=month,
+        records=records,
+        page=page,
+        has_next=has_next,
+        entity_type=entity_type,
+        entity_id=entity_id,
+    )
+
+
+@audit_bp.route("/export.<fmt>")
+@super_admin_required
+def export_logs(fmt: str):
+    """Выгрузка audit log (CSV или Excel) с фильтрами страницы истории."""
+    if fmt not in FORMATS:
+        abort(404)
+    return export_response(audit_export(AuditListParams.from_args(request.args)), fmt)
@@ -5,8 +5,8 @@ from flask_login import current_user, login_required
 from sqlalchemy.exc import IntegrityError
 
 from ..extensions import db
-from ..models import AuditAction, Device, DeviceType
-from ..services.audit import log_action
+from ..models import Device, DeviceType
+from ..services.counters import get_counts
 from ..utils import admin_required, can_delete_required
 
 device_types_bp = Blueprint("device_types", __name__, template_folder="../templates")
@@ -17,11 +17,8 @@ logger = logging.getLogger(__name__)
 @login_required
 def list_device_types():
     device_types = DeviceType.query.filter(DeviceType.deleted_at.is_(None)).order_by(DeviceType.name).all()
-    # Подсчитываем количество девайсов для каждого типа
-    types_with_counts = []
-    for device_type in device_types:
-        device_count = Device.query.filter_by(type_id=device_type.id).filter(Device.deleted_at.is_(None)).count()
-        types_with_counts.append((device_type, device_count))
+    device_counts = get_counts("type")
+    types_with_counts = [(t, device_counts.get(t.id, 0)) for t in device_types]
     return render_template("device_types/list.html", types_with_counts=types_with_counts)
 
 
@@ -39,13 +36,6 @@ def create_device_type():
         db.session.add(device_type)
         try:
             db.session.commit()
-            log_action(
-                AuditAction.CREATE,
-                "device_type",
-                entity_id=device_type.id,
-                entity_name=device_type.name,
-                changes={"name": name},
-            )
             flash("Тип девайса добавлен", "success")
             logger.info("Создан тип девайса %s (%s)", device_type.name, device_type.id)
             return redirect(url_for("device_types.list_device_types"))
@@ -61,7 +51,6 @@ def create_device_type():
 def edit_device_type(device_type_id: int):
     device_type = DeviceType.query.get_or_404(device_type_id)
     if request.method == "POST":
-        old_name = device_type.name
         name = request.form["name"].strip()
         
         if not name:
@@ -71,17 +60,6 @@ def edit_device_type(device_type_id: int):
         device_type.name = name
         try:
             db.session.commit()
-            changes = {}
-            if old_name != name:
-                changes = {"name": {"old": old_name, "new": name}}
-            if changes:
-                log_action(
-                    AuditAction.UPDATE,
-                    "device_type",
-                    entity_id=device_type.id,
-                    entity_name=device_type.name,
-                    changes=changes,
-                )
             flash("Тип девайса обновлен", "success")
             logger.info("Обновлён тип девайса %s (%s)", device_type.name, device_type_id)
             return redirect(url_for("device_types.list_device_types"))
@@ -1,45 +1,132 @@
-import json
 import logging
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, abort, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 from sqlalchemy.exc import IntegrityError
 
 from ..extensions import db
-from ..models import AuditAction, Device, DeviceHistory, DeviceStatus, DeviceType, Employee, Location, Warehouse
+from ..models import AuditAction, Device, DeviceHistory, DeviceStatus, Employee, Warehouse
 from ..services import InventoryService
-from ..services.audit import log_action
+from ..services.audit_capture import annotate_audit
+from ..services.device_bulk import ACTIONS as BULK_ACTIONS, MAX_BULK_DEVICES, bulk_update_devices
+from ..services.device_list import DeviceListParams, filtered_devices_query, list_devices_page
+from ..services.device_timeline import device_timeline_page
+from ..services.export import FORMATS, devices_export, export_response
+from ..services.reference_data import get_device_types, get_locations, get_warehouses
 from ..utils import admin_required, can_delete_required
+from .imports import start_import_job
 
 devices_bp = Blueprint("devices", __name__, template_folder="../templates")
 logger = logging.getLogger(__name__)
 
+SORT_LABELS = {
+    "newest": "Сначала новые",
+    "oldest": "Сначала старые",
+    "inventory": "По инвентарному номеру",
+    "model": "По модели",
+}
+
+
+def _transfer_names(old_warehouse, old_owner, old_location, device: Device) -> dict:
+    """Имена склада, сотрудника и локации до и после перемещения для записи аудита."""
+    pairs = {
+        "warehouse": (old_warehouse, device.warehouse, lambda w: w.name),
+        "owner": (old_owner, device.owner, lambda e: e.full_name),
+        "location": (old_location, device.location, lambda loc: loc.name),
+    }
+    return {
+        key: {"old": name(old) if old else None, "new": name(new) if new else None}
+        for key, (old, new, name) in pairs.items()
+        if old is not new
+    }
+
 
 @devices_bp.get("/")
 @login_required
 def list_devices():
-    from sqlalchemy.orm import joinedload
-    devices = (
-        Device.query.filter(Device.deleted_at.is_(None))
-        .options(
-            joinedload(Device.type),
-            joinedload(Device.location),
-            joinedload(Device.owner),
-            joinedload(Device.warehouse)
-        )
-        .order_by(Device.created_at.desc())
-        .all()
+    params = DeviceListParams.from_args(request.args)
+    page = list_devices_page(params)
+    return render_template(
+        "devices/list.html",
+        devices=page.items,
+        page=page,
+        params=params,
+        sort_options=SORT_LABELS,
+        statuses=list(DeviceStatus),
+        types=get_device_types(),
+        locations=get_locations(),
+        warehouses=get_warehouses(),
+        owner=db.session.get(Employee, params.owner_id) if params.owner_id else None,
+        bulk_actions=BULK_ACTIONS if current_user.is_admin else None,
     )
-    return render_template("devices/list.html", devices=devices)
+
+
+@devices_bp.get("/export.<fmt>")
+@login_required
+def export_devices(fmt: str):
+    """Выгрузка девайсов с фильтрами списка (CSV или Excel)."""
+    if fmt not in FORMATS:
+        abort(404)
+    return export_response(devices_export(DeviceListParams.from_args(request.args)), fmt)
+
+
+def _optional_int(value) -> int | None:
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("Некорректный идентификатор") from None
+
+
+@devices_bp.post("/bulk")
+@admin_required
+def bulk_devices():
+    """
+    Массовая операция над девайсами: форма списка или JSON API.
+
+    JSON: {"action", "device_ids", "employee_id" | "warehouse_id"} -> BulkResult.as_dict().
+    Форма передаёт отмеченные девайсы или scope=filter — все девайсы по фильтрам
+    списка из query string.
+    """
+    params = DeviceListParams.from_args(request.args)
+    data = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    try:
+        if request.is_json:
+            raw_ids = data.get("device_ids") or []
+        elif data.get("scope") == "filter":
+            query = filtered_devices_query(params).with_entities(Device.id).limit(MAX_BULK_DEVICES + 1)
+            raw_ids = [device_id for (device_id,) in query]
+        else:
+            raw_ids = data.getlist("device_ids")
+        if not isinstance(raw_ids, list):
+            raise ValueError("device_ids должен быть списком")
+        result = bulk_update_devices(
+            data.get("action") or "",
+            [_optional_int(device_id) for device_id in raw_ids if device_id not in (None, "")],
+            employee_id=_optional_int(data.get("employee_id")),
+            warehouse_id=_optional_int(data.get("warehouse_id")),
+        )
+    except ValueError as e:
+        db.session.rollback()
+        logger.warning("Массовая операция отклонена: %s", str(e))
+        if request.is_json:
+            return jsonify(error=str(e)), 400
+        flash(str(e), "danger")
+    else:
+        if request.is_json:
+            return jsonify(result.as_dict())
+        label = BULK_ACTIONS[result.action].label
+        flash(f"{label}: изменено девайсов — {result.updated}, пропущено — {result.skipped}", "success")
+    return redirect(url_for("devices.list_devices", **params.to_args()))
 
 
 @devices_bp.route("/create", methods=["GET", "POST"])
 @admin_required
 def create_device():
-    types = DeviceType.query.filter(DeviceType.deleted_at.is_(None)).order_by(DeviceType.name).all()
-    locations = Location.query.filter(Location.deleted_at.is_(None)).order_by(Location.name).all()
-    warehouses = Warehouse.query.filter(Warehouse.deleted_at.is_(None)).order_by(Warehouse.name).all()
-    employees = Employee.query.filter(Employee.deleted_at.is_(None)).order_by(Employee.last_name, Employee.first_name, Employee.middle_name).all()
+    types = get_device_types()
+    locations = get_locations()
+    warehouses = get_warehouses()
     if request.method == "POST":
         try:
             # При создании нужно выбрать склад или сотрудника для установки локации
@@ -54,7 +141,6 @@ def create_device():
                     "devices/form.html",
                     types=types,
                     warehouses=warehouses,
-                    employees=employees,
                     device=None,
                 )
             
@@ -70,10 +156,10 @@ def create_device():
                     "devices/form.html",
                     types=types,
                     warehouses=warehouses,
-                    employees=employees,
                     device=None,
                 )
             
+            # Склад или сотрудник задаются сразу, чтобы создание было одной записью аудита
             device = InventoryService.create_device(
                 request.form["inventory_number"],
                 request.form["model"],
@@ -81,23 +167,9 @@ def create_device():
                 location_id=location_id,
                 serial_number=request.form.get("serial_number"),
                 notes=request.form.get("notes"),
-            )
-            
-            # Устанавливаем склад или сотрудника
-            if warehouse_id:
-                device.warehouse_id = int(warehouse_id)
-                device.status = DeviceStatus.IN_STOCK
-            elif owner_id:
-                device.owner_id = int(owner_id)
-                device.status = DeviceStatus.ASSIGNED
-            db.session.commit()
-            
-            log_action(
-                AuditAction.CREATE,
-                "device",
-                entity_id=device.id,
-                entity_name=device.inventory_number,
-                changes={"model": device.model, "type_id": device.type_id},
+                warehouse_id=int(warehouse_id) if warehouse_id else None,
+                owner_id=int(owner_id) if owner_id else None,
+                status=DeviceStatus.IN_STOCK if warehouse_id else DeviceStatus.ASSIGNED,
             )
             flash("Девайс добавлен", "success")
             logger.info("Создан девайс %s (%s)", device.inventory_number, device.id)
@@ -115,7 +187,6 @@ def create_device():
         types=types,
         locations=locations,
         warehouses=warehouses,
-        employees=employees,
         device=None,
     )
 
@@ -133,20 +204,11 @@ def edit_device(device_id: int):
         db.session.commit()
         logger.warning("Исправлено некорректное состояние девайса %s: убран склад, оставлен сотрудник", device_id)
     
-    types = DeviceType.query.filter(DeviceType.deleted_at.is_(None)).order_by(DeviceType.name).all()
-    locations = Location.query.filter(Location.deleted_at.is_(None)).order_by(Location.name).all()
-    warehouses = Warehouse.query.filter(Warehouse.deleted_at.is_(None)).order_by(Warehouse.name).all()
-    employees = Employee.query.filter(Employee.deleted_at.is_(None)).order_by(Employee.last_name, Employee.first_name, Employee.middle_name).all()
+    types = get_device_types()
+    locations = get_locations()
+    warehouses = get_warehouses()
     
     if request.method == "POST":
-        old_data = {
-            "inventory_number": device.inventory_number,
-            "model": device.model,
-            "type_id": device.type_id,
-            "location_id": device.location_id,
-            "warehouse_id": device.warehouse_id,
-            "owner_id": device.owner_id,
-        }
         try:
             # Обновляем основные поля (локация не изменяется вручную)
             InventoryService.update_device(
@@ -161,7 +223,6 @@ def edit_device(device_id: int):
             # Обрабатываем перемещение - девайс всегда должен быть привязан к складу или сотруднику
             warehouse_id = request.form.get("warehouse_id")
             owner_id = request.form.get("owner_id")
-            transfer_changes = {}
             
             # Проверка: нельзя выбрать и склад, и сотрудника одновременно
             if warehouse_id and owner_id:
@@ -172,7 +233,6 @@ def edit_device(device_id: int):
                     types=types,
                     locations=locations,
                     warehouses=warehouses,
-                    employees=employees,
                 )
             
             # Если ничего не выбрано, проверяем, есть ли уже привязка
@@ -186,8 +246,7 @@ def edit_device(device_id: int):
                         types=types,
                         locations=locations,
                         warehouses=warehouses,
-                        employees=employees,
-                    )
+                        )
                 # Если у девайса уже есть привязка - ничего не меняем
                 pass
             # Перемещение на склад
@@ -200,30 +259,14 @@ def edit_device(device_id: int):
                 device.owner = None
                 device.location = warehouse.location  # Локация автоматически из склада
                 device.status = DeviceStatus.IN_STOCK
-                transfer_changes["warehouse"] = {
-                    "old": old_warehouse.name if old_warehouse else None,
-                    "new": warehouse.name,
-                }
-                transfer_changes["location"] = {
-                    "old": old_location.name if old_location else None,
-                    "new": warehouse.location.name,
-                }
-                if old_owner:
-                    transfer_changes["owner"] = {
-                        "old": old_owner.full_name,
-                        "new": None,
-                    }
-                log_action(
+                annotate_audit(
+                    device,
                     AuditAction.TRANSFER,
-                    "device",
-                    entity_id=device.id,
-                    entity_name=device.inventory_number,
-                    changes={
-                        **transfer_changes,
-                        "action": "Перемещен на склад",
-                        "warehouse_name": warehouse.name,
-                    },
+                    action="Перемещен на склад",
+                    warehouse_name=warehouse.name,
+                    **_transfer_names(old_warehouse, old_owner, old_location, device),
                 )
+                db.session.commit()
                 flash(f"Девайс перемещен на склад: {warehouse.name} (локация: {warehouse.location.name})", "success")
             
             # Перемещение сотруднику
@@ -236,47 +279,16 @@ def edit_device(device_id: int):
                 device.warehouse = None
                 device.location = employee.location  # Локация автоматически из сотрудника
                 device.status = DeviceStatus.ASSIGNED
-                transfer_changes["owner"] = {
-                    "old": old_owner.full_name if old_owner else None,
-                    "new": employee.full_name,
-                }
-                transfer_changes["location"] = {
-                    "old": old_location.name if old_location else None,
-                    "new": employee.location.name,
-                }
-                if old_warehouse:
-                    transfer_changes["warehouse"] = {
-                        "old": old_warehouse.name,
-                        "new": None,
-                    }
-                log_action(
+                annotate_audit(
+                    device,
                     AuditAction.ASSIGN,
-                    "device",
-                    entity_id=device.id,
-                    entity_name=device.inventory_number,
-                    changes={
-                        **transfer_changes,
-                        "action": "Выдан сотруднику",
-                        "employee_name": employee.full_name,
-                    },
+                    action="Выдан сотруднику",
+                    employee_name=employee.full_name,
+                    **_transfer_names(old_warehouse, old_owner, old_location, device),
                 )
+                db.session.commit()
                 flash(f"Девайс выдан сотруднику: {employee.full_name} (локация: {employee.location.name})", "success")
             
-            # Логируем обновление основных полей
-            changes = {
-                k: {"old": old_data.get(k), "new": getattr(device, k)}
-                for k in old_data
-                if old_data.get(k) != getattr(device, k) and k not in ("warehouse_id", "owner_id")
-            }
-            if changes:
-                log_action(
-                    AuditAction.UPDATE,
-                    "device",
-                    entity_id=device.id,
-                    entity_name=device.inventory_number,
-                    changes=changes,
-                )
-            
             if not warehouse_id and not owner_id:
                 flash("Девайс обновлен", "success")
             
@@ -297,7 +309,6 @@ def edit_device(device_id: int):
         types=types,
         locations=locations,
         warehouses=warehouses,
-        employees=employees,
     )
 
 
@@ -317,251 +328,29 @@ def delete_device(device_id: int):
 @devices_bp.get("/<int:device_id>/history")
 @login_required
 def device_history(device_id: int):
-    from ..models import AuditLog
+    """Лента событий девайса; с format=json — следующая страница для «Показать ещё»."""
     device = Device.query.get_or_404(device_id)
-    # Получаем все записи из AuditLog для этого девайса
-    audit_logs_raw = (
-        AuditLog.query.filter_by(entity_type="device", entity_id=device_id)
-        .order_by(AuditLog.created_at.desc())
-        .all()
-    )
-    # Парсим JSON изменения для каждого лога
-    audit_logs = []
-    for log in audit_logs_raw:
-        parsed_changes = None
-        if log.changes:
-            try:
-                parsed_changes = json.loads(log.changes)
-            except (json.JSONDecodeError, TypeError):
-                parsed_changes = log.changes
-        audit_logs.append({
-            'log': log,
-            'changes': parsed_changes,
-        })
+    page = device_timeline_page(device_id, request.args.get("cursor"))
+    if request.args.get("format") == "json":
+        return jsonify(
+            html=render_template("devices/_timeline_rows.html", entries=page.items),
+            next_cursor=page.next_cursor,
+        )
     return render_template(
         "devices/history.html",
         device=device,
-        audit_logs=audit_logs,
+        entries=page.items,
+        page=page,
     )
 
 
 @devices_bp.route("/import", methods=["GET", "POST"])
 @admin_required
 def import_devices():
-    """Импорт девайсов из Excel файла."""
-    if request.method == "GET":
-        types = DeviceType.query.filter(DeviceType.deleted_at.is_(None)).order_by(DeviceType.name).all()
-        warehouses = Warehouse.query.filter(Warehouse.deleted_at.is_(None)).order_by(Warehouse.name).all()
-        employees = Employee.query.filter(Employee.deleted_at.is_(None)).order_by(Employee.last_name, Employee.first_name, Employee.middle_name).all()
-        return render_template("devices/import.html", types=types, warehouses=warehouses, employees=employees)
-    
-    if "file" not in request.files:
-        flash("Файл не выбран", "danger")
-        types = DeviceType.query.filter(DeviceType.deleted_at.is_(None)).order_by(DeviceType.name).all()
-        warehouses = Warehouse.query.filter(Warehouse.deleted_at.is_(None)).order_by(Warehouse.name).all()
-        employees = Employee.query.filter(Employee.deleted_at.is_(None)).order_by(Employee.last_name, Employee.first_name, Employee.middle_name).all()
-        return render_template("devices/import.html", types=types, warehouses=warehouses, employees=employees)
-    
-    file = request.files["file"]
-    if file.filename == "":
-        flash("Файл не выбран", "danger")
-        types = DeviceType.query.filter(DeviceType.deleted_at.is_(None)).order_by(DeviceType.name).all()
-        warehouses = Warehouse.query.filter(Warehouse.deleted_at.is_(None)).order_by(Warehouse.name).all()
-        employees = Employee.query.filter(Employee.deleted_at.is_(None)).order_by(Employee.last_name, Employee.first_name, Employee.middle_name).all()
-        return render_template("devices/import.html", types=types, warehouses=warehouses, employees=employees)
-    
-    if not file.filename.endswith((".xlsx", ".xls")):
-        flash("Поддерживаются только файлы Excel (.xlsx, .xls)", "danger")
-        types = DeviceType.query.filter(DeviceType.deleted_at.is_(None)).order_by(DeviceType.name).all()
-        warehouses = Warehouse.query.filter(Warehouse.deleted_at.is_(None)).order_by(Warehouse.name).all()
-        employees = Employee.query.filter(Employee.deleted_at.is_(None)).order_by(Employee.last_name, Employee.first_name, Employee.middle_name).all()
-        return render_template("devices/import.html", types=types, warehouses=warehouses, employees=employees)
-    
-    try:
-        import openpyxl
-        from io import BytesIO
-        
-        # Читаем файл в память
-        file_content = file.read()
-        wb = openpyxl.load_workbook(BytesIO(file_content))
-        ws = wb.active
-        
-        # Пропускаем заголовок (первая строка)
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
-        
-        if not rows:
-            flash("Файл пуст или содержит только заголовки", "warning")
-            types = DeviceType.query.filter(DeviceType.deleted_at.is_(None)).order_by(DeviceType.name).all()
-            warehouses = Warehouse.query.filter(Warehouse.deleted_at.is_(None)).order_by(Warehouse.name).all()
-            employees = Employee.query.filter(Employee.deleted_at.is_(None)).order_by(Employee.last_name, Employee.first_name, Employee.middle_name).all()
-            return render_template("devices/import.html", types=types, warehouses=warehouses, employees=employees)
-        
-        imported = 0
-        skipped = 0
-        errors = []
-        
-        for row_num, row in enumerate(rows, start=2):
-            # Пропускаем пустые строки
-            if not any(row):
-                continue
-            
-            try:
-                # Парсим данные из строки
-                # Ожидаемые колонки: Инвентарный номер, Модель, Тип, Серийный номер, Склад/Сотрудник, Локация, Примечания
-                inventory_number = str(row[0]).strip() if row[0] else None
-                model = str(row[1]).strip() if row[1] else None
-                type_name = str(row[2]).strip() if row[2] else None
-                serial_number = str(row[3]).strip() if row[3] else None
-                owner_or_warehouse = str(row[4]).strip() if row[4] else None
-                location_name = str(row[5]).strip() if row[5] else None
-                notes = str(row[6]).strip() if row[6] else None
-                
-                # Валидация обязательных полей
-                if not inventory_number:
-                    errors.append(f"Строка {row_num}: отсутствует инвентарный номер")
-                    skipped += 1
-                    continue
-                
-                if not model:
-                    errors.append(f"Строка {row_num}: отсутствует модель")
-                    skipped += 1
-                    continue
-                
-                if not type_name:
-                    errors.append(f"Строка {row_num}: отсутствует тип девайса")
-                    skipped += 1
-                    continue
-                
-                # Проверка дубликата инвентарного номера
-                if Device.query.filter_by(inventory_number=inventory_number).filter(Device.deleted_at.is_(None)).first():
-                    errors.append(f"Строка {row_num}: девайс с инвентарным номером {inventory_number} уже существует")
-                    skipped += 1
-                    continue
-                
-                # Находим тип девайса
-                device_type = DeviceType.query.filter(DeviceType.name.ilike(type_name)).filter(DeviceType.deleted_at.is_(None)).first()
-                if not device_type:
-                    errors.append(f"Строка {row_num}: тип девайса '{type_name}' не найден")
-                    skipped += 1
-                    continue
-                
-                # Определяем локацию и владельца/склад
-                location_id = None
-                warehouse_id = None
-                owner_id = None
-                status = DeviceStatus.IN_STOCK
-                
-                if location_name:
-                    location = Location.query.filter(Location.name.ilike(location_name)).filter(Location.deleted_at.is_(None)).first()
-                    if location:
-                        location_id = location.id
-                    else:
-                        errors.append(f"Строка {row_num}: локация '{location_name}' не найдена")
-                        skipped += 1
-                        continue
-                
-                if owner_or_warehouse:
-                    # Пробуем найти сотрудника по ФИО
-                    name_parts = owner_or_warehouse.strip().split()
-                    if len(name_parts) >= 2:
-                        last_name = name_parts[0]
-                        first_name = name_parts[1]
-                        middle_name = name_parts[2] if len(name_parts) > 2 else None
-                        
-                        employee = Employee.query.filter(
-                            Employee.last_name.ilike(last_name),
-                            Employee.first_name.ilike(first_name)
-                        ).filter(Employee.deleted_at.is_(None)).first()
-                        
-                        if employee:
-                            owner_id = employee.id
-                            location_id = employee.location_id
-                            status = DeviceStatus.ASSIGNED
-                        else:
-                            # Пробуем найти склад
-                            warehouse = Warehouse.query.filter(Warehouse.name.ilike(owner_or_warehouse)).filter(Warehouse.deleted_at.is_(None)).first()
-                            if warehouse:
-                                warehouse_id = warehouse.id
-                                location_id = warehouse.location_id
-                                status = DeviceStatus.IN_STOCK
-                            else:
-                                errors.append(f"Строка {row_num}: не найден сотрудник или склад '{owner_or_warehouse}'")
-                                skipped += 1
-                                continue
-                    else:
-                        # Пробуем найти склад
-                        warehouse = Warehouse.query.filter(Warehouse.name.ilike(owner_or_warehouse)).filter(Warehouse.deleted_at.is_(None)).first()
-                        if warehouse:
-                            warehouse_id = warehouse.id
-                            location_id = warehouse.location_id
-                            status = DeviceStatus.IN_STOCK
-                        else:
-                            errors.append(f"Строка {row_num}: не найден склад '{owner_or_warehouse}'")
-                            skipped += 1
-                            continue
-                
-                if not location_id:
-                    errors.append(f"Строка {row_num}: не удалось определить локацию")
-                    skipped += 1
-                    continue
-                
-                # Создаем девайс
-                device = Device(
-                    inventory_number=inventory_number,
-                    model=model,
-                    type_id=device_type.id,
-                    serial_number=serial_number if serial_number else None,
-                    warehouse_id=warehouse_id,
-                    owner_id=owner_id,
-                    location_id=location_id,
-                    status=status,
-                    notes=notes,
-                )
-                
-                db.session.add(device)
-                db.session.flush()
-                
-                log_action(
-                    AuditAction.CREATE,
-                    "device",
-                    entity_id=device.id,
-                    entity_name=device.inventory_number,
-                    changes={"model": model, "type_id": device_type.id, "imported": True},
-                )
-                
-                imported += 1
-                
-            except Exception as e:
-                errors.append(f"Строка {row_num}: ошибка обработки - {str(e)}")
-                skipped += 1
-                logger.exception("Ошибка импорта девайса из строки %s", row_num)
-                continue
-        
-        # Коммитим все изменения
-        db.session.commit()
-        
-        # Формируем сообщение
-        if imported > 0:
-            flash(f"Импортировано девайсов: {imported}", "success")
-        if skipped > 0:
-            flash(f"Пропущено строк: {skipped}", "warning")
-        if errors:
-            # Сохраняем ошибки в сессию для отображения
-            flash(f"Ошибки при импорте ({len(errors)}):", "danger")
-            for error in errors[:10]:  # Показываем первые 10 ошибок
-                flash(error, "danger")
-            if len(errors) > 10:
-                flash(f"... и еще {len(errors) - 10} ошибок", "danger")
-        
-        logger.info("Импорт девайсов: добавлено %s, пропущено %s", imported, skipped)
-        return redirect(url_for("devices.list_devices"))
-        
-    except Exception as e:
-        db.session.rollback()
-        flash(f"Ошибка при чтении файла: {str(e)}", "danger")
-        logger.exception("Ошибка импорта девайсов из Excel")
-        types = DeviceType.query.filter(DeviceType.deleted_at.is_(None)).order_by(DeviceType.name).all()
-        warehouses = Warehouse.query.filter(Warehouse.deleted_at.is_(None)).order_by(Warehouse.name).all()
-        employees = Employee.query.filter(Employee.deleted_at.is_(None)).order_by(Employee.last_name, Employee.first_name, Employee.middle_name).all()
-        return render_template("devices/import.html", types=types, warehouses=warehouses, employees=employees)
+    """Импорт девайсов из Excel файла (фоновая задача, см. imports.job_detail)."""
+    if request.method == "POST":
+        response = start_import_job("devices")
+        if response is not None:
+            return response
+    return render_template("devices/import.html")
 
@@ -0,0 +1,99 @@
+import logging
+
+from flask import (
+    Blueprint,
+    Response,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    stream_with_context,
+    url_for,
+)
+from flask_login import current_user
+
+from ..extensions import db
+from ..models import ImportJob
+from ..services.excel import write_xlsx
+from ..services.export import XLSX_MIMETYPE, iter_csv
+from ..services.import_jobs import (
+    JobProgress,
+    create_import_job,
+    enqueue_import_job,
+    iter_job_errors,
+)
+from ..utils import admin_required
+
+imports_bp = Blueprint("imports", __name__, template_folder="../templates")
+logger = logging.getLogger(__name__)
+
+ERROR_REPORT_HEADER = ["Строка", "Ошибка"]
+
+
+def start_import_job(kind: str):
+    """
+    Проверяет загруженный файл и ставит задачу импорта в очередь.
+
+    Returns:
+        redirect на страницу задачи или None, если файл не прошёл проверку
+        (сообщение уже показано через flash)
+    """
+    file = request.files.get("file")
+    if file is None or file.filename == "":
+        flash("Файл не выбран", "danger")
+        return None
+
+    if not file.filename.endswith((".xlsx", ".xls")):
+        flash("Поддерживаются только файлы Excel (.xlsx, .xls)", "danger")
+        return None
+
+    job = create_import_job(
+        kind,
+        file.filename,
+        file.read(),
+        user_id=current_user.id,
+        ip_address=request.remote_addr,
+        user_agent=request.headers.get("User-Agent"),
+    )
+    enqueue_import_job(job.id)
+    return redirect(url_for("imports.job_detail", job_id=job.id))
+
+
+@imports_bp.get("/<int:job_id>")
+@admin_required
+def job_detail(job_id: int):
+    job = db.get_or_404(ImportJob, job_id)
+    return render_template("imports/job.html", job=job, progress=JobProgress(job).as_dict())
+
+
+@imports_bp.get("/<int:job_id>/progress")
+@admin_required
+def job_progress(job_id: int):
+    job = db.get_or_404(ImportJob, job_id)
+    return jsonify(JobProgress(job).as_dict())
+
+
+@imports_bp.get("/<int:job_id>/errors.csv")
+@admin_required
+def job_errors_csv(job_id: int):
+    job = db.get_or_404(ImportJob, job_id)
+    return Response(
+        stream_with_context(iter_csv(ERROR_REPORT_HEADER, iter_job_errors(job))),
+        mimetype="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename=import_{job.id}_errors.csv"},
+    )
+
+
+@imports_bp.get("/<int:job_id>/errors.xlsx")
+@admin_required
+def job_errors_xlsx(job_id: int):
+    job = db.get_or_404(ImportJob, job_id)
+    report = write_xlsx(ERROR_REPORT_HEADER, iter_job_errors(job), title="Ошибки")
+    return send_file(
+        report,
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=f"import_{job.id}_errors.xlsx",
+    )
@@ -5,8 +5,7 @@ from flask_login import current_user, login_required
 from sqlalchemy.exc import IntegrityError
 
 from ..extensions import db
-from ..models import AuditAction, Location
-from ..services.audit import log_action
+from ..models import Location
 from ..utils import admin_required, can_delete_required
 
 locations_bp = Blueprint("locations", __name__, template_folder="../templates")
@@ -28,12 +27,6 @@ def create_location():
         db.session.add(location)
         try:
             db.session.commit()
-            log_action(
-                AuditAction.CREATE,
-                "location",
-                entity_id=location.id,
-                entity_name=location.name,
-            )
             flash("Локация добавлена", "success")
             logger.info("Создана локация %s (%s)", location.name, location.id)
             return redirect(url_for("locations.list_locations"))
@@ -53,13 +46,6 @@ def edit_location(location_id: int):
         location.name = request.form["name"]
         try:
             db.session.commit()
-            log_action(
-                AuditAction.UPDATE,
-                "location",
-                entity_id=location.id,
-                entity_name=location.name,
-                changes={"name": {"old": old_name, "new": location.name}},
-            )
             flash("Локация переименована", "success")
             logger.info("Переименована локация %s -> %s", old_name, location.name)
             return redirect(url_for("locations.list_locations"))
@@ -0,0 +1,44 @@
+from flask import Blueprint, abort, current_app, render_template, request, send_file
+
+from ..services.profiler import SORT_KEYS, profile_dir, profile_path, profiles_by_endpoint, render_profile
+from ..utils import super_admin_required
+
+profiles_bp = Blueprint("profiles", __name__, template_folder="../templates")
+
+PROFILES_PER_ENDPOINT = 10
+
+
+@profiles_bp.route("/")
+@super_admin_required
+def list_profiles():
+    """Последние профили запросов по endpoint (services/profiler.py)."""
+    return render_template(
+        "profiles/list.html",
+        groups=profiles_by_endpoint(profile_dir(), PROFILES_PER_ENDPOINT),
+        enabled=current_app.config.get("PROFILER_ENABLED", False),
+    )
+
+
+@profiles_bp.route("/<name>")
+@super_admin_required
+def view_profile(name: str):
+    path = profile_path(profile_dir(), name)
+    if path is None:
+        abort(404)
+    sort = request.args.get("sort", "cumulative")
+    return render_template(
+        "profiles/detail.html",
+        name=name,
+        sort=sort,
+        sort_keys=SORT_KEYS,
+        report=render_profile(path, sort),
+    )
+
+
+@profiles_bp.route("/<name>/download")
+@super_admin_required
+def download_profile(name: str):
+    path = profile_path(profile_dir(), name)
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=name, mimetype="application/octet-stream")
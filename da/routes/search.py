@@ -0,0 +1,53 @@
+import logging
+
+from flask import Blueprint, jsonify, render_template, request, url_for
+from flask_login import login_required
+
+from ..services.search import DEFAULT_LIMIT, SPECS, search
+
+search_bp = Blueprint("search", __name__, template_folder="../templates")
+logger = logging.getLogger(__name__)
+
+# Тип сущности -> (подпись, endpoint страницы, имя параметра id)
+ENTITY_LINKS = {
+    "device": ("Девайс", "devices.device_history", "device_id"),
+    "employee": ("Сотрудник", "employees.employee_devices", "employee_id"),
+    "warehouse": ("Склад", "warehouses.warehouse_devices", "warehouse_id"),
+}
+
+
+def _hit_dict(hit) -> dict:
+    label, endpoint, param = ENTITY_LINKS[hit.entity_type]
+    return {
+        "type": hit.entity_type,
+        "type_label": label,
+        "id": hit.entity_id,
+        "title": hit.title,
+        "subtitle": hit.subtitle,
+        "url": url_for(endpoint, **{param: hit.entity_id}),
+    }
+
+
+@search_bp.get("/")
+@login_required
+def index():
+    """Глобальный поиск по девайсам, сотрудникам и складам (HTML или JSON)."""
+    query = request.args.get("q", "").strip()
+    entity_type = request.args.get("type") or None
+    if entity_type not in SPECS:
+        entity_type = None
+    hits = search(
+        query,
+        entity_types=[entity_type] if entity_type else None,
+        limit=request.args.get("limit", DEFAULT_LIMIT, type=int),
+    )
+    results = [_hit_dict(hit) for hit in hits]
+    if request.args.get("format") == "json":
+        return jsonify(results=results)
+    return render_template(
+        "search/results.html",
+        query=query,
+        entity_type=entity_type,
+        entity_labels={key: label for key, (label, _, _) in ENTITY_LINKS.items()},
+        results=results,
+    )
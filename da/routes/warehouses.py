@@ -1,12 +1,13 @@
 import logging
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, abort, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 from sqlalchemy.exc import IntegrityError
 
 from ..extensions import db
-from ..models import AuditAction, Location, Warehouse
-from ..services.audit import log_action
+from ..models import Location, Warehouse
+from ..services.counters import get_counts
+from ..services.export import FORMATS, export_response, warehouses_export
 from ..utils import admin_required, can_delete_required
 from ..utils import get_or_create_location
 
@@ -17,23 +18,28 @@ logger = logging.getLogger(__name__)
 @warehouses_bp.get("/")
 @login_required
 def list_warehouses():
-    from sqlalchemy import func
-    from ..models import Device
-    
-    warehouses_query = (
-        db.session.query(
-            Warehouse,
-            func.count(Device.id).label('device_count')
-        )
-        .filter(Warehouse.deleted_at.is_(None))
-        .outerjoin(Device, (Device.warehouse_id == Warehouse.id) & (Device.deleted_at.is_(None)))
-        .group_by(Warehouse.id)
+    from sqlalchemy.orm import joinedload
+
+    device_counts = get_counts("warehouse")
+    warehouses = (
+        Warehouse.query.filter(Warehouse.deleted_at.is_(None))
+        .options(joinedload(Warehouse.location))
         .order_by(Warehouse.name)
+        .all()
     )
-    warehouses_with_counts = warehouses_query.all()
+    warehouses_with_counts = [(w, device_counts.get(w.id, 0)) for w in warehouses]
     return render_template("warehouses/list.html", warehouses_with_counts=warehouses_with_counts)
 
 
+@warehouses_bp.get("/export.<fmt>")
+@login_required
+def export_warehouses(fmt: str):
+    """Выгрузка складов (CSV или Excel)."""
+    if fmt not in FORMATS:
+        abort(404)
+    return export_response(warehouses_export(), fmt)
+
+
 @warehouses_bp.route("/create", methods=["GET", "POST"])
 @admin_required
 def create_warehouse():
@@ -59,13 +65,6 @@ def create_warehouse():
         db.session.add(warehouse)
         try:
             db.session.commit()
-            log_action(
-                AuditAction.CREATE,
-                "warehouse",
-                entity_id=warehouse.id,
-                entity_name=warehouse.name,
-                changes={"name": warehouse.name, "location_name": location.name},
-            )
             flash("Склад добавлен", "success")
             logger.info("Создан склад %s (%s)", warehouse.name, warehouse.id)
             return redirect(url_for("warehouses.list_warehouses"))
@@ -81,10 +80,6 @@ def create_warehouse():
 def edit_warehouse(warehouse_id: int):
     warehouse = Warehouse.query.get_or_404(warehouse_id)
     if request.method == "POST":
-        old_data = {
-            "name": warehouse.name,
-            "location_name": warehouse.location.name if warehouse.location else None,
-        }
         location_name = request.form["location_name"].strip()
         
         if not location_name:
@@ -104,20 +99,6 @@ def edit_warehouse(warehouse_id: int):
         
         try:
             db.session.commit()
-            changes = {
-                "name": {"old": old_data.get("name"), "new": warehouse.name},
-                "location_name": {"old": old_data.get("location_name"), "new": location.name},
-            }
-            # Убираем неизмененные поля
-            changes = {k: v for k, v in changes.items() if v["old"] != v["new"]}
-            if changes:
-                log_action(
-                    AuditAction.UPDATE,
-                    "warehouse",
-                    entity_id=warehouse.id,
-                    entity_name=warehouse.name,
-                    changes=changes,
-                )
             flash("Склад обновлен", "success")
             logger.info("Обновлён склад %s (%s)", warehouse.name, warehouse_id)
             return redirect(url_for("warehouses.list_warehouses"))
@@ -1,8 +1,9 @@
-import json
 import logging
-from typing import Any, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
 
-from flask import request
+from flask import has_request_context, request
 from flask_login import current_user
 
 from ..extensions import db
@@ -10,54 +11,56 @@ from ..models import AuditAction, AuditLog
 
 logger = logging.getLogger(__name__)
 
+# Автор действий вне HTTP-запроса (фоновые задачи): user_id, ip_address, user_agent
+_background_actor: ContextVar[Optional[dict[str, Any]]] = ContextVar("audit_background_actor", default=None)
 
-def log_action(
+
+@contextmanager
+def audit_actor(user_id: int, ip_address: Optional[str] = None, user_agent: Optional[str] = None) -> Iterator[None]:
+    """Приписывает записи audit log, созданные вне запроса, указанному пользователю"""
+    token = _background_actor.set({"user_id": user_id, "ip_address": ip_address, "user_agent": user_agent})
+    try:
+        yield
+    finally:
+        _background_actor.reset(token)
+
+
+def _actor() -> Optional[dict[str, Any]]:
+    if has_request_context() and current_user.is_authenticated:
+        return {
+            "user_id": current_user.id,
+            "ip_address": request.remote_addr,
+            "user_agent": request.headers.get("User-Agent"),
+        }
+    return _background_actor.get()
+
+
+def audit_values(
     action: AuditAction,
     entity_type: str,
     entity_id: Optional[int] = None,
     entity_name: Optional[str] = None,
     changes: Optional[dict[str, Any]] = None,
-) -> None:
-    """Логирует действие пользователя в audit log"""
-    if not current_user.is_authenticated:
-        return
+) -> Optional[dict[str, Any]]:
+    """Значения колонок записи audit log для текущего пользователя (None вне запроса/без входа)"""
+    actor = _actor()
+    if actor is None:
+        return None
 
     # Только супер-админы могут видеть логи, но логируем действия всех
-    audit_log = AuditLog(
-        user_id=current_user.id,
-        action=action,
-        entity_type=entity_type,
-        entity_id=entity_id,
-        entity_name=entity_name,
-        changes=json.dumps(changes, ensure_ascii=False) if changes else None,
-        ip_address=request.remote_addr,
-        user_agent=request.headers.get("User-Agent"),
-    )
-
-    db.session.add(audit_log)
-    db.session.commit()
-    logger.info(
-        "AUDIT %s entity=%s(%s) user=%s",
-        action.value,
-        entity_type,
-        entity_id,
-        current_user.email,
-    )
-
-
-def get_audit_logs(
-    entity_type: Optional[str] = None,
-    entity_id: Optional[int] = None,
-    limit: int = 100,
-) -> list[AuditLog]:
-    """Получает записи audit log с фильтрацией"""
-    query = AuditLog.query.order_by(AuditLog.created_at.desc())
-
-    if entity_type:
-        query = query.filter_by(entity_type=entity_type)
-    if entity_id:
-        query = query.filter_by(entity_id=entity_id)
-
-    return query.limit(limit).all()
+    return {
+        "user_id": actor["user_id"],
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "entity_name": entity_name,
+        "changes": changes or None,
+        "ip_address": actor["ip_address"],
+        "user_agent": actor["user_agent"],
+    }
 
 
+def insert_audit_rows(rows: list[dict[str, Any]]) -> None:
+    """Пакетная вставка записей audit log (executemany) в текущей транзакции"""
+    if rows:
+        db.session.connection().execute(AuditLog.__table__.insert(), rows)
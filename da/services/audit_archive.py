@@ -0,0 +1,355 @@
+"""Хранение audit log: помесячные партиции, срок хранения и холодный архив.
+
+На PostgreSQL audit_logs секционирована по месяцам created_at (партиции
+audit_logs_pYYYY_MM, audit_logs_default для строк вне диапазона и
+audit_logs_legacy с записями до секционирования). Команда
+`flask audit-archive` создаёт партиции на AUDIT_PARTITIONS_AHEAD месяцев вперёд
+и переносит месяцы старше AUDIT_RETENTION_MONTHS в файлы
+<AUDIT_ARCHIVE_DIR>/audit_YYYY-MM.jsonl.gz. Сначала месяц целиком выгружается
+в файл, и только затем данные удаляются: партиция месяца отсоединяется
+(DETACH PARTITION под коротким lock_timeout с повторами) и удаляется, а
+строки audit_logs_default, audit_logs_legacy и строки на SQLite удаляются
+пачками по AUDIT_ARCHIVE_BATCH_SIZE в коротких транзакциях.
+Повторный запуск после сбоя дописывает в файл только недостающие записи.
+
+Архивные месяцы читаются страницей истории из файлов по запросу.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterator
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, select, text
+from sqlalchemy.exc import OperationalError
+
+from ..extensions import db
+from ..models import AuditLog, User
+
+logger = logging.getLogger(__name__)
+
+MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+DEFAULT_PARTITION = "audit_logs_default"
+# Таблица до секционирования, присоединённая партицией (миграция a3c8e1f5b207)
+LEGACY_PARTITION = "audit_logs_legacy"
+# Отсоединение партиции: ожидание блокировки audit_logs и повторы
+DETACH_LOCK_TIMEOUT = "2s"
+DETACH_ATTEMPTS = 5
+DETACH_RETRY_DELAY = 1.0
+LOCK_NOT_AVAILABLE = "55P03"
+_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+@dataclass
+class ArchivedMonth:
+    month: str
+    rows: int
+    path: Path
+    dropped_partition: bool = False
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def month_key(value: datetime) -> str:
+    return f"{value:%Y-%m}"
+
+
+def partition_name(month: datetime) -> str:
+    return f"audit_logs_p{month:%Y_%m}"
+
+
+def retention_cutoff(retention_months: int, now: datetime | None = None) -> datetime:
+    """Начало самого старого хранимого месяца: всё, что раньше, уходит в архив."""
+    now = now or datetime.utcnow()
+    return _add_months(_month_start(now), -retention_months)
+
+
+def archive_dir() -> Path:
+    configured = current_app.config.get("AUDIT_ARCHIVE_DIR")
+    return Path(configured) if configured else Path(current_app.instance_path) / "audit_archive"
+
+
+def archive_path(month: str) -> Path:
+    return archive_dir() / f"audit_{month}.jsonl.gz"
+
+
+def _is_postgresql() -> bool:
+    return db.engine.dialect.name == "postgresql"
+
+
+def _is_partitioned() -> bool:
+    if not _is_postgresql():
+        return False
+    relkind = db.session.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass('audit_logs')")
+    ).scalar()
+    return relkind == "p"
+
+
+def _partition_exists(name: str) -> bool:
+    return db.session.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None
+
+
+def _legacy_bound() -> datetime | None:
+    """Верхняя граница audit_logs_legacy (None, если партиции нет)."""
+    bound = db.session.execute(
+        text("SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE oid = to_regclass(:name)"),
+        {"name": LEGACY_PARTITION},
+    ).scalar()
+    match = _BOUND_RE.search(bound or "")
+    return datetime.fromisoformat(match.group(1)[:19]) if match else None
+
+
+def ensure_partitions(months_ahead: int | None = None, now: datetime | None = None) -> list[str]:
+    """
+    Создаёт недостающие партиции с текущего месяца на months_ahead месяцев вперёд.
+
+    Returns:
+        list: имена созданных партиций (пусто, если таблица не секционирована)
+    """
+    if not _is_partitioned():
+        return []
+    if months_ahead is None:
+        months_ahead = current_app.config.get("AUDIT_PARTITIONS_AHEAD", 3)
+    start = _month_start(now or datetime.utcnow())
+    # Месяцы до границы audit_logs_legacy уже покрыты ею
+    legacy_bound = _legacy_bound()
+    if legacy_bound is not None:
+        start = max(start, legacy_bound)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = _add_months(start, offset)
+        name = partition_name(month)
+        if _partition_exists(name):
+            continue
+        bounds = {"start": month, "end": _add_months(month, 1)}
+        # Строки месяца в default-партиции не дадут создать партицию месяца
+        if db.session.execute(
+            text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end LIMIT 1"),
+            bounds,
+        ).first():
+            logger.warning("Партиция %s не создана: строки месяца уже лежат в %s", name, DEFAULT_PARTITION)
+            continue
+        db.session.execute(
+            text(
+                f"CREATE TABLE {name} PARTITION OF audit_logs "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{bounds['end']:%Y-%m-%d}')"
+            )
+        )
+        created.append(name)
+    db.session.commit()
+    if created:
+        logger.info("Созданы партиции audit log: %s", ", ".join(created))
+    return created
+
+
+def _record(row) -> dict[str, Any]:
+    log, full_name, email = row
+    return {
+        "id": log.id,
+        "created_at": log.created_at.isoformat(),
+        "user_id": log.user_id,
+        "user_full_name": full_name,
+        "user_email": email,
+        "action": log.action.value,
+        "entity_type": log.entity_type,
+        "entity_id": log.entity_id,
+        "entity_name": log.entity_name,
+        "changes": log.changes,
+        "ip_address": log.ip_address,
+        "user_agent": log.user_agent,
+    }
+
+
+def _month_rows(start: datetime, end: datetime, batch_size: int) -> Iterator[dict[str, Any]]:
+    statement = (
+        select(AuditLog, User.full_name, User.email)
+        .join(User, AuditLog.user_id == User.id)
+        .where(AuditLog.created_at >= start, AuditLog.created_at < end)
+        .order_by(AuditLog.created_at, AuditLog.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in db.session.execute(statement):
+        yield _record(row)
+
+
+def _write_month_file(month: str, rows: Iterator[dict[str, Any]]) -> int:
+    """
+    Записывает месяц в gzip JSONL атомарно (через временный файл).
+
+    Записи из уже существующего файла месяца сохраняются, повторы по id
+    пропускаются. Returns: число записей, добавленных в файл.
+    """
+    path = archive_path(month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    seen: set[int] = set()
+    added = 0
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+        if path.exists():
+            with gzip.open(path, "rt", encoding="utf-8") as existing:
+                for line in existing:
+                    seen.add(json.loads(line)["id"])
+                    out.write(line)
+        for record in rows:
+            if record["id"] in seen:
+                continue
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            added += 1
+    with open(tmp_path, "rb") as written:
+        os.fsync(written.fileno())
+    os.replace(tmp_path, path)
+    return added
+
+
+def _drop_partition(name: str) -> None:
+    # DETACH CONCURRENTLY невозможен при default-партиции. Обычный DETACH берёт
+    # ACCESS EXCLUSIVE на audit_logs, но без сканирования: ждать блокировку
+    # дольше DETACH_LOCK_TIMEOUT нельзя — за ним в очереди встанут все вставки
+    db.session.commit()
+    for attempt in range(1, DETACH_ATTEMPTS + 1):
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+                connection.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+                connection.execute(text(f"DROP TABLE {name}"))
+            return
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE or attempt == DETACH_ATTEMPTS:
+                raise
+            logger.warning("Партиция %s занята, повтор %s из %s", name, attempt, DETACH_ATTEMPTS - 1)
+            time.sleep(DETACH_RETRY_DELAY * attempt)
+
+
+def _delete_in_batches(start: datetime, end: datetime, batch_size: int) -> int:
+    in_month = and_(AuditLog.created_at >= start, AuditLog.created_at < end)
+    deleted = 0
+    while True:
+        ids = select(AuditLog.id).where(in_month).limit(batch_size).scalar_subquery()
+        count = db.session.execute(delete(AuditLog).where(AuditLog.id.in_(ids), in_month)).rowcount
+        db.session.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def _next_month_with_rows(start: datetime, cutoff: datetime) -> datetime | None:
+    """Начало ближайшего месяца с записями в [start, cutoff) — пустые месяцы пропускаются."""
+    oldest = db.session.execute(
+        select(func.min(AuditLog.created_at)).where(AuditLog.created_at >= start, AuditLog.created_at < cutoff)
+    ).scalar()
+    return _month_start(oldest) if oldest is not None else None
+
+
+def archive_old_audit_logs(
+    retention_months: int | None = None,
+    batch_size: int | None = None,
+    dry_run: bool = False,
+    now: datetime | None = None,
+) -> list[ArchivedMonth]:
+    """
+    Переносит в архив месяцы старше срока хранения.
+
+    Returns:
+        list: перенесённые (при dry_run — подлежащие переносу) месяцы
+    """
+    config = current_app.config
+    if retention_months is None:
+        retention_months = config.get("AUDIT_RETENTION_MONTHS", 12)
+    batch_size = batch_size or config.get("AUDIT_ARCHIVE_BATCH_SIZE", 5000)
+    cutoff = retention_cutoff(retention_months, now)
+
+    partitioned = _is_partitioned()
+    archived = []
+    month = _next_month_with_rows(datetime.min, cutoff)
+    while month is not None:
+        end = _add_months(month, 1)
+        key = month_key(month)
+        if dry_run:
+            count = db.session.query(AuditLog.id).filter(
+                AuditLog.created_at >= month, AuditLog.created_at < end
+            ).count()
+            if count:
+                archived.append(ArchivedMonth(key, count, archive_path(key)))
+            month = _next_month_with_rows(end, cutoff)
+            continue
+
+        added = _write_month_file(key, _month_rows(month, end, batch_size))
+        db.session.rollback()  # закрываем транзакцию чтения перед удалением
+        entry = ArchivedMonth(key, added, archive_path(key))
+        name = partition_name(month)
+        if partitioned and _partition_exists(name):
+            _drop_partition(name)
+            entry.dropped_partition = True
+        # Строки месяца в default- и legacy-партиции или в несекционированной таблице
+        _delete_in_batches(month, end, batch_size)
+        if added or entry.dropped_partition:
+            archived.append(entry)
+            logger.info("Audit log за %s перенесён в архив (%s записей)", key, added)
+        month = _next_month_with_rows(end, cutoff)
+
+    if partitioned and not dry_run:
+        # Все месяцы audit_logs_legacy старше срока хранения и уже в архиве
+        legacy_bound = _legacy_bound()
+        if legacy_bound is not None and legacy_bound <= cutoff:
+            _drop_partition(LEGACY_PARTITION)
+            logger.info("Партиция %s пуста и удалена", LEGACY_PARTITION)
+    return archived
+
+
+def list_archived_months() -> list[str]:
+    """Месяцы (YYYY-MM), для которых есть архивные файлы, новые первыми."""
+    directory = archive_dir()
+    if not directory.is_dir():
+        return []
+    months = []
+    for path in directory.glob("audit_*.jsonl.gz"):
+        month = path.name[len("audit_"):-len(".jsonl.gz")]
+        if MONTH_RE.match(month):
+            months.append(month)
+    return sorted(months, reverse=True)
+
+
+def iter_archived_logs(
+    month: str,
+    entity_type: str | None = None,
+    entity_id: int | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Записи архивного месяца в хронологическом порядке (файл читается потоково)."""
+    if not MONTH_RE.match(month):
+        raise ValueError(f"Некорректный месяц: {month}")
+    path = archive_path(month)
+    if not path.exists():
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            record = json.loads(line)
+            if entity_type and record["entity_type"] != entity_type:
+                continue
+            if entity_id and record["entity_id"] != entity_id:
+                continue
+            record["created_at"] = datetime.fromisoformat(record["created_at"])
+            yield record
+
+
+def archived_page(month: str, page: int, per_page: int, **filters: Any) -> tuple[list[dict[str, Any]], bool]:
+    """Страница записей архивного месяца. Returns: (записи, есть ли следующая страница)."""
+    start = (page - 1) * per_page
+    records = list(islice(iter_archived_logs(month, **filters), start, start + per_page + 1))
+    return records[:per_page], len(records) > per_page
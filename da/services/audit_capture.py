@@ -0,0 +1,209 @@
+"""Автоматическая запись audit log по изменениям сущностей в сессии.
+
+Слушатель after_flush за один проход по new/dirty/deleted собирает изменения
+отслеживаемых моделей через history API ORM (старое и новое значение каждой
+изменённой колонки). Собранные записи ждут commit транзакции в session.info и
+после него уходят в буфер фонового писателя (services/audit_writer.py);
+записи транзакции или savepoint, которые откатились, отбрасываются. При
+AUDIT_BUFFER_SIZE = 0 записи вставляются одним executemany в той же
+транзакции. Имена удаляемых объектов запоминаются в before_flush, пока строки
+ещё есть в базе.
+
+Создание — CREATE со значениями заполненных колонок, установка deleted_at —
+DELETE (soft_delete), физическое удаление — DELETE, остальное — UPDATE.
+Маршрут может уточнить действие и добавить поля записи через annotate_audit
+(например, TRANSFER при перемещении девайса). Записи создаются только при
+известном авторе (запрос с входом или audit_actor).
+Запись в обход ORM (пакетный импорт, массовые операции) пишет audit log сама,
+пачкой в своей транзакции.
+"""
+from __future__ import annotations
+
+import enum
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable
+
+from sqlalchemy import event, inspect
+
+from ..extensions import db
+from ..models import AuditAction, Device, DeviceType, Employee, Location, Warehouse, utcnow
+from .audit import audit_values, insert_audit_rows
+from .audit_writer import audit_buffer_enabled, submit_audit_rows
+
+logger = logging.getLogger(__name__)
+
+# Модель -> (тип сущности в audit log, имя для записи)
+TRACKED_MODELS: dict[type, tuple[str, Callable[[Any], str]]] = {
+    Device: ("device", lambda obj: obj.inventory_number),
+    Employee: ("employee", lambda obj: obj.full_name),
+    Warehouse: ("warehouse", lambda obj: obj.name),
+    Location: ("location", lambda obj: obj.name),
+    DeviceType: ("device_type", lambda obj: obj.name),
+}
+# Служебные колонки в изменения не попадают; deleted_at определяет действие
+IGNORED_ATTRS = frozenset({"id", "created_at", "updated_at", "deleted_at"})
+
+_ANNOTATIONS_KEY = "audit_annotations"
+_DELETED_KEY = "audit_deleted"
+# [(savepoint или None, значения записи)] до commit транзакции
+_PENDING_KEY = "audit_pending"
+
+
+def _plain(value: Any) -> Any:
+    """Значение колонки в виде, пригодном для JSON."""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _column_keys(model: type) -> list[str]:
+    return [attr.key for attr in inspect(model).column_attrs if attr.key not in IGNORED_ATTRS]
+
+
+_COLUMNS: dict[type, list[str]] = {model: _column_keys(model) for model in TRACKED_MODELS}
+
+
+def annotate_audit(obj: Any, action: AuditAction | None = None, /, **extra: Any) -> None:
+    """Уточняет действие и дополняет изменения записи audit log объекта в ближайшем flush."""
+    annotations = db.session.info.setdefault(_ANNOTATIONS_KEY, {})
+    previous_action, previous_extra = annotations.get(obj, (None, {}))
+    annotations[obj] = (action or previous_action, {**previous_extra, **extra})
+
+
+def _diff(obj: Any) -> dict[str, dict[str, Any]]:
+    """Изменённые колонки объекта: {колонка: {"old": ..., "new": ...}}."""
+    attrs = inspect(obj).attrs
+    changes = {}
+    for key in _COLUMNS[type(obj)]:
+        history = attrs[key].history
+        if not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if old != new:
+            changes[key] = {"old": _plain(old), "new": _plain(new)}
+    return changes
+
+
+def _deleted_at_change(obj: Any) -> tuple[Any, Any] | None:
+    history = inspect(obj).attrs["deleted_at"].history
+    if not history.has_changes():
+        return None
+    return (history.deleted[0] if history.deleted else None, history.added[0] if history.added else None)
+
+
+def _audit_row(obj: Any, action: AuditAction, changes: dict[str, Any], annotations: dict,
+               entity_name: str | None = None) -> dict[str, Any] | None:
+    entity_type, name = TRACKED_MODELS[type(obj)]
+    annotated_action, extra = annotations.pop(obj, (None, {}))
+    return audit_values(
+        annotated_action or action,
+        entity_type,
+        entity_id=obj.id,
+        entity_name=entity_name if entity_name is not None else name(obj),
+        changes={**changes, **extra},
+    )
+
+
+def _before_flush(session, flush_context, instances) -> None:
+    # После flush строки удаляемых объектов уже нет: имена берём заранее
+    deleted = session.info.setdefault(_DELETED_KEY, {})
+    for obj in session.deleted:
+        if type(obj) in TRACKED_MODELS:
+            deleted[obj] = TRACKED_MODELS[type(obj)][1](obj)
+
+
+def _after_flush(session, flush_context) -> None:
+    annotations = session.info.get(_ANNOTATIONS_KEY, {})
+    deleted_names = session.info.pop(_DELETED_KEY, {})
+    rows: list[dict[str, Any] | None] = []
+
+    for obj in session.new:
+        if type(obj) in TRACKED_MODELS:
+            changes = {
+                key: _plain(getattr(obj, key))
+                for key in _COLUMNS[type(obj)]
+                if getattr(obj, key) is not None
+            }
+            rows.append(_audit_row(obj, AuditAction.CREATE, changes, annotations))
+
+    for obj in session.dirty:
+        if type(obj) not in TRACKED_MODELS:
+            continue
+        changes = _diff(obj)
+        deleted_at = _deleted_at_change(obj)
+        if deleted_at and deleted_at[0] is None and deleted_at[1] is not None:
+            rows.append(_audit_row(obj, AuditAction.DELETE, {**changes, "soft_delete": True}, annotations))
+        elif deleted_at and deleted_at[1] is None:
+            rows.append(_audit_row(obj, AuditAction.UPDATE, {**changes, "restored": True}, annotations))
+        elif changes:
+            rows.append(_audit_row(obj, AuditAction.UPDATE, changes, annotations))
+
+    for obj in session.deleted:
+        if type(obj) in TRACKED_MODELS:
+            rows.append(
+                _audit_row(obj, AuditAction.DELETE, {}, annotations, entity_name=deleted_names.get(obj))
+            )
+
+    rows = [row for row in rows if row is not None]
+    if not rows:
+        return
+    if not audit_buffer_enabled():
+        insert_audit_rows(rows)
+    else:
+        # Время действия, а не записи пачки писателем
+        now = utcnow()
+        savepoint = session.get_nested_transaction()
+        session.info.setdefault(_PENDING_KEY, []).extend((savepoint, {**row, "created_at": now}) for row in rows)
+    logger.debug("Audit log: %s записей за flush", len(rows))
+
+
+def _within(transaction, ancestor) -> bool:
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+def _clear(session) -> None:
+    # Аннотации объектов, не попавших во flush, не должны достаться следующей транзакции
+    session.info.pop(_ANNOTATIONS_KEY, None)
+    session.info.pop(_DELETED_KEY, None)
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _after_commit(session) -> None:
+    # after_commit приходит и на RELEASE SAVEPOINT: записи ждут commit всей транзакции
+    if session.in_nested_transaction():
+        return
+    pending = session.info.get(_PENDING_KEY)
+    _clear(session)
+    if pending:
+        submit_audit_rows([row for _, row in pending])
+
+
+def _after_soft_rollback(session, previous_transaction) -> None:
+    if previous_transaction.parent is None:
+        _clear(session)
+    elif previous_transaction.nested and session.info.get(_PENDING_KEY):
+        # Откат savepoint отменяет записи, собранные в нём и во вложенных в него
+        session.info[_PENDING_KEY] = [
+            (savepoint, row)
+            for savepoint, row in session.info[_PENDING_KEY]
+            if not _within(savepoint, previous_transaction)
+        ]
+
+
+def register_audit_events() -> None:
+    if not event.contains(db.session, "after_flush", _after_flush):
+        event.listen(db.session, "before_flush", _before_flush)
+        event.listen(db.session, "after_flush", _after_flush)
+        event.listen(db.session, "after_commit", _after_commit)
+        event.listen(db.session, "after_soft_rollback", _after_soft_rollback)
@@ -0,0 +1,224 @@
+"""Просмотр audit log: фильтры и keyset-пагинация."""
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Mapping
+
+from sqlalchemy import ColumnElement, Select, func, or_, select, tuple_, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import joinedload
+
+from ..extensions import db
+from ..models import AuditAction, AuditLog
+from .device_list import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+ID_FIELDS = ("user_id", "entity_id")
+
+_FIELD_RE = re.compile(r"^\w+$")
+_ANY = object()
+
+
+def _parse_int(raw: str | None) -> int | None:
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        return None
+
+
+def _parse_date(raw: str | None) -> date | None:
+    if not raw:
+        return None
+    try:
+        return date.fromisoformat(raw)
+    except ValueError:
+        return None
+
+
+def decode_cursor(token: str | None) -> list[Any] | None:
+    """Декодирует токен (created_at, id). Некорректный токен трактуется как первая страница."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != 2:
+            raise ValueError("cursor must contain two values")
+        return [datetime.fromisoformat(values[0]), int(values[1])]
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        logger.warning("Некорректный курсор audit log: %s", token)
+        return None
+
+
+@dataclass
+class AuditListParams:
+    user_id: int | None = None
+    action: AuditAction | None = None
+    entity_type: str | None = None
+    entity_id: int | None = None
+    date_from: date | None = None
+    # Включительно: записи до конца указанного дня
+    date_to: date | None = None
+    # Поле, попавшее в изменения, и (необязательно) его новое значение
+    changed_field: str | None = None
+    changed_to: str | None = None
+    cursor: str | None = None
+    per_page: int = DEFAULT_PAGE_SIZE
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> "AuditListParams":
+        """Строит параметры из query string, молча отбрасывая некорректные значения."""
+        params = cls(**{name: _parse_int(args.get(name)) for name in ID_FIELDS})
+
+        action = args.get("action")
+        if action in {a.value for a in AuditAction}:
+            params.action = AuditAction(action)
+
+        params.entity_type = (args.get("entity_type") or "").strip() or None
+        params.date_from = _parse_date(args.get("date_from"))
+        params.date_to = _parse_date(args.get("date_to"))
+
+        changed_field = (args.get("changed_field") or "").strip()
+        if _FIELD_RE.match(changed_field):
+            params.changed_field = changed_field
+            params.changed_to = args.get("changed_to") or None
+
+        per_page = _parse_int(args.get("per_page"))
+        if per_page:
+            params.per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+
+        params.cursor = args.get("cursor") or None
+        return params
+
+    def to_args(self, **overrides: Any) -> dict[str, Any]:
+        """Параметры для url_for (без пустых значений), с возможностью переопределения."""
+        args: dict[str, Any] = {name: getattr(self, name) for name in ID_FIELDS}
+        args["action"] = self.action.value if self.action else None
+        args["entity_type"] = self.entity_type
+        args["date_from"] = self.date_from.isoformat() if self.date_from else None
+        args["date_to"] = self.date_to.isoformat() if self.date_to else None
+        args["changed_field"] = self.changed_field
+        args["changed_to"] = self.changed_to
+        args["per_page"] = self.per_page if self.per_page != DEFAULT_PAGE_SIZE else None
+        args["cursor"] = self.cursor
+        args.update(overrides)
+        return {k: v for k, v in args.items() if v is not None}
+
+    @property
+    def is_filtered(self) -> bool:
+        return any(
+            getattr(self, name) is not None
+            for name in ("user_id", "action", "entity_type", "entity_id", "date_from", "date_to", "changed_field")
+        )
+
+
+@dataclass
+class AuditPage:
+    items: list[AuditLog] = field(default_factory=list)
+    next_cursor: str | None = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+def _candidates(value: Any) -> list[Any]:
+    """Значения из query string сравниваются и как строка, и как число (id в изменениях — int)."""
+    if isinstance(value, str):
+        number = _parse_int(value)
+        if number is not None:
+            return [value, number]
+    return [value]
+
+
+def field_changed(field: str, to: Any = _ANY) -> ColumnElement[bool]:
+    """
+    Условие «в записи изменилось поле field» (или «получило значение to»).
+
+    Учитывает обе формы changes: {field: {"old", "new"}} у изменений и
+    {field: value} у создания. На PostgreSQL — оператор @> / ? по JSONB, который
+    использует GIN-индекс ix_audit_logs_changes; на SQLite — json_extract.
+    Пример: field_changed("owner_id", 42) — все выдачи и создания с владельцем 42.
+    """
+    if not _FIELD_RE.match(field):
+        raise ValueError(f"Некорректное имя поля: {field}")
+    if db.session.get_bind().dialect.name == "postgresql":
+        # Колонка объявлена как JSON: операторы ? и @> есть только у JSONB
+        changes = type_coerce(AuditLog.changes, JSONB)
+        if to is _ANY:
+            return changes.has_key(field)
+        return or_(*(
+            changes.contains(document)
+            for value in _candidates(to)
+            for document in ({field: {"new": value}}, {field: value})
+        ))
+
+    value_path = f'$."{field}"'
+    if to is _ANY:
+        return func.json_type(AuditLog.changes, value_path).is_not(None)
+    return or_(*(
+        func.json_extract(AuditLog.changes, path) == value
+        for value in _candidates(to)
+        for path in (f"{value_path}.new", value_path)
+    ))
+
+
+def apply_audit_filters(statement: Select, params: AuditListParams) -> Select:
+    """
+    Добавляет фильтры к запросу по audit_logs.
+
+    Под фильтр по сущности и по пользователю есть индексы
+    (entity_type, entity_id, created_at, id) и (user_id, created_at, id).
+    """
+    if params.entity_type:
+        statement = statement.where(AuditLog.entity_type == params.entity_type)
+    if params.entity_id is not None:
+        statement = statement.where(AuditLog.entity_id == params.entity_id)
+    if params.user_id is not None:
+        statement = statement.where(AuditLog.user_id == params.user_id)
+    if params.action is not None:
+        statement = statement.where(AuditLog.action == params.action)
+    if params.date_from:
+        statement = statement.where(AuditLog.created_at >= datetime.combine(params.date_from, datetime.min.time()))
+    if params.date_to:
+        end = datetime.combine(params.date_to + timedelta(days=1), datetime.min.time())
+        statement = statement.where(AuditLog.created_at < end)
+    if params.changed_field:
+        to = params.changed_to if params.changed_to is not None else _ANY
+        statement = statement.where(field_changed(params.changed_field, to))
+    return statement
+
+
+def list_audit_page(params: AuditListParams) -> AuditPage:
+    """
+    Возвращает одну страницу audit log, новые записи сверху.
+
+    Пагинация keyset по (created_at, id); автор записи загружается тем же
+    запросом (joinedload), без отдельного запроса на строку.
+    """
+    statement = apply_audit_filters(select(AuditLog).options(joinedload(AuditLog.user)), params)
+
+    after = decode_cursor(params.cursor)
+    if after is not None:
+        statement = statement.where(tuple_(AuditLog.created_at, AuditLog.id) < tuple_(*after))
+
+    # Берём на одну строку больше, чтобы узнать о наличии следующей страницы без COUNT
+    statement = statement.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(params.per_page + 1)
+    rows = db.session.scalars(statement).all()
+    page = AuditPage(items=rows[: params.per_page])
+    if len(rows) > params.per_page:
+        last = page.items[-1]
+        page.next_cursor = encode_cursor([last.created_at, last.id])
+    return page
@@ -0,0 +1,192 @@
+"""Фоновая пакетная запись audit log.
+
+Записи, собранные из flush сессии (services/audit_capture.py), после commit
+транзакции не вставляются в запросе: значения колонок кладутся в ограниченную
+очередь процесса (AUDIT_BUFFER_SIZE), а поток audit-writer забирает
+накопившиеся записи и вставляет их одним executemany в отдельной транзакции.
+Пока идёт запись пачки, новые записи копятся в очереди, поэтому под нагрузкой
+пачки растут сами (group commit).
+
+Если очередь заполнена, запись ждёт до AUDIT_ENQUEUE_TIMEOUT секунд (delayed),
+затем отбрасывается с ошибкой в логе приложения (dropped). Остаток очереди
+дописывается при остановке процесса (atexit). При AUDIT_BUFFER_SIZE = 0
+буфер не используется: записи вставляются в транзакции самих изменений
+(тесты, отладка без потоков).
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from flask import Flask, current_app
+
+from ..extensions import db
+from ..models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_TIMEOUT = 10.0
+
+
+@dataclass
+class AuditWriterStats:
+    enqueued: int = 0
+    written: int = 0
+    # Ждали свободного места в заполненной очереди
+    delayed: int = 0
+    # Не попали в очередь за AUDIT_ENQUEUE_TIMEOUT или не записались из-за ошибки БД
+    dropped: int = 0
+    batches: int = 0
+    # Наибольшее время от постановки в очередь до записи в БД, секунды
+    max_lag_seconds: float = 0.0
+
+
+class AuditWriter:
+    """Ограниченная очередь записей audit log и поток, пишущий их пачками."""
+
+    def __init__(self, app: Flask, buffer_size: int, batch_size: int,
+                 flush_interval: float, enqueue_timeout: float) -> None:
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.stats = AuditWriterStats()
+        self.pid = os.getpid()
+        self._queue: queue.Queue[tuple[dict[str, Any], float]] = queue.Queue(maxsize=buffer_size)
+        self._stats_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def submit(self, values: dict[str, Any]) -> bool:
+        """Ставит запись в очередь. Returns: False, если запись отброшена."""
+        item = (values, time.monotonic())
+        self._count("enqueued")
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        try:
+            self._queue.put(item, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count("dropped")
+            logger.error("Очередь audit log переполнена, запись отброшена: %s", values)
+            return False
+        self._count("delayed")
+        logger.warning("Очередь audit log заполнена, запись ожидала места в буфере")
+        return True
+
+    def _take_batch(self) -> list[tuple[dict[str, Any], float]]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                self._write([values for values, _ in batch])
+                lag = time.monotonic() - min(queued_at for _, queued_at in batch)
+                with self._stats_lock:
+                    self.stats.max_lag_seconds = max(self.stats.max_lag_seconds, round(lag, 3))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, rows: list[dict[str, Any]]) -> None:
+        table = AuditLog.__table__
+        with self.app.app_context():
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(table.insert(), rows)
+                self._count("written", len(rows))
+                self._count("batches")
+                return
+            except Exception:
+                logger.exception("Ошибка пакетной записи audit log (%s записей), пишем построчно", len(rows))
+            # Одна некорректная запись не должна отменять остальные
+            for row in rows:
+                try:
+                    with db.engine.begin() as connection:
+                        connection.execute(table.insert(), row)
+                    self._count("written")
+                except Exception:
+                    self._count("dropped")
+                    logger.exception("Запись audit log потеряна: %s", row)
+
+    def flush(self) -> None:
+        """Ждёт, пока все поставленные записи будут записаны."""
+        self._queue.join()
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """Дописывает остаток очереди и останавливает поток."""
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error("audit-writer не успел записать %s записей при остановке", self._queue.qsize())
+
+
+_writer: AuditWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> AuditWriter:
+    global _writer
+    with _writer_lock:
+        # После fork поток родителя в дочернем процессе не работает
+        if _writer is None or _writer.pid != os.getpid():
+            config = current_app.config
+            _writer = AuditWriter(
+                current_app._get_current_object(),
+                buffer_size=config["AUDIT_BUFFER_SIZE"],
+                batch_size=config.get("AUDIT_BATCH_SIZE", 500),
+                flush_interval=config.get("AUDIT_FLUSH_INTERVAL", 1.0),
+                enqueue_timeout=config.get("AUDIT_ENQUEUE_TIMEOUT", 0.5),
+            )
+            atexit.register(_writer.stop)
+        return _writer
+
+
+def audit_buffer_enabled() -> bool:
+    return current_app.config.get("AUDIT_BUFFER_SIZE", 0) > 0
+
+
+def submit_audit_rows(rows: list[dict[str, Any]]) -> None:
+    """Ставит значения колонок записей audit log в буфер фонового писателя."""
+    writer = _get_writer()
+    for values in rows:
+        writer.submit(values)
+
+
+def flush_audit_writer() -> None:
+    """Дожидается записи буфера (команды CLI, тесты)."""
+    if _writer is not None and _writer.pid == os.getpid():
+        _writer.flush()
+
+
+def get_audit_writer_stats() -> dict[str, Any]:
+    """Счётчики буфера audit log текущего процесса и текущая длина очереди."""
+    if _writer is None or _writer.pid != os.getpid():
+        return {**asdict(AuditWriterStats()), "queued": 0}
+    with _writer._stats_lock:
+        return {**asdict(_writer.stats), "queued": _writer._queue.qsize()}
@@ -0,0 +1,218 @@
+"""Инкрементальные счётчики девайсов по складам, сотрудникам, локациям, типам и статусам.
+
+Счётчики обновляются в той же транзакции, что и сами девайсы: слушатель
+after_flush сравнивает состояние Device до и после flush и применяет дельты
+одним upsert-запросом. Операции в обход ORM (массовые UPDATE) должны вызывать
+apply_deltas сами; расхождения устраняет команда `flask inventory-counters`.
+"""
+from __future__ import annotations
+
+import enum
+import logging
+from collections import Counter
+from typing import Any, Mapping
+
+from sqlalchemy import event, false, func, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+
+from ..extensions import db
+from ..models import Device, InventoryCounter
+
+logger = logging.getLogger(__name__)
+
+# Измерение счётчика -> атрибут Device
+DIMENSIONS: dict[str, str] = {
+    "warehouse": "warehouse_id",
+    "owner": "owner_id",
+    "location": "location_id",
+    "type": "type_id",
+    "status": "status",
+}
+TOTAL_KEY = ("total", "all")
+TRACKED_ATTRS = (*DIMENSIONS.values(), "deleted_at")
+
+CounterKey = tuple[str, str]
+
+
+def _ref(value: Any) -> str:
+    return str(value.value if isinstance(value, enum.Enum) else value)
+
+
+def device_keys(values: Mapping[str, Any]) -> list[CounterKey]:
+    """Ключи счётчиков, в которые попадает девайс с указанными значениями атрибутов."""
+    if values.get("deleted_at") is not None:
+        return []
+    keys = [TOTAL_KEY]
+    for dimension, attr in DIMENSIONS.items():
+        value = values.get(attr)
+        if value is not None:
+            keys.append((dimension, _ref(value)))
+    return keys
+
+
+def _current_values(device: Device) -> dict[str, Any]:
+    return {attr: getattr(device, attr) for attr in TRACKED_ATTRS}
+
+
+def _committed_values(device: Device) -> dict[str, Any]:
+    """Значения атрибутов на момент загрузки из БД (до изменений в текущем flush)."""
+    attrs = inspect(device).attrs
+    values = {}
+    for attr in TRACKED_ATTRS:
+        history = attrs[attr].history
+        if history.deleted:
+            values[attr] = history.deleted[0]
+        elif history.unchanged:
+            values[attr] = history.unchanged[0]
+        else:
+            values[attr] = None
+    return values
+
+
+def collect_deltas(session) -> Counter:
+    """Считает изменения счётчиков по new/dirty/deleted девайсам сессии."""
+    deltas: Counter = Counter()
+    for obj in session.new:
+        if isinstance(obj, Device):
+            deltas.update(device_keys(_current_values(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, Device):
+            deltas.subtract(device_keys(_committed_values(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, Device) and session.is_modified(obj):
+            deltas.subtract(device_keys(_committed_values(obj)))
+            deltas.update(device_keys(_current_values(obj)))
+    return Counter({key: delta for key, delta in deltas.items() if delta})
+
+
+def apply_deltas(connection: Connection, deltas: Mapping[CounterKey, int]) -> None:
+    """Прибавляет дельты к счётчикам одним upsert (PostgreSQL/SQLite) в текущей транзакции."""
+    if not deltas:
+        return
+    table = InventoryCounter.__table__
+    # Фиксированный порядок ключей исключает взаимные блокировки параллельных транзакций
+    rows = [
+        {"dimension": dimension, "ref": ref, "device_count": delta}
+        for (dimension, ref), delta in sorted(deltas.items())
+    ]
+
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.dimension, table.c.ref],
+            set_={"device_count": table.c.device_count + stmt.excluded.device_count},
+        )
+        connection.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            table.update()
+            .where(table.c.dimension == row["dimension"], table.c.ref == row["ref"])
+            .values(device_count=table.c.device_count + row["device_count"])
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+
+def _before_flush(session, flush_context, instances) -> None:
+    # Удаляемые девайсы могут быть expired после commit; подгружаем их атрибуты,
+    # пока строка ещё существует, чтобы after_flush знал, из каких счётчиков вычитать.
+    for obj in session.deleted:
+        if isinstance(obj, Device) and inspect(obj).unloaded & set(TRACKED_ATTRS):
+            session.refresh(obj)
+
+
+def _after_flush(session, flush_context) -> None:
+    deltas = collect_deltas(session)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+        logger.debug("Счётчики инвентаря обновлены: %s", dict(deltas))
+
+
+def register_counter_events() -> None:
+    if not event.contains(db.session, "after_flush", _after_flush):
+        event.listen(db.session, "before_flush", _before_flush)
+        event.listen(db.session, "after_flush", _after_flush)
+
+
+def get_counts(dimension: str) -> dict[Any, int]:
+    """Счётчики одного измерения; для измерений по id ключи приводятся к int."""
+    rows = InventoryCounter.query.filter_by(dimension=dimension).all()
+    if dimension in ("status", "total"):
+        return {row.ref: row.device_count for row in rows}
+    return {int(row.ref): row.device_count for row in rows}
+
+
+def compute_counters() -> Counter:
+    """Пересчитывает все счётчики с нуля GROUP BY-запросами по не удалённым девайсам."""
+    live = Device.deleted_at.is_(None)
+    actual: Counter = Counter()
+    actual[TOTAL_KEY] = db.session.query(func.count(Device.id)).filter(live).scalar() or 0
+    for dimension, attr in DIMENSIONS.items():
+        column = getattr(Device, attr)
+        for value, count in (
+            db.session.query(column, func.count(Device.id))
+            .filter(live, column.isnot(None))
+            .group_by(column)
+        ):
+            actual[(dimension, _ref(value))] = count
+    return Counter({key: count for key, count in actual.items() if count})
+
+
+def _lock_counters(connection: Connection) -> None:
+    """Запрещает запись счётчиков другими транзакциями до конца текущей.
+
+    Любая запись девайса меняет счётчики в своей транзакции, поэтому под этой
+    блокировкой GROUP BY и таблица счётчиков читаются согласованно: транзакция,
+    успевшая изменить девайсы, но не закоммитившая, дождётся нас на apply_deltas
+    и применит свою дельту уже к исправленным значениям.
+    """
+    if connection.dialect.name == "postgresql":
+        # Конфликтует с ROW EXCLUSIVE (INSERT/UPDATE), но не с чтением
+        connection.exec_driver_sql(f"LOCK TABLE {InventoryCounter.__tablename__} IN SHARE ROW EXCLUSIVE MODE")
+    else:
+        # SQLite: пустой UPDATE открывает пишущую транзакцию (RESERVED lock),
+        # других писателей до commit нет
+        table = InventoryCounter.__table__
+        connection.execute(table.update().where(false()).values(device_count=table.c.device_count))
+
+
+def reconcile_counters(dry_run: bool = False) -> dict[CounterKey, tuple[int, int]]:
+    """
+    Сверяет таблицу счётчиков с фактическими данными и исправляет расхождения.
+
+    Чтение, сравнение и запись идут в одной транзакции под блокировкой таблицы
+    счётчиков (_lock_counters), поэтому команду можно запускать по cron на
+    работающей системе: параллельные изменения девайсов ждут её окончания.
+
+    Returns:
+        dict: ключ -> (значение в таблице, фактическое значение) для расходящихся ключей
+    """
+    connection = db.session.connection()
+    _lock_counters(connection)
+    try:
+        actual = compute_counters()
+        stored = {
+            (row.dimension, row.ref): row.device_count
+            for row in InventoryCounter.query.all()
+        }
+        drift = {
+            key: (stored.get(key, 0), actual.get(key, 0))
+            for key in set(stored) | set(actual)
+            if stored.get(key, 0) != actual.get(key, 0)
+        }
+        if not drift or dry_run:
+            db.session.rollback()
+            return drift
+        apply_deltas(connection, {key: new - old for key, (old, new) in drift.items()})
+        InventoryCounter.query.filter(InventoryCounter.device_count == 0).delete()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logger.warning("Счётчики инвентаря пересчитаны, расхождений: %s", len(drift))
+    return drift
@@ -0,0 +1,130 @@
+"""Агрегированная сводка для главной страницы."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from ..extensions import db
+from ..models import Device, DeviceStatus, DeviceType, Location, Warehouse
+
+logger = logging.getLogger(__name__)
+
+RECENT_DEVICES_LIMIT = 10
+
+_cache_lock = threading.Lock()
+_cached_summary: tuple[float, "DashboardSummary"] | None = None
+
+
+@dataclass
+class DashboardSummary:
+    total: int = 0
+    by_status: dict[str, int] = field(default_factory=dict)
+    by_type: list[tuple[str, int]] = field(default_factory=list)
+    by_location: list[tuple[str, int]] = field(default_factory=list)
+    by_warehouse: list[tuple[str, int]] = field(default_factory=list)
+
+    @property
+    def assigned(self) -> int:
+        return self.by_status.get(DeviceStatus.ASSIGNED.value, 0)
+
+    @property
+    def in_stock(self) -> int:
+        return self.by_status.get(DeviceStatus.IN_STOCK.value, 0)
+
+    @property
+    def retired(self) -> int:
+        return self.by_status.get(DeviceStatus.RETIRED.value, 0)
+
+
+def _live_devices():
+    return Device.deleted_at.is_(None)
+
+
+def build_dashboard_summary() -> DashboardSummary:
+    """Считает сводку четырьмя GROUP BY-запросами, не загружая сами девайсы."""
+    summary = DashboardSummary()
+
+    for status, count in (
+        db.session.query(Device.status, func.count(Device.id))
+        .filter(_live_devices())
+        .group_by(Device.status)
+    ):
+        summary.by_status[status.value] = count
+    summary.total = sum(summary.by_status.values())
+
+    summary.by_type = [
+        (name, count)
+        for name, count in db.session.query(DeviceType.name, func.count(Device.id))
+        .join(Device, Device.type_id == DeviceType.id)
+        .filter(_live_devices())
+        .group_by(DeviceType.id, DeviceType.name)
+        .order_by(func.count(Device.id).desc(), DeviceType.name)
+    ]
+
+    summary.by_location = [
+        (name or "—", count)
+        for name, count in db.session.query(Location.name, func.count(Device.id))
+        .select_from(Device)
+        .outerjoin(Location, Device.location_id == Location.id)
+        .filter(_live_devices())
+        .group_by(Location.id, Location.name)
+        .order_by(func.count(Device.id).desc(), Location.name)
+    ]
+
+    summary.by_warehouse = [
+        (name, count)
+        for name, count in db.session.query(Warehouse.name, func.count(Device.id))
+        .join(Device, Device.warehouse_id == Warehouse.id)
+        .filter(_live_devices(), Warehouse.deleted_at.is_(None))
+        .group_by(Warehouse.id, Warehouse.name)
+        .order_by(func.count(Device.id).desc(), Warehouse.name)
+    ]
+    return summary
+
+
+def get_dashboard_summary() -> DashboardSummary:
+    """
+    Возвращает сводку из кэша процесса, пересчитывая её не чаще раза в DASHBOARD_CACHE_TTL секунд.
+
+    TTL = 0 отключает кэширование.
+    """
+    global _cached_summary
+    ttl = current_app.config.get("DASHBOARD_CACHE_TTL", 0)
+    now = time.monotonic()
+    with _cache_lock:
+        if ttl and _cached_summary and now - _cached_summary[0] < ttl:
+            return _cached_summary[1]
+
+    summary = build_dashboard_summary()
+    with _cache_lock:
+        _cached_summary = (now, summary)
+    logger.debug("Сводка дашборда пересчитана: %s девайсов", summary.total)
+    return summary
+
+
+def invalidate_dashboard_summary() -> None:
+    global _cached_summary
+    with _cache_lock:
+        _cached_summary = None
+
+
+def get_recent_devices(limit: int = RECENT_DEVICES_LIMIT) -> list[Device]:
+    """Последние добавленные девайсы (покрывается индексом ix_devices_live_created)."""
+    return (
+        Device.query.filter(_live_devices())
+        .options(
+            joinedload(Device.type),
+            joinedload(Device.location),
+            joinedload(Device.owner),
+            joinedload(Device.warehouse),
+        )
+        .order_by(Device.created_at.desc(), Device.id.desc())
+        .limit(limit)
+        .all()
+    )
@@ -0,0 +1,254 @@
+"""Массовые операции с девайсами: выдача, перемещение на склад, возврат и списание.
+
+Операция выполняется в одной транзакции. Выбранные девайсы обрабатываются
+пачками по BULK_BATCH_SIZE: состояние пачки читается одним запросом (на
+PostgreSQL с блокировкой строк), пачка меняется одним UPDATE ... WHERE id IN,
+записи DeviceHistory и audit log вставляются executemany. Запись идёт в обход
+ORM, поэтому счётчики инвентаря корректируются через apply_deltas; поля,
+индексируемые поиском, операции не меняют. Девайсы, уже находящиеся в целевом
+состоянии, пропускаются.
+"""
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+from sqlalchemy import select, update
+
+from ..extensions import db
+from ..models import (
+    AuditAction,
+    Device,
+    DeviceHistory,
+    DeviceStatus,
+    Employee,
+    HistoryEvent,
+    Location,
+    Warehouse,
+    utcnow,
+)
+from .audit import audit_values, insert_audit_rows
+from .counters import apply_deltas, device_keys
+from .device_import import TRACKED_COLUMNS
+from .excel import chunked
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 1000
+# Ограничение на одну операцию: выбор «все по фильтру» не должен захватить весь парк
+MAX_BULK_DEVICES = 10000
+
+
+@dataclass(frozen=True)
+class BulkAction:
+    label: str
+    event: HistoryEvent
+    audit_action: AuditAction
+    note: str
+    # Цель операции: "employee", "warehouse" или None
+    target: str | None
+
+
+ACTIONS: dict[str, BulkAction] = {
+    "assign": BulkAction("Выдать сотруднику", HistoryEvent.ASSIGNED, AuditAction.ASSIGN, "Выдан сотруднику", "employee"),
+    "transfer": BulkAction(
+        "Переместить на склад", HistoryEvent.TRANSFERRED, AuditAction.TRANSFER, "Перемещен на склад", "warehouse"
+    ),
+    "return": BulkAction(
+        "Вернуть на склад", HistoryEvent.RETURNED, AuditAction.RETURN, "Возвращен на склад", "warehouse"
+    ),
+    "retire": BulkAction("Списать", HistoryEvent.RETIRED, AuditAction.UPDATE, "Списан", None),
+}
+
+
+@dataclass
+class BulkResult:
+    action: str
+    requested: int = 0
+    updated: int = 0
+
+    @property
+    def skipped(self) -> int:
+        return self.requested - self.updated
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"action": self.action, "requested": self.requested, "updated": self.updated, "skipped": self.skipped}
+
+
+def _target(spec: BulkAction, employee_id: int | None, warehouse_id: int | None) -> tuple[dict[str, Any], dict[str, Any]]:
+    """Новые значения колонок девайса и поля для audit log, общие для всей операции."""
+    if spec.target == "employee":
+        employee = db.session.get(Employee, employee_id) if employee_id else None
+        if employee is None or employee.deleted_at is not None:
+            raise ValueError("Сотрудник не найден")
+        values = {
+            "owner_id": employee.id,
+            "warehouse_id": None,
+            "location_id": employee.location_id,
+            "status": DeviceStatus.ASSIGNED,
+        }
+        return values, {"employee_name": employee.full_name}
+    if spec.target == "warehouse":
+        warehouse = db.session.get(Warehouse, warehouse_id) if warehouse_id else None
+        if warehouse is None or warehouse.deleted_at is not None:
+            raise ValueError("Склад не найден")
+        values = {
+            "warehouse_id": warehouse.id,
+            "owner_id": None,
+            "location_id": warehouse.location_id,
+            "status": DeviceStatus.IN_STOCK,
+        }
+        return values, {"warehouse_name": warehouse.name}
+    return {"status": DeviceStatus.RETIRED}, {}
+
+
+def _names(states: list[dict[str, Any]], target: dict[str, Any]) -> dict[str, dict[int, str]]:
+    """Имена складов, сотрудников и локаций пачки (до и после операции) тремя запросами."""
+
+    def ids(column: str) -> set[int]:
+        found = {state[column] for state in states if state[column] is not None}
+        if target.get(column) is not None:
+            found.add(target[column])
+        return found
+
+    names: dict[str, dict[int, str]] = {"warehouse": {}, "owner": {}, "location": {}}
+    warehouse_ids, owner_ids, location_ids = ids("warehouse_id"), ids("owner_id"), ids("location_id")
+    if warehouse_ids:
+        names["warehouse"] = dict(
+            db.session.execute(select(Warehouse.id, Warehouse.name).where(Warehouse.id.in_(warehouse_ids))).all()
+        )
+    if owner_ids:
+        for employee_id, *parts in db.session.execute(
+            select(Employee.id, Employee.last_name, Employee.first_name, Employee.middle_name).where(
+                Employee.id.in_(owner_ids)
+            )
+        ):
+            names["owner"][employee_id] = " ".join(p for p in parts if p)
+    if location_ids:
+        names["location"] = dict(
+            db.session.execute(select(Location.id, Location.name).where(Location.id.in_(location_ids))).all()
+        )
+    return names
+
+
+def _plain(value: Any) -> Any:
+    return value.value if isinstance(value, DeviceStatus) else value
+
+
+def _changes(old: dict[str, Any], target: dict[str, Any], names: dict[str, dict[int, str]]) -> dict[str, Any]:
+    """Изменения в формате записи audit log одиночного редактирования (см. routes/devices.py)."""
+    changes: dict[str, Any] = {
+        column: {"old": _plain(old[column]), "new": _plain(value)}
+        for column, value in target.items()
+        if old[column] != value
+    }
+    for key in ("warehouse", "owner", "location"):
+        column = f"{key}_id"
+        if column in target and old[column] != target[column]:
+            changes[key] = {
+                "old": names[key].get(old[column]),
+                "new": names[key].get(target[column]),
+            }
+    return changes
+
+
+def bulk_update_devices(
+    action: str,
+    device_ids: Iterable[int],
+    employee_id: int | None = None,
+    warehouse_id: int | None = None,
+) -> BulkResult:
+    """
+    Применяет массовую операцию к девайсам и коммитит её одной транзакцией.
+
+    Args:
+        action: ключ ACTIONS (assign, transfer, return, retire)
+        device_ids: id девайсов; удалённые и отсутствующие пропускаются
+        employee_id: сотрудник для assign
+        warehouse_id: склад для transfer и return
+
+    Returns:
+        BulkResult: сколько девайсов запрошено и сколько изменено
+
+    Raises:
+        ValueError: неизвестная операция, не найдена цель или неверный набор девайсов
+    """
+    spec = ACTIONS.get(action)
+    if spec is None:
+        raise ValueError(f"Неизвестная операция: {action}")
+    ids = sorted(set(device_ids))
+    if not ids:
+        raise ValueError("Не выбрано ни одного девайса")
+    if len(ids) > MAX_BULK_DEVICES:
+        raise ValueError(f"За одну операцию можно изменить не больше {MAX_BULK_DEVICES} девайсов")
+
+    target, extra = _target(spec, employee_id, warehouse_id)
+    table = Device.__table__
+    connection = db.session.connection()
+    result = BulkResult(action, requested=len(ids))
+    deltas: Counter = Counter()
+
+    for batch in chunked(ids, BULK_BATCH_SIZE):
+        states = [
+            row._asdict()
+            for row in connection.execute(
+                select(table.c.id, table.c.inventory_number, *(table.c[name] for name in TRACKED_COLUMNS))
+                .where(table.c.id.in_(batch), table.c.deleted_at.is_(None))
+                .order_by(table.c.id)
+                .with_for_update()
+            )
+        ]
+        changed = [
+            state
+            for state in states
+            if any(state[column] != value for column, value in target.items())
+            # Вернуть на склад можно только выданный девайс
+            and (action != "return" or state["owner_id"] is not None)
+        ]
+        if not changed:
+            continue
+
+        connection.execute(
+            update(table).where(table.c.id.in_([state["id"] for state in changed])).values(**target, updated_at=utcnow())
+        )
+
+        names = _names(changed, target)
+        history_rows = []
+        audit_rows = []
+        for old in changed:
+            new = {**old, **target}
+            deltas.subtract(device_keys(old))
+            deltas.update(device_keys(new))
+            actor_id = old["owner_id"] if action == "return" else new["owner_id"]
+            history_rows.append(
+                {
+                    "device_id": old["id"],
+                    "event": spec.event,
+                    "note": spec.note,
+                    "from_location": names["location"].get(old["location_id"]),
+                    "to_location": names["location"].get(new["location_id"]),
+                    "actor": names["owner"].get(actor_id),
+                }
+            )
+            values = audit_values(
+                spec.audit_action,
+                "device",
+                entity_id=old["id"],
+                entity_name=old["inventory_number"],
+                changes={**_changes(old, target, names), "action": spec.note, **extra, "bulk": True},
+            )
+            if values:
+                audit_rows.append(values)
+
+        connection.execute(DeviceHistory.__table__.insert(), history_rows)
+        insert_audit_rows(audit_rows)
+        result.updated += len(changed)
+
+    apply_deltas(connection, {key: delta for key, delta in deltas.items() if delta})
+    db.session.commit()
+    logger.info(
+        "Массовая операция %s: изменено %s из %s девайсов", action, result.updated, result.requested
+    )
+    return result
@@ -0,0 +1,395 @@
+"""Потоковый импорт девайсов из Excel.
+
+Лист читается в режиме read_only/values_only, справочники (типы, локации,
+склады, сотрудники) загружаются один раз на импорт, строки обрабатываются
+пачками фиксированного размера. Каждая пачка записывается одним
+INSERT ... ON CONFLICT (upsert_devices) с пакетной вставкой истории и audit log;
+этот движок общий для страницы импорта и InventoryService.
+"""
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import and_, case, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models import (
+    AuditAction,
+    Device,
+    DeviceHistory,
+    DeviceStatus,
+    DeviceType,
+    Employee,
+    HistoryEvent,
+    Location,
+    Warehouse,
+    utcnow,
+)
+from .audit import audit_values, insert_audit_rows
+from .counters import apply_deltas, device_keys
+from .excel import ImportResult, ProgressCallback, cell, chunked, get_chunk_size, iter_excel_rows
+from .search import index_entities
+
+logger = logging.getLogger(__name__)
+
+def _key(value: str) -> str:
+    return value.strip().lower()
+
+
+@dataclass
+class ImportLookups:
+    """Справочники для сопоставления строк импорта, ключи — имена в нижнем регистре."""
+
+    types: dict[str, int] = field(default_factory=dict)
+    locations: dict[str, int] = field(default_factory=dict)
+    # Значения для складов и сотрудников: (id, location_id)
+    warehouses: dict[str, tuple[int, int]] = field(default_factory=dict)
+    employees_by_name: dict[tuple[str, str], tuple[int, int]] = field(default_factory=dict)
+    employees_by_email: dict[str, tuple[int, int]] = field(default_factory=dict)
+    employees_by_full_name: dict[str, tuple[int, int]] = field(default_factory=dict)
+    # Имена для записей DeviceHistory без ленивой загрузки связей
+    location_names: dict[int, str] = field(default_factory=dict)
+    employee_names: dict[int, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, include_deleted: bool = False) -> "ImportLookups":
+        """Загружает справочники четырьмя запросами (только нужные колонки)."""
+
+        def live(model):
+            query = db.session.query(model)
+            return query if include_deleted else query.filter(model.deleted_at.is_(None))
+
+        lookups = cls()
+        for type_id, name in live(DeviceType).with_entities(DeviceType.id, DeviceType.name):
+            lookups.types.setdefault(_key(name), type_id)
+        for location_id, name in live(Location).with_entities(Location.id, Location.name):
+            lookups.locations.setdefault(_key(name), location_id)
+            lookups.location_names[location_id] = name
+        for warehouse_id, name, location_id in live(Warehouse).with_entities(
+            Warehouse.id, Warehouse.name, Warehouse.location_id
+        ):
+            lookups.warehouses.setdefault(_key(name), (warehouse_id, location_id))
+
+        employees = (
+            db.session.query(
+                Employee.id,
+                Employee.last_name,
+                Employee.first_name,
+                Employee.middle_name,
+                Employee.email,
+                Employee.location_id,
+            )
+            .filter(Employee.deleted_at.is_(None))
+            .order_by(Employee.id)
+        )
+        for employee_id, last_name, first_name, middle_name, email, location_id in employees:
+            ref = (employee_id, location_id)
+            lookups.employees_by_name.setdefault((_key(last_name), _key(first_name)), ref)
+            lookups.employees_by_email.setdefault(_key(email), ref)
+            full_name = " ".join(p for p in (last_name, first_name, middle_name) if p)
+            lookups.employees_by_full_name.setdefault(_key(full_name), ref)
+            lookups.employee_names[employee_id] = full_name
+        return lookups
+
+    def find_employee(self, value: str) -> tuple[int, int] | None:
+        """Ищет сотрудника по «Фамилия Имя [Отчество]» (по фамилии и имени)."""
+        parts = value.split()
+        if len(parts) < 2:
+            return None
+        return self.employees_by_name.get((_key(parts[0]), _key(parts[1])))
+
+
+def _parse_new_device(row_num: int, row: tuple, lookups: ImportLookups, result: ImportResult) -> dict[str, Any] | None:
+    """
+    Разбирает строку формата страницы импорта.
+
+    Колонки: Инвентарный номер, Модель, Тип, Серийный номер, Склад/Сотрудник, Локация, Примечания.
+    """
+    inventory_number = cell(row, 0)
+    model = cell(row, 1)
+    type_name = cell(row, 2)
+    owner_or_warehouse = cell(row, 4)
+    location_name = cell(row, 5)
+
+    if not inventory_number:
+        result.error(row_num, "отсутствует инвентарный номер")
+        return None
+    if not model:
+        result.error(row_num, "отсутствует модель")
+        return None
+    if not type_name:
+        result.error(row_num, "отсутствует тип девайса")
+        return None
+
+    type_id = lookups.types.get(_key(type_name))
+    if type_id is None:
+        result.error(row_num, f"тип девайса '{type_name}' не найден")
+        return None
+
+    values: dict[str, Any] = {
+        "inventory_number": inventory_number,
+        "model": model,
+        "type_id": type_id,
+        "serial_number": cell(row, 3),
+        "notes": cell(row, 6),
+        "location_id": None,
+        "warehouse_id": None,
+        "owner_id": None,
+        "status": DeviceStatus.IN_STOCK,
+    }
+
+    if location_name:
+        location_id = lookups.locations.get(_key(location_name))
+        if location_id is None:
+            result.error(row_num, f"локация '{location_name}' не найдена")
+            return None
+        values["location_id"] = location_id
+
+    if owner_or_warehouse:
+        employee = lookups.find_employee(owner_or_warehouse)
+        warehouse = lookups.warehouses.get(_key(owner_or_warehouse)) if employee is None else None
+        if employee is not None:
+            values["owner_id"], values["location_id"] = employee
+            values["status"] = DeviceStatus.ASSIGNED
+        elif warehouse is not None:
+            values["warehouse_id"], values["location_id"] = warehouse
+        elif len(owner_or_warehouse.split()) >= 2:
+            result.error(row_num, f"не найден сотрудник или склад '{owner_or_warehouse}'")
+            return None
+        else:
+            result.error(row_num, f"не найден склад '{owner_or_warehouse}'")
+            return None
+
+    if not values["location_id"]:
+        result.error(row_num, "не удалось определить локацию")
+        return None
+    return values
+
+
+# Колонки, перезаписываемые при совпадении инвентарного номера (режим обновления);
+# владелец, склад, статус и локация — см. _placement_set
+UPSERT_COLUMNS = ("model", "type_id", "serial_number", "notes")
+TRACKED_COLUMNS = ("warehouse_id", "owner_id", "location_id", "type_id", "status", "deleted_at")
+
+
+def _dialect_insert():
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"Пакетный импорт не поддерживает СУБД {dialect}")
+
+
+def _placement_set(table, excluded) -> dict[str, Any]:
+    """
+    Владелец, склад, статус и локация для DO UPDATE, согласованные как при выдаче и перемещении.
+
+    Строка с сотрудником выдаёт девайс: склад снимается, локация и статус
+    берутся из строки (локация сотрудника, ASSIGNED). Строка со складом так же
+    перемещает девайс на склад. Строка без обоих размещение не меняет; её
+    локация применяется только к девайсу, у которого нет ни владельца, ни склада
+    (иначе локация определяется ими).
+    """
+    has_owner = excluded.owner_id.isnot(None)
+    has_warehouse = excluded.warehouse_id.isnot(None)
+    moves = or_(has_owner, has_warehouse)
+    unplaced = and_(table.c.owner_id.is_(None), table.c.warehouse_id.is_(None))
+    return {
+        "owner_id": case((has_owner, excluded.owner_id), (has_warehouse, None), else_=table.c.owner_id),
+        "warehouse_id": case((has_owner, None), (has_warehouse, excluded.warehouse_id), else_=table.c.warehouse_id),
+        "status": case((moves, excluded.status), else_=table.c.status),
+        "location_id": case((or_(moves, unplaced), excluded.location_id), else_=table.c.location_id),
+    }
+
+
+@dataclass
+class UpsertOutcome:
+    created: list[dict[str, Any]] = field(default_factory=list)
+    updated: list[dict[str, Any]] = field(default_factory=list)
+    # Номера, не записанные из-за конфликта (только в режиме без обновления)
+    conflicts: set[str] = field(default_factory=set)
+
+
+def upsert_devices(
+    rows: list[dict[str, Any]],
+    lookups: ImportLookups,
+    update_existing: bool,
+    note: str = "Импорт из Excel",
+) -> UpsertOutcome:
+    """
+    Записывает пачку девайсов одним INSERT ... ON CONFLICT (inventory_number).
+
+    При update_existing=False конфликтующие строки пропускаются (DO NOTHING),
+    иначе обновляются колонки UPSERT_COLUMNS, а размещение девайса — по
+    _placement_set: владелец или склад меняются, только если указаны в строке. Записи DeviceHistory и audit log вставляются пакетно,
+    счётчики инвентаря корректируются по старому и новому состоянию строк,
+    записанные девайсы переиндексируются для поиска.
+
+    Номера в rows должны быть уникальны: PostgreSQL не позволяет одному
+    INSERT ... ON CONFLICT DO UPDATE изменить строку дважды.
+    """
+    outcome = UpsertOutcome()
+    if not rows:
+        return outcome
+
+    table = Device.__table__
+    numbers = [row["inventory_number"] for row in rows]
+    previous = {
+        r.inventory_number: r._asdict()
+        for r in db.session.execute(
+            select(table.c.inventory_number, *(table.c[name] for name in TRACKED_COLUMNS)).where(
+                table.c.inventory_number.in_(numbers)
+            )
+        )
+    }
+
+    stmt = _dialect_insert()(table)
+    if update_existing:
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.inventory_number],
+            set_={
+                **{name: excluded[name] for name in UPSERT_COLUMNS},
+                **_placement_set(table, excluded),
+                "updated_at": utcnow(),
+            },
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.inventory_number])
+    stmt = stmt.returning(
+        table.c.id, table.c.inventory_number, table.c.model, *(table.c[name] for name in TRACKED_COLUMNS)
+    )
+
+    deltas: Counter = Counter()
+    # executemany + RETURNING: SQLAlchemy объединяет строки в пакетные
+    # INSERT ... VALUES (insertmanyvalues), а оператор компилируется один раз и кэшируется
+    for written in db.session.connection().execute(stmt, rows):
+        state = written._asdict()
+        old = previous.get(state["inventory_number"])
+        if old is None:
+            outcome.created.append(state)
+        else:
+            outcome.updated.append(state)
+            deltas.subtract(device_keys(old))
+        deltas.update(device_keys(state))
+    outcome.conflicts = set(numbers) - {
+        state["inventory_number"] for state in outcome.created + outcome.updated
+    }
+
+    apply_deltas(db.session.connection(), {key: delta for key, delta in deltas.items() if delta})
+    index_entities("device", [state["id"] for state in outcome.created + outcome.updated])
+    _write_history(outcome, lookups, note)
+    return outcome
+
+
+def _write_history(outcome: UpsertOutcome, lookups: ImportLookups, note: str) -> None:
+    history_rows = []
+    audit_rows = []
+    for states, event, action in (
+        (outcome.created, HistoryEvent.CREATED, AuditAction.CREATE),
+        (outcome.updated, HistoryEvent.UPDATED, AuditAction.UPDATE),
+    ):
+        for state in states:
+            history_rows.append(
+                {
+                    "device_id": state["id"],
+                    "event": event,
+                    "note": note,
+                    "from_location": lookups.location_names.get(state["location_id"]),
+                    "actor": lookups.employee_names.get(state["owner_id"]),
+                }
+            )
+            values = audit_values(
+                action,
+                "device",
+                entity_id=state["id"],
+                entity_name=state["inventory_number"],
+                changes={"model": state["model"], "type_id": state["type_id"], "imported": True},
+            )
+            if values:
+                audit_rows.append(values)
+
+    if history_rows:
+        db.session.connection().execute(DeviceHistory.__table__.insert(), history_rows)
+    insert_audit_rows(audit_rows)
+
+
+def write_chunk(
+    batch: list[tuple[int, dict[str, Any]]],
+    lookups: ImportLookups,
+    update_existing: bool,
+    result: ImportResult,
+) -> UpsertOutcome:
+    """
+    Записывает пачку через upsert_devices в savepoint.
+
+    Если пачка падает на ограничении целостности (например, FK на удалённый
+    справочник), она повторяется построчно, чтобы ошибка одной строки не
+    отменяла остальные.
+    """
+    try:
+        with db.session.begin_nested():
+            return upsert_devices([values for _, values in batch], lookups, update_existing)
+    except IntegrityError:
+        outcome = UpsertOutcome()
+        for row_num, values in batch:
+            try:
+                with db.session.begin_nested():
+                    single = upsert_devices([values], lookups, update_existing)
+            except IntegrityError as e:
+                result.error(row_num, f"ошибка сохранения - {e.orig}")
+                continue
+            outcome.created += single.created
+            outcome.updated += single.updated
+            outcome.conflicts |= single.conflicts
+        return outcome
+
+
+def import_new_devices(file_stream, progress: ProgressCallback | None = None) -> ImportResult:
+    """
+    Импортирует новые девайсы (страница импорта). Занятые номера пропускаются с ошибкой.
+
+    На каждую пачку — один INSERT ... ON CONFLICT DO NOTHING и пакетная
+    вставка истории и audit log; после пачки вызывается progress(result).
+    """
+    result = ImportResult()
+    lookups = ImportLookups.load()
+    seen_numbers: set[str] = set()
+
+    for chunk in chunked(iter_excel_rows(file_stream), get_chunk_size()):
+        batch: list[tuple[int, dict[str, Any]]] = []
+        for row_num, row in chunk:
+            if not any(row):
+                continue
+            result.rows += 1
+            try:
+                values = _parse_new_device(row_num, row, lookups, result)
+            except Exception as e:
+                result.error(row_num, f"ошибка обработки - {str(e)}")
+                logger.exception("Ошибка импорта девайса из строки %s", row_num)
+                continue
+            if values is None:
+                continue
+            number = values["inventory_number"]
+            if number in seen_numbers:
+                result.error(row_num, f"инвентарный номер {number} повторяется в файле")
+                continue
+            seen_numbers.add(number)
+            batch.append((row_num, values))
+
+        outcome = write_chunk(batch, lookups, update_existing=False, result=result)
+        for row_num, values in batch:
+            if values["inventory_number"] in outcome.conflicts:
+                result.error(row_num, f"девайс с инвентарным номером {values['inventory_number']} уже существует")
+        result.created += len(outcome.created)
+        if progress:
+            progress(result)
+
+    db.session.commit()
+    return result
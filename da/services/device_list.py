@@ -0,0 +1,169 @@
+"""Серверный список девайсов: фильтры, сортировка и keyset-пагинация."""
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Mapping
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
+
+from ..models import Device, DeviceStatus
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Каждая сортировка — пара (колонка, по убыванию). Вторым ключом всегда идёт
+# Device.id, поэтому порядок строго детерминирован и пригоден для keyset.
+SORT_OPTIONS: dict[str, tuple[Any, bool]] = {
+    "newest": (Device.created_at, True),
+    "oldest": (Device.created_at, False),
+    "inventory": (Device.inventory_number, False),
+    "model": (Device.model, False),
+}
+DEFAULT_SORT = "newest"
+
+FILTER_FIELDS = ("type_id", "location_id", "warehouse_id", "owner_id")
+
+
+def _parse_int(raw: str | None) -> int | None:
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        return None
+
+
+def encode_cursor(values: list[Any]) -> str:
+    """Кодирует значения ключа последней строки в непрозрачный токен для URL."""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str | None, sort: str) -> list[Any] | None:
+    """Декодирует токен курсора. Некорректный токен трактуется как первая страница."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != 2:
+            raise ValueError("cursor must contain two values")
+        if SORT_OPTIONS[sort][0] is Device.created_at:
+            values[0] = datetime.fromisoformat(values[0])
+        values[1] = int(values[1])
+        return values
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        logger.warning("Некорректный курсор списка девайсов: %s", token)
+        return None
+
+
+@dataclass
+class DeviceListParams:
+    type_id: int | None = None
+    status: DeviceStatus | None = None
+    location_id: int | None = None
+    warehouse_id: int | None = None
+    owner_id: int | None = None
+    sort: str = DEFAULT_SORT
+    cursor: str | None = None
+    per_page: int = DEFAULT_PAGE_SIZE
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> "DeviceListParams":
+        """Строит параметры из query string, молча отбрасывая некорректные значения."""
+        params = cls(**{name: _parse_int(args.get(name)) for name in FILTER_FIELDS})
+
+        status = args.get("status")
+        if status in {s.value for s in DeviceStatus}:
+            params.status = DeviceStatus(status)
+
+        sort = args.get("sort")
+        if sort in SORT_OPTIONS:
+            params.sort = sort
+
+        per_page = _parse_int(args.get("per_page"))
+        if per_page:
+            params.per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+
+        params.cursor = args.get("cursor") or None
+        return params
+
+    def to_args(self, **overrides: Any) -> dict[str, Any]:
+        """Параметры для url_for (без пустых значений), с возможностью переопределения."""
+        args: dict[str, Any] = {name: getattr(self, name) for name in FILTER_FIELDS}
+        args["status"] = self.status.value if self.status else None
+        args["sort"] = self.sort if self.sort != DEFAULT_SORT else None
+        args["per_page"] = self.per_page if self.per_page != DEFAULT_PAGE_SIZE else None
+        args["cursor"] = self.cursor
+        args.update(overrides)
+        return {k: v for k, v in args.items() if v is not None}
+
+    @property
+    def is_filtered(self) -> bool:
+        return self.status is not None or any(getattr(self, name) for name in FILTER_FIELDS)
+
+
+@dataclass
+class DevicePage:
+    items: list[Device] = field(default_factory=list)
+    next_cursor: str | None = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+def filtered_devices_query(params: DeviceListParams):
+    """Запрос по не удалённым девайсам с применёнными фильтрами, без сортировки."""
+    query = Device.query.filter(Device.deleted_at.is_(None))
+    for name in FILTER_FIELDS:
+        value = getattr(params, name)
+        if value is not None:
+            query = query.filter(getattr(Device, name) == value)
+    if params.status is not None:
+        query = query.filter(Device.status == params.status)
+    return query
+
+
+def list_devices_page(params: DeviceListParams) -> DevicePage:
+    """
+    Возвращает одну страницу списка девайсов.
+
+    Пагинация keyset по паре (колонка сортировки, id): стоимость запроса не
+    зависит от номера страницы, в отличие от OFFSET. Каждой сортировке
+    соответствует частичный индекс по (фильтр, колонка, id) из Device.__table_args__.
+    """
+    column, descending = SORT_OPTIONS[params.sort]
+    query = filtered_devices_query(params).options(
+        joinedload(Device.type),
+        joinedload(Device.location),
+        joinedload(Device.owner),
+        joinedload(Device.warehouse),
+    )
+
+    after = decode_cursor(params.cursor, params.sort)
+    if after is not None:
+        key = tuple_(column, Device.id)
+        query = query.filter(key < tuple_(*after) if descending else key > tuple_(*after))
+
+    if descending:
+        query = query.order_by(column.desc(), Device.id.desc())
+    else:
+        query = query.order_by(column.asc(), Device.id.asc())
+
+    # Берём на одну строку больше, чтобы узнать о наличии следующей страницы без COUNT
+    rows = query.limit(params.per_page + 1).all()
+    page = DevicePage(items=rows[: params.per_page])
+    if len(rows) > params.per_page:
+        last = page.items[-1]
+        page.next_cursor = encode_cursor([getattr(last, column.key), last.id])
+    return page
@@ -0,0 +1,160 @@
+"""Лента событий девайса: DeviceHistory и audit log в одном порядке.
+
+Порядок ленты — (created_at, источник, id) по убыванию. Страница выбирается
+одним запросом UNION ALL по ключам двух источников: в каждой ветке условие
+курсора и LIMIT применяются до объединения, поэтому обе ветки читают только
+начало индексов ix_device_history_device и ix_audit_logs_entity, сколько бы
+событий ни было у девайса. Сами строки страницы затем загружаются по id.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import and_, literal, select, tuple_, union_all
+from sqlalchemy.orm import joinedload
+
+from ..extensions import db
+from ..models import AuditLog, DeviceHistory, User
+from .device_list import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Имена источников в курсоре; порядок строк задаёт и порядок источников при равном времени
+AUDIT = "audit"
+HISTORY = "history"
+
+
+@dataclass
+class TimelineEntry:
+    source: str
+    id: int
+    created_at: datetime
+    # AuditAction.value или HistoryEvent.value
+    kind: str
+    user: User | None = None
+    actor: str | None = None
+    changes: Any = None
+    note: str | None = None
+    from_location: str | None = None
+    to_location: str | None = None
+
+
+@dataclass
+class TimelinePage:
+    items: list[TimelineEntry] = field(default_factory=list)
+    next_cursor: str | None = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+
+def decode_cursor(token: str | None) -> tuple[datetime, str, int] | None:
+    """Декодирует токен (created_at, источник, id). Некорректный токен — первая страница."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != 3 or values[1] not in (AUDIT, HISTORY):
+            raise ValueError("cursor must contain time, source and id")
+        return datetime.fromisoformat(values[0]), values[1], int(values[2])
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        logger.warning("Некорректный курсор ленты девайса: %s", token)
+        return None
+
+
+def _before(source: str, created_at, row_id, after: tuple[datetime, str, int]):
+    """Условие «строка источника source идёт в ленте после курсора» в терминах индекса."""
+    at, after_source, after_id = after
+    if source < after_source:
+        return created_at <= at
+    if source > after_source:
+        return created_at < at
+    return tuple_(created_at, row_id) < tuple_(at, after_id)
+
+
+def _branch(source: str, model, condition, after, limit: int):
+    statement = select(
+        literal(source).label("source"),
+        model.id.label("id"),
+        model.created_at.label("created_at"),
+    ).where(condition)
+    if after is not None:
+        statement = statement.where(_before(source, model.created_at, model.id, after))
+    return statement.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+
+
+def _page_keys(device_id: int, after, limit: int) -> list[tuple[str, int, datetime]]:
+    history = _branch(HISTORY, DeviceHistory, DeviceHistory.device_id == device_id, after, limit)
+    audit = _branch(
+        AUDIT,
+        AuditLog,
+        and_(AuditLog.entity_type == "device", AuditLog.entity_id == device_id),
+        after,
+        limit,
+    )
+    # Ветки с ORDER BY/LIMIT оборачиваются в подзапросы — так требует UNION в SQLite и PostgreSQL
+    merged = union_all(
+        select(history.subquery()),
+        select(audit.subquery()),
+    ).subquery()
+    statement = (
+        select(merged.c.source, merged.c.id, merged.c.created_at)
+        .order_by(merged.c.created_at.desc(), merged.c.source.desc(), merged.c.id.desc())
+        .limit(limit)
+    )
+    return [tuple(row) for row in db.session.execute(statement)]
+
+
+def _load_entries(keys: list[tuple[str, int, datetime]]) -> list[TimelineEntry]:
+    audit_ids = [row_id for source, row_id, _ in keys if source == AUDIT]
+    history_ids = [row_id for source, row_id, _ in keys if source == HISTORY]
+    entries: dict[tuple[str, int], TimelineEntry] = {}
+    if audit_ids:
+        logs = db.session.scalars(
+            select(AuditLog).options(joinedload(AuditLog.user)).where(AuditLog.id.in_(audit_ids))
+        )
+        for log in logs:
+            entries[(AUDIT, log.id)] = TimelineEntry(
+                AUDIT, log.id, log.created_at, log.action.value, user=log.user, changes=log.changes
+            )
+    if history_ids:
+        for record in db.session.scalars(select(DeviceHistory).where(DeviceHistory.id.in_(history_ids))):
+            entries[(HISTORY, record.id)] = TimelineEntry(
+                HISTORY,
+                record.id,
+                record.created_at,
+                record.event.value,
+                actor=record.actor,
+                note=record.note,
+                from_location=record.from_location,
+                to_location=record.to_location,
+            )
+    return [entries[(source, row_id)] for source, row_id, _ in keys if (source, row_id) in entries]
+
+
+def device_timeline_page(device_id: int, cursor: str | None = None, per_page: int = DEFAULT_PAGE_SIZE) -> TimelinePage:
+    """
+    Возвращает одну страницу ленты событий девайса, новые сверху.
+
+    Returns:
+        TimelinePage: события и курсор следующей страницы (None, если это последняя)
+    """
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    # Берём на одну строку больше, чтобы узнать о наличии следующей страницы без COUNT
+    keys = _page_keys(device_id, decode_cursor(cursor), per_page + 1)
+    page = TimelinePage(items=_load_entries(keys[:per_page]))
+    if len(keys) > per_page:
+        source, row_id, created_at = keys[per_page - 1]
+        page.next_cursor = encode_cursor([created_at, source, row_id])
+    return page
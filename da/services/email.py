@@ -1,15 +1,443 @@
-"""Сервис для отправки email-уведомлений."""
+"""Email-уведомления через очередь email_outbox.
+
+Запрос только сохраняет письмо в таблицу email_outbox и будит фоновый поток
+email-sender; сам запрос не ждёт SMTP-сервер. Отправитель забирает готовые
+письма пачками (EMAIL_BATCH_SIZE) и отправляет их через одно
+аутентифицированное SMTP-соединение, которое закрывается, когда очередь пуста.
+Неудачная попытка откладывает письмо на EMAIL_RETRY_BASE_SECONDS * 2^(n-1)
+секунд (не больше EMAIL_RETRY_MAX_SECONDS), после EMAIL_MAX_ATTEMPTS попыток
+письмо помечается FAILED. Письмо захватывается отправителем на время аренды,
+поэтому потоки нескольких процессов не отправляют его дважды, а письма
+упавшего процесса возвращаются в очередь.
+
+Уведомления об удалении копятся в deletion_notices и через
+DELETION_DIGEST_MINUTES после первого из них уходят одним письмом получателю
+со сводкой по типам объектов. Сводки собирает email-sender при каждом опросе,
+поэтому окно не дольше DELETION_DIGEST_MINUTES + EMAIL_POLL_INTERVAL и после
+перезапуска воркеров.
+
+Поток запускается при создании приложения в каждом процессе (и заново в
+дочернем процессе после fork) и опрашивает очередь раз в EMAIL_POLL_INTERVAL
+секунд, поэтому отложенные повторы, письма с истёкшей арендой и сводки
+уходят и без новых писем в этом процессе. Без фонового потока
+(EMAIL_SENDER_THREAD = 0, тесты) очередь отправляет команда
+`flask email-outbox`.
+"""
+from __future__ import annotations
+
+import atexit
 import logging
+import os
 import smtplib
-from datetime import datetime, timezone
-from email.mime.text import MIMEText
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from email.mime.multipart import MIMEMultipart
-from typing import Optional
+from email.mime.text import MIMEText
+from typing import Any, Mapping
+
+import click
+from flask import Flask, current_app
+from sqlalchemy import func, select, update
 
-from flask import current_app
+from ..extensions import db
+from ..models import DeletionNotice, EmailOutbox, EmailStatus, User, UserRole, utcnow
 
 logger = logging.getLogger(__name__)
 
+# Отправитель всегда da@ittest-team.ru
+SENDER = "da@ittest-team.ru"
+# На это время письмо закреплено за отправителем, захватившим его
+CLAIM_LEASE_SECONDS = 300
+# Сервер отказал в конкретном письме. Прочие ошибки (SMTPException — подкласс
+# OSError) считаются ошибками соединения или входа
+MESSAGE_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+
+ENTITY_TYPES_RU = {
+    "device": "Девайс",
+    "employee": "Сотрудник",
+    "warehouse": "Склад",
+    "location": "Локация",
+    "device_type": "Тип девайса",
+}
+# Сколько удалений перечислять в сводном письме; по типам считаются все
+DIGEST_MAX_LINES = 200
+
+
+def smtp_configured(config: Mapping[str, Any]) -> bool:
+    """SMTP настроен: есть хост, а при указанном пользователе — и пароль."""
+    return bool(config.get("SMTP_HOST")) and (not config.get("SMTP_USER") or bool(config.get("SMTP_PASSWORD")))
+
+
+class SmtpConnection:
+    """SMTP-соединение для серии писем: подключение и вход при первом письме."""
+
+    def __init__(self, config: Mapping[str, Any]) -> None:
+        self.host = config.get("SMTP_HOST")
+        self.port = config.get("SMTP_PORT", 587)
+        self.user = config.get("SMTP_USER")
+        self.password = config.get("SMTP_PASSWORD")
+        self.timeout = config.get("SMTP_TIMEOUT", 10)
+        self._server: smtplib.SMTP | None = None
+
+    def _open(self) -> smtplib.SMTP:
+        # Порт 465 использует SSL/TLS с самого начала
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            # Порт 587 и другие используют STARTTLS
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.port == 587:
+                server.starttls()
+        # Отладочный SMTP-сервер без пользователя принимает письма без входа
+        if self.user:
+            server.login(self.user, self.password)
+        logger.debug("SMTP-соединение с %s:%s открыто", self.host, self.port)
+        return server
+
+    def send(self, message: MIMEMultipart) -> None:
+        if self._server is None:
+            self._server = self._open()
+            self._server.send_message(message)
+            return
+        try:
+            self._server.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # Сервер закрыл простаивавшее соединение: одно переподключение
+            self._server = None
+            self._server = self._open()
+            self._server.send_message(message)
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._server = None
+
+
+def _build_message(item: EmailOutbox) -> MIMEMultipart:
+    message = MIMEMultipart()
+    message["From"] = SENDER
+    message["To"] = item.recipient
+    message["Subject"] = item.subject
+    message.attach(MIMEText(item.body, "plain", "utf-8"))
+    return message
+
+
+def _retry_delay(attempts: int, config: Mapping[str, Any]) -> timedelta:
+    base = config.get("EMAIL_RETRY_BASE_SECONDS", 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), config.get("EMAIL_RETRY_MAX_SECONDS", 3600)))
+
+
+def _claim_due(limit: int) -> list[EmailOutbox]:
+    """Захватывает до limit готовых писем, сдвигая их следующую попытку на время аренды."""
+    now = utcnow()
+    due = (EmailOutbox.status == EmailStatus.PENDING, EmailOutbox.next_attempt_at <= now)
+    ids = db.session.scalars(
+        select(EmailOutbox.id).where(*due).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(limit)
+    ).all()
+    lease = now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+    claimed = [
+        outbox_id
+        for outbox_id in ids
+        # Письмо, уже захваченное другим процессом, условию не соответствует
+        if db.session.execute(
+            update(EmailOutbox).where(EmailOutbox.id == outbox_id, *due).values(next_attempt_at=lease)
+        ).rowcount
+    ]
+    db.session.commit()
+    if not claimed:
+        return []
+    return db.session.scalars(select(EmailOutbox).where(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id)).all()
+
+
+def _record_failure(item: EmailOutbox, error: Exception, config: Mapping[str, Any]) -> None:
+    item.attempts += 1
+    item.last_error = f"{type(error).__name__}: {error}"[:500]
+    if item.attempts >= config.get("EMAIL_MAX_ATTEMPTS", 8):
+        item.status = EmailStatus.FAILED
+        logger.error("Письмо %s на %s не отправлено после %s попыток: %s",
+                     item.id, item.recipient, item.attempts, item.last_error)
+    else:
+        item.next_attempt_at = utcnow() + _retry_delay(item.attempts, config)
+        logger.warning("Письмо %s на %s не отправлено (попытка %s): %s",
+                       item.id, item.recipient, item.attempts, item.last_error)
+
+
+def send_pending_emails(connection: SmtpConnection | None = None) -> int:
+    """
+    Отправляет все готовые письма очереди.
+
+    Returns:
+        int: число отправленных писем
+    """
+    config = current_app.config
+    own_connection = connection is None
+    connection = connection or SmtpConnection(config)
+    sent = 0
+    flush_deletion_digests()
+    try:
+        while True:
+            batch = _claim_due(config.get("EMAIL_BATCH_SIZE", 50))
+            if not batch:
+                return sent
+            for index, item in enumerate(batch):
+                try:
+                    connection.send(_build_message(item))
+                except MESSAGE_ERRORS as error:
+                    _record_failure(item, error, config)
+                except OSError as error:
+                    connection.close()
+                    _record_failure(item, error, config)
+                    # Сервер недоступен: остальные письма пачки вернутся в очередь без лишней попытки
+                    retry_at = utcnow() + _retry_delay(1, config)
+                    for rest in batch[index + 1:]:
+                        rest.next_attempt_at = retry_at
+                    db.session.commit()
+                    return sent
+                else:
+                    item.status = EmailStatus.SENT
+                    item.sent_at = utcnow()
+                    item.last_error = None
+                    sent += 1
+                    logger.info("Письмо %s отправлено на %s", item.id, item.recipient)
+                db.session.commit()
+    finally:
+        if own_connection:
+            connection.close()
+
+
+class EmailSender:
+    """Фоновый поток, отправляющий письма очереди."""
+
+    def __init__(self, app: Flask, poll_interval: float) -> None:
+        self.app = app
+        self.poll_interval = poll_interval
+        self.pid = os.getpid()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="email-sender", daemon=True)
+        self._thread.start()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    send_pending_emails()
+                except Exception:
+                    logger.exception("Ошибка фоновой отправки писем")
+                finally:
+                    db.session.remove()
+            self._wake.wait(self.poll_interval)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+
+_sender: EmailSender | None = None
+_sender_lock = threading.Lock()
+
+
+def _start_sender(app: Flask) -> EmailSender:
+    global _sender
+    with _sender_lock:
+        # После fork поток родителя в дочернем процессе не работает
+        if _sender is None or _sender.pid != os.getpid():
+            _sender = EmailSender(app, poll_interval=app.config.get("EMAIL_POLL_INTERVAL", 10.0))
+            atexit.register(_sender.stop)
+        return _sender
+
+
+def _wake_sender() -> None:
+    if not current_app.config.get("EMAIL_SENDER_THREAD", True):
+        return
+    _start_sender(current_app._get_current_object()).wake()
+
+
+def start_email_sender(app: Flask) -> None:
+    """
+    Запускает email-sender при создании приложения (EMAIL_SENDER_THREAD).
+
+    Команды CLI, кроме `flask run`, поток не запускают: база может быть ещё
+    не мигрирована, а очередь для них отправляет `flask email-outbox`.
+    """
+    if not app.config.get("EMAIL_SENDER_THREAD", True):
+        return
+    command = click.get_current_context(silent=True)
+    if command is not None and command.info_name != "run":
+        return
+    _start_sender(app)
+
+
+def _restart_after_fork() -> None:
+    global _sender_lock
+    # Блокировка могла быть захвачена потоком родителя в момент fork
+    _sender_lock = threading.Lock()
+    if _sender is not None:
+        _start_sender(_sender.app)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def queue_email(recipient: str, subject: str, body: str) -> EmailOutbox:
+    """Сохраняет письмо в очередь (коммитит) и будит фоновый отправитель."""
+    item = EmailOutbox(recipient=recipient, subject=subject, body=body)
+    db.session.add(item)
+    db.session.commit()
+    _wake_sender()
+    return item
+
+
+_recipient_cache: tuple[float, str | None] | None = None
+
+
+def _notification_recipient() -> str | None:
+    """Email супер-админа; кэшируется в процессе на REFERENCE_CACHE_TTL секунд."""
+    global _recipient_cache
+    ttl = current_app.config.get("REFERENCE_CACHE_TTL", 60)
+    cached = _recipient_cache
+    if cached is not None and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+    email = db.session.scalar(
+        select(User.email).where(User.role == UserRole.SUPER_ADMIN, User.is_active.is_(True)).order_by(User.id).limit(1)
+    )
+    _recipient_cache = (time.monotonic(), email)
+    return email
+
+
+def _deletion_body(entity_type: str, entity_name: str, deleted_by: str, is_soft_delete: bool,
+                   deleted_at: datetime) -> str:
+    delete_type = "помечен как удаленный" if is_soft_delete else "удален окончательно"
+    delete_time = deleted_at.strftime("%d.%m.%Y %H:%M:%S UTC")
+    entity_type_ru = ENTITY_TYPES_RU.get(entity_type, entity_type)
+
+    return f"""Уважаемый администратор!
+
+В системе Device Accounting был {delete_type} объект:
+
+Тип: {entity_type_ru}
+Название: {entity_name}
+Удален пользователем: {deleted_by}
+Дата и время удаления: {delete_time}
+Тип удаления: {"Мягкое удаление (можно восстановить)" if is_soft_delete else "Окончательное удаление"}
+
+Вы можете просмотреть удаленные объекты в разделе "Удалено" системы.
+
+---
+Это автоматическое уведомление от системы Device Accounting.
+"""
+
+
+def _digest_body(notices: list[DeletionNotice]) -> str:
+    """Сводное письмо: таблица по типам объектов и список удалений (не больше DIGEST_MAX_LINES)."""
+    totals: dict[str, list[int]] = {}
+    for notice in notices:
+        soft_hard = totals.setdefault(notice.entity_type, [0, 0])
+        soft_hard[0 if notice.is_soft_delete else 1] += 1
+
+    header = ("Тип", "Мягкое", "Окончательное", "Всего")
+    rows = [
+        (ENTITY_TYPES_RU.get(entity_type, entity_type), soft, hard, soft + hard)
+        for entity_type, (soft, hard) in sorted(totals.items())
+    ]
+    rows.append(("Итого", sum(r[1] for r in rows), sum(r[2] for r in rows), len(notices)))
+    width = max(len(header[0]), *(len(r[0]) for r in rows))
+    table = [f"{header[0]:<{width}}  {header[1]:>6}  {header[2]:>13}  {header[3]:>5}"]
+    table += [f"{name:<{width}}  {soft:>6}  {hard:>13}  {total:>5}" for name, soft, hard, total in rows]
+
+    lines = [
+        f"{n.created_at:%d.%m.%Y %H:%M:%S}  {ENTITY_TYPES_RU.get(n.entity_type, n.entity_type)}: "
+        f"{n.entity_name} — {'мягкое' if n.is_soft_delete else 'окончательное'}, {n.deleted_by}"
+        for n in notices[:DIGEST_MAX_LINES]
+    ]
+    if len(notices) > DIGEST_MAX_LINES:
+        lines.append(f"... и ещё {len(notices) - DIGEST_MAX_LINES}")
+
+    nl = "\n"
+    return f"""Уважаемый администратор!
+
+С {notices[0].created_at:%d.%m.%Y %H:%M:%S} по {notices[-1].created_at:%d.%m.%Y %H:%M:%S} UTC в системе Device Accounting удалено объектов: {len(notices)}.
+
+{nl.join(table)}
+
+Удаленные объекты (UTC):
+{nl.join(lines)}
+
+Вы можете просмотреть удаленные объекты в разделе "Удалено" системы.
+
+---
+Это автоматическое уведомление от системы Device Accounting.
+"""
+
+
+def flush_deletion_digests(now: datetime | None = None) -> int:
+    """
+    Ставит в очередь сводные письма получателям, у которых окно уведомлений истекло.
+
+    Окно DELETION_DIGEST_MINUTES отсчитывается от самого раннего ожидающего
+    уведомления получателя. Единственное уведомление уходит обычным письмом.
+
+    Returns:
+        int: число поставленных в очередь писем
+    """
+    window = timedelta(minutes=current_app.config.get("DELETION_DIGEST_MINUTES", 0))
+    pending = DeletionNotice.email_id.is_(None)
+    recipients = db.session.scalars(
+        select(DeletionNotice.recipient)
+        .where(pending)
+        .group_by(DeletionNotice.recipient)
+        .having(func.min(DeletionNotice.created_at) <= (now or utcnow()) - window)
+    ).all()
+    queued = 0
+    for recipient in recipients:
+        notices = db.session.scalars(
+            select(DeletionNotice)
+            .where(pending, DeletionNotice.recipient == recipient)
+            .order_by(DeletionNotice.created_at, DeletionNotice.id)
+        ).all()
+        if not notices:
+            continue
+        if len(notices) == 1:
+            notice = notices[0]
+            subject = f"Уведомление об удалении: {notice.entity_type}"
+            body = _deletion_body(notice.entity_type, notice.entity_name, notice.deleted_by,
+                                  notice.is_soft_delete, notice.created_at)
+        else:
+            subject = f"Уведомление об удалении: {len(notices)} объектов"
+            body = _digest_body(notices)
+        item = EmailOutbox(recipient=recipient, subject=subject, body=body)
+        db.session.add(item)
+        db.session.flush()
+        # Уведомления, уже собранные другим процессом, условию не соответствуют
+        claimed = db.session.execute(
+            update(DeletionNotice)
+            .where(DeletionNotice.id.in_([n.id for n in notices]), pending)
+            .values(email_id=item.id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed != len(notices):
+            db.session.rollback()
+            continue
+        db.session.commit()
+        queued += 1
+        logger.info("Сводка из %s уведомлений об удалении поставлена в очередь для %s", len(notices), recipient)
+    return queued
+
 
 def send_deletion_notification(
     entity_type: str,
@@ -18,100 +446,47 @@ def send_deletion_notification(
     is_soft_delete: bool = False,
 ) -> bool:
     """
-    Отправляет уведомление супер-админу о удалении объекта.
-    
+    Ставит в очередь уведомление супер-админу о удалении объекта.
+
+    При DELETION_DIGEST_MINUTES > 0 уведомление ждёт сводного письма
+    (flush_deletion_digests), иначе сразу становится отдельным письмом.
+
     Args:
         entity_type: Тип удаленного объекта (device, employee, warehouse, etc.)
         entity_name: Название удаленного объекта
         deleted_by: Email пользователя, который удалил объект
         is_soft_delete: True если это мягкое удаление, False если физическое
-    
+
     Returns:
-        bool: True если письмо отправлено успешно, False в противном случае
+        bool: True если уведомление поставлено в очередь, False в противном случае
     """
     try:
-        # Получаем настройки SMTP из конфигурации
-        smtp_host = current_app.config.get("SMTP_HOST")
-        smtp_port = current_app.config.get("SMTP_PORT", 587)
-        smtp_user = current_app.config.get("SMTP_USER")
-        smtp_password = current_app.config.get("SMTP_PASSWORD")
-        
-        # Отправитель всегда da@ittest-team.ru
-        smtp_from = "da@ittest-team.ru"
-        
-        # Проверяем, что все необходимые настройки SMTP есть
-        if not all([smtp_host, smtp_user, smtp_password]):
+        if not smtp_configured(current_app.config):
             logger.warning("SMTP настройки не полностью настроены, уведомление не отправлено")
             return False
-        
-        # Получаем email супер-админа из базы
-        from ..models import User, UserRole
-        super_admin = User.query.filter_by(role=UserRole.SUPER_ADMIN).first()
-        if not super_admin:
+
+        recipient_email = _notification_recipient()
+        if not recipient_email:
             logger.warning("Супер-админ не найден в базе, уведомление не отправлено")
             return False
-        
-        recipient_email = super_admin.email
-        
-        # Создаем сообщение
-        msg = MIMEMultipart()
-        msg["From"] = smtp_from
-        msg["To"] = recipient_email
-        msg["Subject"] = f"Уведомление об удалении: {entity_type}"
-        
-        # Формируем тело письма
-        delete_type = "помечен как удаленный" if is_soft_delete else "удален окончательно"
-        delete_time = datetime.now(timezone.utc).strftime("%d.%m.%Y %H:%M:%S UTC")
-        
-        # Переводим типы сущностей на русский
-        entity_type_ru = {
-            "device": "Девайс",
-            "employee": "Сотрудник",
-            "warehouse": "Склад",
-            "location": "Локация",
-            "device_type": "Тип девайса",
-        }.get(entity_type, entity_type)
-        
-        body = f"""Уважаемый администратор!
-
-В системе Device Accounting был {delete_type} объект:
 
-Тип: {entity_type_ru}
-Название: {entity_name}
-Удален пользователем: {deleted_by}
-Дата и время удаления: {delete_time}
-Тип удаления: {"Мягкое удаление (можно восстановить)" if is_soft_delete else "Окончательное удаление"}
+        if current_app.config.get("DELETION_DIGEST_MINUTES", 0) > 0:
+            db.session.add(DeletionNotice(
+                recipient=recipient_email,
+                entity_type=entity_type,
+                entity_name=entity_name,
+                deleted_by=deleted_by,
+                is_soft_delete=is_soft_delete,
+            ))
+            db.session.commit()
+            logger.info("Уведомление об удалении ожидает сводки для %s", recipient_email)
+            return True
 
-Вы можете просмотреть удаленные объекты в разделе "Удалено" системы.
+        body = _deletion_body(entity_type, entity_name, deleted_by, is_soft_delete, datetime.now(timezone.utc))
+        queue_email(recipient_email, f"Уведомление об удалении: {entity_type}", body)
+        logger.info("Уведомление об удалении поставлено в очередь для %s", recipient_email)
+        return True
 
----
-Это автоматическое уведомление от системы Device Accounting.
-"""
-        
-        msg.attach(MIMEText(body, "plain", "utf-8"))
-        
-        # Отправляем письмо
-        try:
-            # Порт 465 использует SSL/TLS с самого начала
-            if smtp_port == 465:
-                server = smtplib.SMTP_SSL(smtp_host, smtp_port)
-            else:
-                # Порт 587 и другие используют STARTTLS
-                server = smtplib.SMTP(smtp_host, smtp_port)
-                if smtp_port == 587:
-                    server.starttls()
-            
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
-            server.quit()
-            
-            logger.info("Уведомление об удалении отправлено на %s", recipient_email)
-            return True
-        except Exception as e:
-            logger.error("Ошибка при отправке email уведомления: %s", str(e), exc_info=True)
-            return False
-            
     except Exception as e:
         logger.error("Ошибка при подготовке email уведомления: %s", str(e), exc_info=True)
         return False
-
@@ -0,0 +1,221 @@
+"""Импорт сотрудников из Excel.
+
+Дубликаты (ФИО, email, телефон, Telegram) ищутся по множествам ключей,
+загруженным один раз на импорт и пополняемым строками файла, — так за один
+проход ловятся повторы и внутри файла, и относительно базы. Окончательную
+гарантию дают регистронезависимые уникальные индексы (см. models.py).
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models import Employee, Location
+from ..utils import get_or_create_location
+from .audit_capture import annotate_audit
+from .excel import ImportResult, ProgressCallback, cell, chunked, get_chunk_size, iter_excel_rows
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_email(value: str) -> str:
+    return (value or "").strip().lower()
+
+
+def normalize_phone(value: str) -> str:
+    return (value or "").strip()
+
+
+def normalize_telegram(value: str | None) -> str | None:
+    if not value:
+        return None
+    sanitized = value.strip()
+    if not sanitized:
+        return None
+    if not sanitized.startswith("@"):
+        sanitized = f"@{sanitized}"
+    return sanitized.lower()
+
+
+def name_key(first_name: str, last_name: str, middle_name: str | None) -> tuple[str, str, str]:
+    """Ключ ФИО в том же виде, что и индекс uq_employees_name_ci."""
+    return (last_name.lower(), first_name.lower(), (middle_name or "").lower())
+
+
+@dataclass
+class EmployeeKeys:
+    """Множества уникальных ключей сотрудников (в нижнем регистре), включая удалённых."""
+
+    names: set[tuple[str, str, str]] = field(default_factory=set)
+    emails: set[str] = field(default_factory=set)
+    phones: set[str] = field(default_factory=set)
+    telegrams: set[str] = field(default_factory=set)
+
+    @classmethod
+    def load(cls) -> "EmployeeKeys":
+        keys = cls()
+        rows = db.session.query(
+            Employee.first_name,
+            Employee.last_name,
+            Employee.middle_name,
+            Employee.email,
+            Employee.phone,
+            Employee.telegram,
+        )
+        for first_name, last_name, middle_name, email, phone, telegram in rows:
+            keys.names.add(name_key(first_name, last_name, middle_name))
+            keys.emails.add(email.lower())
+            keys.phones.add(phone.lower())
+            if telegram:
+                keys.telegrams.add(telegram.lower())
+        return keys
+
+    def duplicate_error(self, employee: Employee) -> str | None:
+        if name_key(employee.first_name, employee.last_name, employee.middle_name) in self.names:
+            return f"сотрудник {employee.last_name} {employee.first_name} уже существует"
+        if employee.email.lower() in self.emails:
+            return f"email {employee.email} уже используется"
+        if employee.phone.lower() in self.phones:
+            return f"телефон {employee.phone} уже используется"
+        if employee.telegram and employee.telegram.lower() in self.telegrams:
+            return f"Telegram {employee.telegram} уже используется"
+        return None
+
+    def add(self, employee: Employee) -> None:
+        self.names.add(name_key(employee.first_name, employee.last_name, employee.middle_name))
+        self.emails.add(employee.email.lower())
+        self.phones.add(employee.phone.lower())
+        if employee.telegram:
+            self.telegrams.add(employee.telegram.lower())
+
+
+def _parse_employee(row_num: int, row: tuple, result: ImportResult) -> tuple[Employee, str] | None:
+    """
+    Разбирает строку файла сотрудников.
+
+    Колонки: Фамилия, Имя, Отчество, Должность, Email, Телефон, Telegram, Локация.
+    Возвращает несохранённого сотрудника и название его локации.
+    """
+    last_name = cell(row, 0)
+    first_name = cell(row, 1)
+    middle_name = cell(row, 2)
+    position = cell(row, 3)
+    email = normalize_email(cell(row, 4)) or None
+    phone = normalize_phone(cell(row, 5)) or None
+    telegram = normalize_telegram(cell(row, 6))
+    location_name = cell(row, 7)
+
+    # Валидация обязательных полей
+    if not last_name or not first_name:
+        result.error(row_num, "отсутствуют имя или фамилия")
+        return None
+    if not position:
+        result.error(row_num, "отсутствует должность")
+        return None
+    if not email:
+        result.error(row_num, "отсутствует email")
+        return None
+    if not phone:
+        result.error(row_num, "отсутствует телефон")
+        return None
+    if not location_name:
+        result.error(row_num, "отсутствует локация")
+        return None
+
+    employee = Employee(
+        first_name=first_name,
+        last_name=last_name,
+        middle_name=middle_name,
+        position=position,
+        email=email,
+        phone=phone,
+        telegram=telegram,
+    )
+    return employee, location_name
+
+
+def _add_employees(employees: list[Employee]) -> None:
+    for employee in employees:
+        annotate_audit(employee, imported=True)
+    db.session.add_all(employees)
+    db.session.flush()
+
+
+def _write_batch(batch: list[tuple[int, Employee]], result: ImportResult) -> int:
+    """
+    Записывает пачку одним flush в savepoint; записи audit log вставляет
+    слушатель flush (services/audit_capture.py) одной пачкой.
+
+    Пачка, упавшая на уникальном индексе (например, из-за параллельной
+    вставки), повторяется построчно. Возвращает число созданных сотрудников.
+    """
+    created: list[Employee] = []
+    try:
+        with db.session.begin_nested():
+            _add_employees([employee for _, employee in batch])
+        created = [employee for _, employee in batch]
+    except IntegrityError:
+        for row_num, employee in batch:
+            try:
+                with db.session.begin_nested():
+                    _add_employees([employee])
+                created.append(employee)
+            except IntegrityError as e:
+                result.error(row_num, f"ошибка сохранения - {e.orig}")
+
+    return len(created)
+
+
+def import_employees(file_stream, progress: ProgressCallback | None = None) -> ImportResult:
+    """
+    Импортирует сотрудников из Excel пачками: один flush и одна пакетная
+    вставка audit log на пачку; после пачки вызывается progress(result).
+    """
+    result = ImportResult()
+    keys = EmployeeKeys.load()
+    locations = {name: location_id for location_id, name in db.session.query(Location.id, Location.name)}
+
+    for chunk in chunked(iter_excel_rows(file_stream), get_chunk_size()):
+        batch: list[tuple[int, Employee]] = []
+        for row_num, row in chunk:
+            # Пропускаем пустые строки
+            if not any(row):
+                continue
+            result.rows += 1
+            try:
+                parsed = _parse_employee(row_num, row, result)
+                if parsed is None:
+                    continue
+                employee, location_name = parsed
+
+                duplicate = keys.duplicate_error(employee)
+                if duplicate:
+                    result.error(row_num, duplicate)
+                    continue
+
+                # Создаем или находим локацию
+                if location_name not in locations:
+                    try:
+                        locations[location_name] = get_or_create_location(location_name).id
+                    except ValueError as e:
+                        result.error(row_num, str(e))
+                        continue
+                employee.location_id = locations[location_name]
+            except Exception as e:
+                result.error(row_num, f"ошибка обработки - {str(e)}")
+                logger.exception("Ошибка импорта сотрудника из строки %s", row_num)
+                continue
+
+            keys.add(employee)
+            batch.append((row_num, employee))
+
+        if batch:
+            result.created += _write_batch(batch, result)
+        if progress:
+            progress(result)
+
+    db.session.commit()
+    return result
@@ -0,0 +1,98 @@
+"""Поиск сотрудников для автодополнения в формах.
+
+Каждое слово запроса должно совпасть префиксом с фамилией, именем,
+отчеством, email или Telegram (без учёта регистра), поэтому "иван пет"
+находит "Петров Иван". Сравнение LIKE 'слово%' по lower(колонка) использует
+префиксные индексы ix_employees_*_prefix. Встроенный lower() SQLite меняет
+регистр только у латиницы, поэтому на SQLite колонка приводится функцией
+unicode_lower (str.lower), которая регистрируется на каждом соединении.
+"""
+from __future__ import annotations
+
+import sqlite3
+
+from sqlalchemy import and_, event, func, or_, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import aliased
+
+from ..extensions import db
+from ..models import EMPLOYEE_SEARCH_COLUMNS, Employee, Location
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+MAX_TERMS = 4
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _unicode_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def _register_sqlite_functions(dbapi_connection, connection_record) -> None:
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function("unicode_lower", 1, _unicode_lower, deterministic=True)
+
+
+def register_employee_search_functions() -> None:
+    """Регистрирует unicode_lower на новых соединениях SQLite."""
+    if not event.contains(Engine, "connect", _register_sqlite_functions):
+        event.listen(Engine, "connect", _register_sqlite_functions)
+
+
+def _term_condition(term: str):
+    lower = func.unicode_lower if db.session.get_bind().dialect.name == "sqlite" else func.lower
+    conditions = []
+    for name in EMPLOYEE_SEARCH_COLUMNS:
+        prefix = term
+        # Telegram хранится с '@': ищем и по "@ivan", и по "ivan"
+        if name == "telegram" and not prefix.startswith("@"):
+            prefix = f"@{prefix}"
+        conditions.append(
+            lower(getattr(Employee, name)).like(f"{_escape_like(prefix)}%", escape="\\")
+        )
+    return or_(*conditions)
+
+
+def search_employees(query: str, limit: int = DEFAULT_LIMIT) -> list[dict]:
+    """
+    Ищет не удалённых сотрудников по префиксам слов запроса.
+
+    Returns:
+        list: не более limit словарей id, full_name, position, email, telegram, location
+    """
+    terms = query.lower().split()[:MAX_TERMS]
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    location = aliased(Location)
+    rows = db.session.execute(
+        select(
+            Employee.id,
+            Employee.last_name,
+            Employee.first_name,
+            Employee.middle_name,
+            Employee.position,
+            Employee.email,
+            Employee.telegram,
+            location.name,
+        )
+        .outerjoin(location, Employee.location_id == location.id)
+        .where(Employee.deleted_at.is_(None), and_(*(_term_condition(term) for term in terms)))
+        .order_by(Employee.last_name, Employee.first_name, Employee.middle_name, Employee.id)
+        .limit(limit)
+    )
+    return [
+        {
+            "id": employee_id,
+            "full_name": " ".join(part for part in (last_name, first_name, middle_name) if part),
+            "position": position,
+            "email": email,
+            "telegram": telegram,
+            "location": location_name,
+        }
+        for employee_id, last_name, first_name, middle_name, position, email, telegram, location_name in rows
+    ]
@@ -0,0 +1,96 @@
+"""Общие помощники потокового чтения и записи Excel-файлов для импорта и отчётов."""
+from __future__ import annotations
+
+import tempfile
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import IO, Callable, Iterable, Iterator
+
+from flask import current_app
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def iter_excel_rows(file_stream, min_row: int = 2) -> Iterator[tuple[int, tuple]]:
+    """Построчно читает активный лист без загрузки книги в память целиком."""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file_stream, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        for row_num, row in enumerate(ws.iter_rows(min_row=min_row, values_only=True), start=min_row):
+            yield row_num, row
+    finally:
+        wb.close()
+
+
+def count_excel_rows(file_stream, min_row: int = 2) -> int | None:
+    """Оценка числа строк данных по размеру листа (без чтения строк); None, если размер неизвестен."""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file_stream, read_only=True, data_only=True)
+    try:
+        max_row = wb.active.max_row
+    finally:
+        wb.close()
+    if max_row is None:
+        return None
+    return max(max_row - min_row + 1, 0)
+
+
+def write_xlsx(header: list[str], rows: Iterable[Iterable], title: str = "Sheet") -> IO[bytes]:
+    """
+    Записывает строки в книгу write_only (память не растёт с числом строк).
+
+    Returns:
+        Временный файл с книгой, позиционированный на начало
+    """
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(header)
+    for row in rows:
+        ws.append(list(row))
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    wb.save(output)
+    output.seek(0)
+    return output
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def cell(row: tuple, index: int) -> str | None:
+    """Значение ячейки как обрезанная строка; пустые и отсутствующие ячейки -> None."""
+    if index >= len(row) or row[index] is None:
+        return None
+    value = str(row[index]).strip()
+    return value or None
+
+
+def get_chunk_size() -> int:
+    return current_app.config.get("IMPORT_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: list[str] = field(default_factory=list)
+    # Те же ошибки с номером строки отдельно — для отчёта фонового импорта
+    row_errors: list[tuple[int, str]] = field(default_factory=list)
+
+    def error(self, row_num: int, message: str) -> None:
+        self.errors.append(f"Строка {row_num}: {message}")
+        self.row_errors.append((row_num, message))
+        self.skipped += 1
+
+
+# Вызывается после каждой записанной пачки с накопленным результатом
+ProgressCallback = Callable[[ImportResult], None]
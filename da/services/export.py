@@ -0,0 +1,217 @@
+"""Потоковая выгрузка списков в CSV и Excel.
+
+Строки читаются из БД порциями (yield_per, на PostgreSQL — серверный курсор)
+в виде кортежей колонок, без загрузки ORM-объектов. CSV отдаётся клиенту по
+мере формирования; xlsx пишется в режиме write_only во временный файл
+(память не растёт, большие книги уходят на диск) и отдаётся частями.
+Фильтры совпадают со страницами списков.
+"""
+from __future__ import annotations
+
+import csv
+import enum
+import io
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator
+
+from flask import Response, send_file, stream_with_context
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from ..extensions import db
+from ..models import (
+    AuditLog,
+    Device,
+    DeviceType,
+    Employee,
+    Location,
+    User,
+    Warehouse,
+)
+from .audit_list import AuditListParams, apply_audit_filters
+from .counters import get_counts
+from .device_list import SORT_OPTIONS, DeviceListParams, filtered_devices_query
+from .excel import write_xlsx
+
+EXPORT_BATCH_SIZE = 1000
+CSV_FLUSH_ROWS = 500
+FORMATS = ("csv", "xlsx")
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@dataclass
+class Export:
+    """Выгрузка: имя файла (без расширения), заголовок и генератор строк."""
+
+    name: str
+    header: list[str]
+    rows: Callable[[], Iterable[Iterable[Any]]]
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _stream(statement) -> Iterator[tuple]:
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for row in result:
+        yield tuple(_cell(value) for value in row)
+
+
+def iter_csv(header: list[str], rows: Iterable[Iterable[Any]]) -> Iterator[str]:
+    """CSV (UTF-8 с BOM для Excel) частями по CSV_FLUSH_ROWS строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(header)
+    for index, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if index % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_response(export: Export, fmt: str) -> Response:
+    """HTTP-ответ с выгрузкой в формате csv или xlsx."""
+    filename = f"{export.name}_{datetime.now():%Y%m%d_%H%M}.{fmt}"
+    if fmt == "xlsx":
+        return send_file(
+            write_xlsx(export.header, export.rows(), title=export.name),
+            mimetype=XLSX_MIMETYPE,
+            as_attachment=True,
+            download_name=filename,
+        )
+    return Response(
+        stream_with_context(iter_csv(export.header, export.rows())),
+        mimetype="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def devices_export(params: DeviceListParams) -> Export:
+    """Девайсы с фильтрами и сортировкой списка (курсор страницы не учитывается)."""
+    column, descending = SORT_OPTIONS[params.sort]
+    order = (column.desc(), Device.id.desc()) if descending else (column.asc(), Device.id.asc())
+    device_location = aliased(Location)
+    statement = (
+        filtered_devices_query(params)
+        .outerjoin(DeviceType, Device.type_id == DeviceType.id)
+        .outerjoin(device_location, Device.location_id == device_location.id)
+        .outerjoin(Warehouse, Device.warehouse_id == Warehouse.id)
+        .outerjoin(Employee, Device.owner_id == Employee.id)
+        .with_entities(
+            Device.inventory_number,
+            Device.model,
+            DeviceType.name,
+            Device.serial_number,
+            Device.status,
+            device_location.name,
+            Warehouse.name,
+            func.trim(
+                Employee.last_name + " " + Employee.first_name + " " + func.coalesce(Employee.middle_name, "")
+            ),
+            Device.notes,
+            Device.created_at,
+        )
+        .order_by(*order)
+        .statement
+    )
+    return Export(
+        name="devices",
+        header=[
+            "Инвентарный номер",
+            "Модель",
+            "Тип",
+            "Серийный номер",
+            "Статус",
+            "Локация",
+            "Склад",
+            "Сотрудник",
+            "Примечания",
+            "Создан",
+        ],
+        rows=lambda: _stream(statement),
+    )
+
+
+def employees_export() -> Export:
+    """Не удалённые сотрудники в порядке списка, с числом девайсов из счётчиков."""
+    statement = (
+        select(
+            Employee.id,
+            Employee.last_name,
+            Employee.first_name,
+            Employee.middle_name,
+            Employee.position,
+            Employee.email,
+            Employee.phone,
+            Employee.telegram,
+            Location.name,
+        )
+        .outerjoin(Location, Employee.location_id == Location.id)
+        .where(Employee.deleted_at.is_(None))
+        .order_by(Employee.last_name, Employee.first_name, Employee.middle_name, Employee.id)
+    )
+
+    def rows() -> Iterator[tuple]:
+        device_counts = get_counts("owner")
+        for employee_id, *values in _stream(statement):
+            yield (*values, device_counts.get(employee_id, 0))
+
+    return Export(
+        name="employees",
+        header=["Фамилия", "Имя", "Отчество", "Должность", "Email", "Телефон", "Telegram", "Локация", "Девайсов"],
+        rows=rows,
+    )
+
+
+def warehouses_export() -> Export:
+    statement = (
+        select(Warehouse.id, Warehouse.name, Location.name)
+        .outerjoin(Location, Warehouse.location_id == Location.id)
+        .where(Warehouse.deleted_at.is_(None))
+        .order_by(Warehouse.name, Warehouse.id)
+    )
+
+    def rows() -> Iterator[tuple]:
+        device_counts = get_counts("warehouse")
+        for warehouse_id, *values in _stream(statement):
+            yield (*values, device_counts.get(warehouse_id, 0))
+
+    return Export(name="warehouses", header=["Название", "Локация", "Девайсов"], rows=rows)
+
+
+def audit_export(params: AuditListParams) -> Export:
+    """Записи audit log (новые сверху) с теми же фильтрами, что страница истории."""
+    statement = (
+        select(
+            AuditLog.created_at,
+            User.full_name,
+            User.email,
+            AuditLog.action,
+            AuditLog.entity_type,
+            AuditLog.entity_id,
+            AuditLog.entity_name,
+            AuditLog.changes,
+            AuditLog.ip_address,
+        )
+        .join(User, AuditLog.user_id == User.id)
+        .order_by(AuditLog.created_at.desc(), AuditLog.id.desc())
+    )
+    statement = apply_audit_filters(statement, params)
+    return Export(
+        name="audit_log",
+        header=["Дата/Время", "Пользователь", "Email", "Действие", "Тип объекта", "ID", "Объект", "Изменения", "IP"],
+        rows=lambda: _stream(statement),
+    )
@@ -0,0 +1,289 @@
+"""Фоновые задачи импорта из Excel.
+
+Загруженный файл сохраняется в import_jobs, задача выполняется в пуле потоков
+приложения (IMPORT_WORKERS) или командой `flask import-jobs` из отдельного
+процесса. Прогресс и ошибки строк фиксируются после каждой пачки, поэтому
+страница задачи может опрашивать состояние, а полный отчёт об ошибках доступен
+для скачивания. Пачки коммитятся по мере обработки: при падении задачи уже
+записанные строки остаются в базе.
+
+Задача захватывается одним условным UPDATE (PENDING -> RUNNING), поэтому пул
+приложения и `flask import-jobs` не выполнят её дважды. Выполняющаяся задача
+отмечает heartbeat_at после каждой пачки; задача RUNNING без отметки дольше
+IMPORT_JOB_STALE_SECONDS (воркер умер) переводится в FAILED reap_stale_jobs.
+Повторно такая задача не запускается: часть пачек уже закоммичена.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import Callable, Iterator
+
+from flask import Flask, current_app
+from sqlalchemy import func, update
+
+from ..extensions import db
+from ..models import ImportJob, ImportJobError, ImportJobStatus, utcnow
+from .audit import audit_actor
+from .device_import import import_new_devices
+from .employee_import import import_employees
+from .excel import ImportResult, count_excel_rows
+from .metrics import observe_import_job
+
+logger = logging.getLogger(__name__)
+
+# Вид импорта -> функция импорта (file_stream, progress) -> ImportResult
+IMPORTERS: dict[str, Callable[..., ImportResult]] = {
+    "devices": import_new_devices,
+    "employees": import_employees,
+}
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers: int) -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import-job")
+        return _executor
+
+
+def create_import_job(kind: str, filename: str, data: bytes, user_id: int,
+                      ip_address: str | None = None, user_agent: str | None = None) -> ImportJob:
+    """Сохраняет загруженный файл как задачу импорта в статусе PENDING."""
+    if kind not in IMPORTERS:
+        raise ValueError(f"Неизвестный вид импорта: {kind}")
+    job = ImportJob(
+        kind=kind,
+        filename=filename,
+        file_data=data,
+        user_id=user_id,
+        ip_address=ip_address,
+        user_agent=user_agent,
+    )
+    db.session.add(job)
+    db.session.commit()
+    logger.info("Создана задача импорта %s (%s, %s)", job.id, kind, filename)
+    return job
+
+
+def enqueue_import_job(job_id: int) -> None:
+    """
+    Ставит задачу в пул потоков приложения.
+
+    При IMPORT_WORKERS = 0 задача выполняется сразу в текущем потоке
+    (тесты, отладка без фоновых потоков).
+    """
+    reap_stale_jobs()
+    workers = current_app.config.get("IMPORT_WORKERS", 2)
+    if workers <= 0:
+        run_import_job(job_id)
+        return
+    app = current_app._get_current_object()
+    _get_executor(workers).submit(_run_in_app_context, app, job_id)
+
+
+def _run_in_app_context(app: Flask, job_id: int) -> None:
+    with app.app_context():
+        try:
+            run_import_job(job_id)
+        finally:
+            db.session.remove()
+
+
+def _record_progress(job: ImportJob, result: ImportResult, errors_saved: int) -> int:
+    """Переносит накопленный результат в задачу и дописывает новые ошибки строк."""
+    job.processed_rows = result.rows
+    job.created_count = result.created
+    job.updated_count = result.updated
+    job.skipped_count = result.skipped
+    job.error_count = len(result.row_errors)
+    new_errors = result.row_errors[errors_saved:]
+    if new_errors:
+        db.session.connection().execute(
+            ImportJobError.__table__.insert(),
+            [{"job_id": job.id, "row_num": row_num, "message": message} for row_num, message in new_errors],
+        )
+    return len(result.row_errors)
+
+
+def _claim_job(job_id: int) -> bool:
+    """Атомарно переводит задачу из PENDING в RUNNING; False, если её уже взял другой воркер."""
+    now = utcnow()
+    claimed = db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job_id, ImportJob.status == ImportJobStatus.PENDING)
+        .values(status=ImportJobStatus.RUNNING, started_at=now, heartbeat_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    db.session.commit()
+    return claimed
+
+
+def reap_stale_jobs(stale_seconds: int | None = None) -> int:
+    """Переводит в FAILED задачи RUNNING без отметки прогресса дольше stale_seconds."""
+    if stale_seconds is None:
+        stale_seconds = current_app.config.get("IMPORT_JOB_STALE_SECONDS", 900)
+    now = utcnow()
+    reaped = db.session.execute(
+        update(ImportJob)
+        .where(
+            ImportJob.status == ImportJobStatus.RUNNING,
+            func.coalesce(ImportJob.heartbeat_at, ImportJob.started_at) < now - timedelta(seconds=stale_seconds),
+        )
+        .values(
+            status=ImportJobStatus.FAILED,
+            error_message="Импорт прерван: обработчик задачи остановился",
+            finished_at=now,
+            file_data=None,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if reaped:
+        logger.warning("Задачи импорта без прогресса дольше %s с переведены в FAILED: %s", stale_seconds, reaped)
+    return reaped
+
+
+def run_import_job(job_id: int) -> None:
+    """Выполняет задачу импорта, коммитя данные и прогресс после каждой пачки."""
+    if not _claim_job(job_id):
+        return
+    job = db.session.get(ImportJob, job_id)
+    # Статус и время старта записаны в обход ORM
+    db.session.refresh(job)
+
+    data = job.file_data
+    started = time.monotonic()
+    try:
+        job.total_rows = count_excel_rows(BytesIO(data))
+    except Exception:
+        logger.warning("Не удалось оценить размер файла задачи импорта %s", job_id)
+    db.session.commit()
+
+    errors_saved = 0
+
+    def progress(result: ImportResult) -> None:
+        nonlocal errors_saved
+        errors_saved = _record_progress(job, result, errors_saved)
+        job.heartbeat_at = utcnow()
+        db.session.commit()
+
+    importer = IMPORTERS[job.kind]
+    try:
+        with audit_actor(job.user_id, job.ip_address, job.user_agent):
+            result = importer(BytesIO(data), progress=progress)
+    except Exception as e:
+        db.session.rollback()
+        job.status = ImportJobStatus.FAILED
+        job.error_message = str(e)
+        logger.exception("Ошибка задачи импорта %s", job_id)
+    else:
+        errors_saved = _record_progress(job, result, errors_saved)
+        job.status = ImportJobStatus.DONE
+        logger.info(
+            "Задача импорта %s завершена: добавлено %s, пропущено %s",
+            job_id,
+            result.created,
+            result.skipped,
+        )
+    job.finished_at = utcnow()
+    job.file_data = None
+    observe_import_job(job.kind, job.status.value, job.processed_rows or 0, time.monotonic() - started)
+    db.session.commit()
+
+
+def run_pending_jobs() -> int:
+    """Выполняет все ожидающие задачи в текущем процессе; возвращает их число."""
+    reap_stale_jobs()
+    job_ids = [
+        job_id
+        for (job_id,) in db.session.query(ImportJob.id)
+        .filter(ImportJob.status == ImportJobStatus.PENDING)
+        .order_by(ImportJob.id)
+    ]
+    for job_id in job_ids:
+        run_import_job(job_id)
+    return len(job_ids)
+
+
+@dataclass
+class JobProgress:
+    """Снимок прогресса задачи для страницы и JSON-эндпоинта."""
+
+    job: ImportJob
+
+    @property
+    def elapsed(self) -> float:
+        if self.job.started_at is None:
+            return 0.0
+        finished = self.job.finished_at or datetime.now(timezone.utc)
+        started = self.job.started_at
+        # SQLite возвращает naive datetime
+        if started.tzinfo is None:
+            finished = finished.replace(tzinfo=None)
+        return max((finished - started).total_seconds(), 0.0)
+
+    @property
+    def rows_per_second(self) -> float | None:
+        elapsed = self.elapsed
+        if not elapsed or not self.job.processed_rows:
+            return None
+        return self.job.processed_rows / elapsed
+
+    @property
+    def percent(self) -> int | None:
+        if self.job.status == ImportJobStatus.DONE:
+            return 100
+        if not self.job.total_rows:
+            return None
+        return min(int(self.job.processed_rows * 100 / self.job.total_rows), 99)
+
+    @property
+    def eta_seconds(self) -> float | None:
+        rate = self.rows_per_second
+        if self.job.is_finished or not rate or not self.job.total_rows:
+            return None
+        return max(self.job.total_rows - self.job.processed_rows, 0) / rate
+
+    def as_dict(self) -> dict:
+        job = self.job
+        rate = self.rows_per_second
+        eta = self.eta_seconds
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "status": job.status.value,
+            "finished": job.is_finished,
+            "filename": job.filename,
+            "total_rows": job.total_rows,
+            "processed_rows": job.processed_rows,
+            "created": job.created_count,
+            "updated": job.updated_count,
+            "skipped": job.skipped_count,
+            "errors": job.error_count,
+            "percent": self.percent,
+            "rows_per_second": round(rate, 1) if rate else None,
+            "eta_seconds": round(eta) if eta is not None else None,
+            "elapsed_seconds": round(self.elapsed, 1),
+            "error_message": job.error_message,
+        }
+
+
+def iter_job_errors(job: ImportJob, batch_size: int = 1000) -> Iterator[tuple[int, str]]:
+    """Ошибки строк задачи по порядку, порциями (для потоковой выгрузки отчёта)."""
+    query = (
+        db.session.query(ImportJobError.row_num, ImportJobError.message)
+        .filter(ImportJobError.job_id == job.id)
+        .order_by(ImportJobError.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for row_num, message in query:
+        yield row_num, message
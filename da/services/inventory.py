@@ -12,10 +12,9 @@ from ..models import (
     DeviceStatus,
     HistoryEvent,
     Location,
-    Employee,
     DeviceType,
-    Warehouse,
 )
+from .reference_data import get_locations
 
 logger = logging.getLogger(__name__)
 
@@ -30,12 +29,18 @@ class InventoryService:
         location_id: int | None = None,
         serial_number: str | None = None,
         notes: str | None = None,
+        warehouse_id: int | None = None,
+        owner_id: int | None = None,
+        status: DeviceStatus = DeviceStatus.IN_STOCK,
     ) -> Device:
         device = Device(
             inventory_number=inventory_number.strip(),
             model=model.strip(),
             type_id=type_id,
             location_id=location_id,
+            warehouse_id=warehouse_id,
+            owner_id=owner_id,
+            status=status,
             serial_number=serial_number.strip() if serial_number else None,
             notes=notes,
         )
@@ -73,12 +78,18 @@ class InventoryService:
 
     @staticmethod
     def _log(device: Device, event: HistoryEvent, note: str | None = None) -> None:
+        # Имя локации берём из кэша справочников, а не ленивой загрузкой device.location
+        location_names = {location.id: location.name for location in get_locations()}
+        from_location = location_names.get(device.location_id)
+        if from_location is None and device.location_id is not None:
+            from_location = device.location.name  # локация удалена и не попала в кэш
         history = DeviceHistory(
             device=device,
             event=event,
             note=note,
-            from_location=device.location.name if device.location else None,
-            actor=device.owner.full_name if device.owner else None,
+            from_location=from_location,
+            # Владелец обычно уже в сессии (загружен маршрутом): many-to-one без запроса
+            actor=device.owner.full_name if device.owner_id else None,
         )
         db.session.add(history)
         logger.debug(
@@ -90,97 +101,83 @@ class InventoryService:
 
     @staticmethod
     def import_devices_from_excel(file_stream) -> dict:
-        import openpyxl
-
-        wb = openpyxl.load_workbook(file_stream)
-        sheet = wb.active
-
-        created = 0
-        updated = 0
-        errors = []
-
-        # Пропускаем заголовок
-        for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                # Ожидаем колонки:
-                # 0: Inv Number, 1: Model, 2: Type, 3: Location, 4: Serial, 5: Notes, 6: Employee
-                if not row[0]:  # Пропускаем пустые строки
+        from .device_import import ImportLookups, write_chunk
+        from .excel import ImportResult, cell, chunked, get_chunk_size, iter_excel_rows
+
+        lookups = ImportLookups.load(include_deleted=True)
+        result = ImportResult()
+
+        for chunk in chunked(iter_excel_rows(file_stream), get_chunk_size()):
+            # Ожидаем колонки:
+            # 0: Inv Number, 1: Model, 2: Type, 3: Location, 4: Serial, 5: Notes, 6: Employee
+            batch: dict[str, tuple[int, dict]] = {}
+            for row_idx, row in chunk:
+                if not cell(row, 0):  # Пропускаем пустые строки
                     continue
+                try:
+                    values = InventoryService._import_values(row, lookups)
+                except Exception as e:
+                    result.errors.append(f"Строка {row_idx}: {str(e)}")
+                    logger.error(f"Ошибка импорта строки {row_idx}: {e}")
+                    continue
+                # Повтор номера в пачке: как и при построчной обработке, побеждает последняя строка
+                batch.pop(values["inventory_number"], None)
+                batch[values["inventory_number"]] = (row_idx, values)
 
-                inv_num = str(row[0]).strip()
-                model = str(row[1]).strip() if len(row) > 1 and row[1] else "Unknown Model"
-                type_name = str(row[2]).strip() if len(row) > 2 and row[2] else "Other"
-                loc_name = str(row[3]).strip() if len(row) > 3 and row[3] else "Склад"
-                serial = str(row[4]).strip() if len(row) > 4 and row[4] else None
-                notes = str(row[5]).strip() if len(row) > 5 and row[5] else None
-                emp_name = str(row[6]).strip() if len(row) > 6 and row[6] else None
-
-                # Находим или создаем тип и локацию
-                dtype = DeviceType.query.filter_by(name=type_name).first()
-                if not dtype:
-                    dtype = DeviceType(name=type_name)
-                    db.session.add(dtype)
-
-                location = Location.query.filter_by(name=loc_name).first()
-                if not location:
-                    location = Location(name=loc_name)
-                    db.session.add(location)
-
-                # Ищем сотрудника, если указан
-                owner = None
-                if emp_name:
-                    # Пробуем найти по email или имени
-                    owner = Employee.query.filter(
-                        (Employee.email == emp_name) | (Employee.full_name == emp_name)
-                    ).first()
-
-                # Ищем существующий девайс
-                device = Device.query.filter_by(inventory_number=inv_num).first()
-
-                if device:
-                    device.model = model
-                    device.type = dtype
-                    device.serial_number = serial
-                    device.notes = notes
-                    
-                    if owner:
-                        device.owner = owner
-                        device.location_id = None
-                    elif location:
-                        device.location = location
-                        # Если переносим на локацию и сотрудника в файле нет, 
-                        # то оставляем владельца как есть? Или снимаем?
-                        # Для безопасности: если колонка сотрудника пустая, владельца НЕ трогаем.
-                        # Только если явно указана локация Склад и нет владельца?
-                        pass
-
-                    updated += 1
-                    InventoryService._log(device, HistoryEvent.UPDATED, "Импорт из Excel")
-                else:
-                    device = Device(
-                        inventory_number=inv_num,
-                        model=model,
-                        type_id=dtype.id,
-                        location_id=location.id if not owner else None,
-                        owner_id=owner.id if owner else None,
-                        serial_number=serial,
-                        notes=notes
-                    )
-                    db.session.add(device)
-                    created += 1
-                    InventoryService._log(device, HistoryEvent.CREATED, "Импорт из Excel")
-
-                db.session.flush()
-
-            except Exception as e:
-                errors.append(f"Строка {row_idx}: {str(e)}")
-                logger.error(f"Ошибка импорта строки {row_idx}: {e}")
+            outcome = write_chunk(list(batch.values()), lookups, update_existing=True, result=result)
+            result.created += len(outcome.created)
+            result.updated += len(outcome.updated)
 
         db.session.commit()
-        return {"created": created, "updated": updated, "errors": errors}
-
-
-
-
-
+        return {"created": result.created, "updated": result.updated, "errors": result.errors}
 
+    @staticmethod
+    def _import_values(row: tuple, lookups) -> dict:
+        """Значения колонок девайса для строки импорта; недостающие типы и локации создаются."""
+        from .excel import cell
+
+        inv_num = cell(row, 0)
+        model = cell(row, 1) or "Unknown Model"
+        type_name = cell(row, 2) or "Other"
+        loc_name = cell(row, 3) or "Склад"
+        emp_name = cell(row, 6)
+
+        # Находим или создаем тип и локацию
+        type_id = lookups.types.get(type_name.lower())
+        if type_id is None:
+            dtype = DeviceType(name=type_name)
+            db.session.add(dtype)
+            db.session.flush()
+            type_id = lookups.types[type_name.lower()] = dtype.id
+
+        location_id = lookups.locations.get(loc_name.lower())
+        if location_id is None:
+            location = Location(name=loc_name)
+            db.session.add(location)
+            db.session.flush()
+            location_id = lookups.locations[loc_name.lower()] = location.id
+            lookups.location_names[location_id] = loc_name
+
+        # Ищем сотрудника по email или ФИО, если указан.
+        # Если колонка сотрудника пустая, владельца существующего девайса НЕ трогаем.
+        owner = None
+        if emp_name:
+            owner = lookups.employees_by_email.get(emp_name.lower()) or lookups.employees_by_full_name.get(
+                emp_name.lower()
+            )
+        owner_id = owner[0] if owner else None
+        if owner:
+            # Как при выдаче: локация девайса — локация сотрудника
+            location_id = owner[1]
+
+        return {
+            "inventory_number": inv_num,
+            "model": model,
+            "type_id": type_id,
+            "serial_number": cell(row, 4),
+            "notes": cell(row, 5),
+            "location_id": location_id,
+            "owner_id": owner_id,
+            "warehouse_id": None,
+            "status": DeviceStatus.ASSIGNED if owner_id else DeviceStatus.IN_STOCK,
+        }
@@ -0,0 +1,179 @@
+"""Метрики приложения в формате Prometheus (GET /metrics).
+
+Метрики HTTP (латентность по endpoint, запросы в работе), пула соединений,
+числа SQL-запросов (из services/query_stats.py), импорта, очереди audit log
+и очереди писем. Значения, относящиеся к процессу (пул, очередь audit log),
+обновляются в конце каждого запроса; размер очереди писем читается из БД
+при сборе метрик.
+
+Несколько процессов gunicorn: переменная окружения PROMETHEUS_MULTIPROC_DIR
+должна указывать на общий пустой каталог до запуска воркеров (prometheus_client
+читает её при импорте), тогда /metrics любого воркера отдаёт сумму по всем
+процессам. gunicorn.conf.py в корне проекта задаёт каталог по умолчанию,
+очищает его при старте и подключает child_exit из этого модуля, чтобы данные
+завершившихся воркеров не учитывались в gauge.
+
+/metrics отдаётся только с заголовком Authorization: Bearer <METRICS_TOKEN>;
+без METRICS_TOKEN эндпоинт закрыт (403).
+"""
+from __future__ import annotations
+
+import hmac
+import logging
+import os
+import time
+
+from flask import Flask, Response, abort, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import func, select
+
+from ..extensions import db
+from ..models import EmailOutbox, EmailStatus
+from .audit_writer import get_audit_writer_stats
+from .query_stats import current_query_stats
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+REQUEST_LATENCY = Histogram(
+    "da_http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["endpoint", "method"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS = Counter("da_http_requests_total", "HTTP-запросы", ["endpoint", "method", "status"])
+IN_PROGRESS = Gauge(
+    "da_http_requests_in_progress", "HTTP-запросы в обработке", multiprocess_mode="livesum"
+)
+DB_QUERIES = Counter("da_db_queries_total", "SQL-операторы, выполненные в HTTP-запросах", ["endpoint"])
+DB_TIME = Counter("da_db_time_seconds_total", "Время SQL-операторов в HTTP-запросах", ["endpoint"])
+DB_POOL_CHECKED_OUT = Gauge(
+    "da_db_pool_checked_out", "Соединения, выданные из пула", multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "da_db_pool_overflow", "Соединения сверх pool_size", multiprocess_mode="livesum"
+)
+AUDIT_QUEUE = Gauge(
+    "da_audit_queue_depth", "Записи audit log в буфере фонового писателя", multiprocess_mode="livesum"
+)
+EMAIL_OUTBOX = Gauge(
+    "da_email_outbox", "Письма в очереди email_outbox", ["status"], multiprocess_mode="mostrecent"
+)
+IMPORT_JOBS = Counter("da_import_jobs_total", "Завершённые задачи импорта", ["kind", "status"])
+IMPORT_ROWS = Counter("da_import_rows_total", "Обработанные строки импорта", ["kind"])
+IMPORT_DURATION = Histogram(
+    "da_import_job_duration_seconds",
+    "Длительность задачи импорта",
+    ["kind"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800),
+)
+
+
+def observe_import_job(kind: str, status: str, rows: int, seconds: float) -> None:
+    """Учитывает завершённую задачу импорта (пропускная способность — rate(da_import_rows_total))."""
+    IMPORT_JOBS.labels(kind, status).inc()
+    IMPORT_ROWS.labels(kind).inc(rows)
+    IMPORT_DURATION.labels(kind).observe(seconds)
+
+
+def _endpoint() -> str:
+    # Шаблон маршрута, а не путь: id в URL не должны порождать новые серии
+    return request.endpoint or "unmatched"
+
+
+def _start_request() -> None:
+    g.metrics_started = time.perf_counter()
+    g.metrics_in_progress = True
+    IN_PROGRESS.inc()
+
+
+def _update_process_gauges() -> None:
+    pool = db.engine.pool
+    # У пулов SQLite (StaticPool, SingletonThreadPool) счётчиков нет
+    if hasattr(pool, "checkedout"):
+        DB_POOL_CHECKED_OUT.set(pool.checkedout())
+        DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+    AUDIT_QUEUE.set(get_audit_writer_stats()["queued"])
+
+
+def _finish_request(response: Response) -> Response:
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return response
+    endpoint = _endpoint()
+    REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+    REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    stats = current_query_stats()
+    if stats is not None:
+        DB_QUERIES.labels(endpoint).inc(stats.count)
+        DB_TIME.labels(endpoint).inc(stats.total_time)
+    _update_process_gauges()
+    return response
+
+
+def _teardown_request(exception: BaseException | None) -> None:
+    # after_request не вызывается при необработанном исключении
+    if g.pop("metrics_started", None) is not None:
+        REQUESTS.labels(_endpoint(), request.method, "500").inc()
+    # Более ранний before_request мог прервать запрос до _start_request
+    if g.pop("metrics_in_progress", False):
+        IN_PROGRESS.dec()
+
+
+def _update_outbox_gauge() -> None:
+    counts = dict(
+        db.session.execute(
+            select(EmailOutbox.status, func.count())
+            .where(EmailOutbox.status != EmailStatus.SENT)
+            .group_by(EmailOutbox.status)
+        ).all()
+    )
+    for status in (EmailStatus.PENDING, EmailStatus.FAILED):
+        EMAIL_OUTBOX.labels(status.value).set(counts.get(status, 0))
+
+
+def _metrics_view(app: Flask):
+    def metrics() -> Response:
+        token = app.config.get("METRICS_TOKEN")
+        if not token or not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            abort(403)
+        try:
+            _update_outbox_gauge()
+        except Exception:
+            logger.exception("Не удалось получить размер очереди писем")
+        if os.environ.get(MULTIPROC_ENV):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+    return metrics
+
+
+def child_exit(server, worker) -> None:
+    """Хук gunicorn: убирает live-gauge завершившегося воркера из общего каталога."""
+    if os.environ.get(MULTIPROC_ENV):
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def register_metrics(app: Flask) -> None:
+    """Подключает сбор метрик и GET /metrics (METRICS_ENABLED)."""
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", _metrics_view(app), methods=["GET"])
+    if not app.config.get("METRICS_TOKEN"):
+        logger.warning("METRICS_TOKEN не задан: /metrics отвечает 403")
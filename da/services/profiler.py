@@ -0,0 +1,159 @@
+"""Выборочное профилирование HTTP-запросов cProfile.
+
+Включается PROFILER_ENABLED. Профилируется в среднем один запрос из
+PROFILER_SAMPLE_RATE (0 — выборка выключена), любой запрос к endpoint из
+PROFILER_ENDPOINTS и запрос администратора с заголовком PROFILER_HEADER: 1.
+Профиль сохраняется в <LOG_DIR>/profiles файлом .pstats, в имени которого
+время, endpoint и длительность запроса; хранятся последние PROFILER_KEEP
+файлов. Просмотр — страница /profiles (routes/profiles.py), файлы открываются
+и в snakeviz / gprof2dot.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from flask import Flask, current_app, g, request
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = "profiles"
+SORT_KEYS = ("cumulative", "tottime", "calls")
+_NAME_RE = re.compile(r"^(?P<stamp>\d{8}T\d{12})_(?P<endpoint>[\w.]+)_(?P<ms>\d+)ms_(?P<pid>\d+)\.pstats$")
+
+
+@dataclass(frozen=True)
+class ProfileFile:
+    name: str
+    endpoint: str
+    created_at: datetime
+    duration_ms: int
+    size: int
+
+
+def profile_dir(app: Flask | None = None) -> Path:
+    app = app or current_app
+    return Path(app.config["LOG_DIR"]) / PROFILE_DIR
+
+
+def _should_profile(app: Flask) -> bool:
+    endpoint = request.endpoint
+    if endpoint is None or endpoint == "static":
+        return False
+    if endpoint in app.config.get("PROFILER_ENDPOINTS", ()):
+        return True
+    header = app.config.get("PROFILER_HEADER")
+    # Заголовок принимается только от администраторов: иначе любой клиент
+    # мог бы заставить сервер профилировать каждый свой запрос
+    if header and request.headers.get(header) == "1" and current_user.is_authenticated and current_user.is_admin:
+        return True
+    rate = app.config.get("PROFILER_SAMPLE_RATE", 0)
+    return rate > 0 and random.random() * rate < 1
+
+
+def _start_request(app: Flask) -> None:
+    if not _should_profile(app):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Другой профилировщик уже активен (Python 3.12+: один на процесс)
+        return
+    g.profiler = profiler
+    g.profiler_started = time.perf_counter()
+
+
+def _rotate(directory: Path, keep: int) -> None:
+    # Имена начинаются с времени, поэтому сортировка по имени — по возрасту
+    files = sorted(directory.glob("*.pstats"))
+    for old in files[: max(len(files) - keep, 0)]:
+        # Файл мог удалить другой воркер
+        old.unlink(missing_ok=True)
+
+
+def _finish_request(app: Flask, exception: BaseException | None) -> None:
+    profiler: cProfile.Profile | None = g.pop("profiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    elapsed_ms = int((time.perf_counter() - g.pop("profiler_started")) * 1000)
+    directory = profile_dir(app)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    name = f"{stamp}_{request.endpoint}_{elapsed_ms}ms_{os.getpid()}.pstats"
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(directory / name)
+        _rotate(directory, app.config.get("PROFILER_KEEP", 200))
+    except OSError:
+        logger.exception("Не удалось сохранить профиль %s", name)
+        return
+    logger.info("Профиль запроса %s (%s мс): %s", request.endpoint, elapsed_ms, name)
+
+
+def list_profiles(directory: Path) -> list[ProfileFile]:
+    """Сохранённые профили, новые первыми."""
+    profiles = []
+    for path in directory.glob("*.pstats"):
+        match = _NAME_RE.match(path.name)
+        if match is None:
+            continue
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            continue  # удалён ротацией
+        profiles.append(
+            ProfileFile(
+                name=path.name,
+                endpoint=match["endpoint"],
+                created_at=datetime.strptime(match["stamp"], "%Y%m%dT%H%M%S%f").replace(tzinfo=timezone.utc),
+                duration_ms=int(match["ms"]),
+                size=size,
+            )
+        )
+    return sorted(profiles, key=lambda p: p.name, reverse=True)
+
+
+def profiles_by_endpoint(directory: Path, per_endpoint: int) -> dict[str, list[ProfileFile]]:
+    """Последние профили каждого endpoint; endpoint со свежими профилями первыми."""
+    grouped: dict[str, list[ProfileFile]] = defaultdict(list)
+    for profile in list_profiles(directory):
+        if len(grouped[profile.endpoint]) < per_endpoint:
+            grouped[profile.endpoint].append(profile)
+    return dict(grouped)
+
+
+def profile_path(directory: Path, name: str) -> Path | None:
+    """Путь к профилю по имени файла (None для чужих и отсутствующих имён)."""
+    if not _NAME_RE.match(name):
+        return None
+    path = directory / name
+    return path if path.is_file() else None
+
+
+def render_profile(path: Path, sort: str = "cumulative", limit: int = 60) -> str:
+    """Текстовый отчёт pstats: первые limit функций по ключу sort."""
+    stream = io.StringIO()
+    stats = pstats.Stats(str(path), stream=stream)
+    stats.strip_dirs().sort_stats(sort if sort in SORT_KEYS else "cumulative").print_stats(limit)
+    return stream.getvalue()
+
+
+def register_profiler(app: Flask) -> None:
+    """Подключает выборочное профилирование запросов (PROFILER_ENABLED)."""
+    if not app.config.get("PROFILER_ENABLED"):
+        return
+    app.before_request(lambda: _start_request(app))
+    # teardown: профиль сохраняется и при необработанном исключении
+    app.teardown_request(lambda exception: _finish_request(app, exception))
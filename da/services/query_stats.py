@@ -0,0 +1,128 @@
+"""Статистика SQL-запросов HTTP-запроса и поиск N+1.
+
+Слушатели before_cursor_execute/after_cursor_execute на Engine считают для
+текущего запроса число выполненных операторов, общее время в БД и число
+повторов каждой «формы» оператора (текст с литералами и списками IN,
+сведёнными к ?). Форма, повторённая в одном запросе не меньше
+SQL_N_PLUS_ONE_THRESHOLD раз, — типичный N+1 (ленивая загрузка в цикле
+шаблона) и попадает в лог предупреждением. В режиме отладки (или при
+SQL_STATS_HEADER = True) числа добавляются в заголовки ответа
+X-DB-Query-Count, X-DB-Time-Ms и Server-Timing.
+
+Операторы вне HTTP-запроса (фоновые потоки, команды) не учитываются.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from flask import Flask, Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_START_KEY = "query_stats_start"
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+# Параметры драйверов: ?, %s, %(name)s, :name, $1
+_PARAM_RE = re.compile(r"\?|%\(\w+\)s|%s|(?<!:):\w+|\$\d+")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Форма оператора: литералы и параметры заменены на ?, списки IN — на (?)."""
+    shape = _STRING_RE.sub("?", statement)
+    shape = _PARAM_RE.sub("?", shape)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("(?)", shape)
+    return _SPACE_RE.sub(" ", shape).strip()
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    # Секунды в БД (от отправки оператора до получения курсора)
+    total_time: float = 0.0
+    shapes: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Формы, выполненные не меньше threshold раз, самые частые первыми."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def current_query_stats() -> QueryStats | None:
+    """Статистика текущего HTTP-запроса (None вне запроса или при выключенном сборе)."""
+    if not has_request_context():
+        return None
+    return g.get("query_stats")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.get(_START_KEY)
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = current_query_stats()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+
+def _handle_error(exception_context) -> None:
+    # Упавший оператор не доходит до after_cursor_execute: убираем его отметку
+    connection = exception_context.connection
+    if connection is not None and connection.info.get(_START_KEY):
+        connection.info[_START_KEY].pop()
+
+
+def _start_request() -> None:
+    g.query_stats = QueryStats()
+
+
+def _finish_request(app: Flask, response: Response) -> Response:
+    # Статистика остаётся в g: её читают и другие обработчики after_request (метрики)
+    stats = g.get("query_stats")
+    if stats is None:
+        return response
+
+    endpoint = request.endpoint or request.path
+    threshold = app.config.get("SQL_N_PLUS_ONE_THRESHOLD", 10)
+    for shape, count in stats.repeated(threshold):
+        logger.warning("Возможный N+1 в %s: %s одинаковых запросов: %s", endpoint, count, shape[:300])
+    logger.debug(
+        "SQL %s: %s запросов, %.1f мс", endpoint, stats.count, stats.total_time * 1000
+    )
+
+    show_header = app.config.get("SQL_STATS_HEADER")
+    if show_header or (show_header is None and app.debug):
+        milliseconds = stats.total_time * 1000
+        response.headers["X-DB-Query-Count"] = str(stats.count)
+        response.headers["X-DB-Time-Ms"] = f"{milliseconds:.1f}"
+        response.headers.add("Server-Timing", f'db;dur={milliseconds:.1f};desc="{stats.count} queries"')
+    return response
+
+
+def register_query_stats(app: Flask) -> None:
+    """Подключает сбор статистики к приложению (SQL_STATS_ENABLED)."""
+    if not app.config.get("SQL_STATS_ENABLED", True):
+        return
+    if not event.contains(Engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+    app.before_request(_start_request)
+    app.after_request(lambda response: _finish_request(app, response))
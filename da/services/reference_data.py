@@ -0,0 +1,229 @@
+"""Кэш справочников для выпадающих списков форм (типы, локации, склады).
+
+Списки хранятся в процессе в виде неизменяемых объектов (не ORM) и помечены
+версиями сущностей, из которых построены: список складов зависит от версий
+"warehouse" и "location". Версии лежат в таблице reference_versions: слушатель
+after_flush поднимает версию сущности в той же транзакции, что меняет её
+(создание, правка, мягкое удаление и восстановление через любые маршруты и
+импорт). Процесс читает таблицу версий не чаще раза в
+REFERENCE_VERSION_POLL_SECONDS, так что формы обычно рисуются без запросов
+к базе: изменение из другого процесса видно не позже чем через этот
+интервал, собственный commit сбрасывает прочитанные версии сразу.
+REFERENCE_CACHE_TTL — предельный возраст списка; TTL = 0 отключает кэширование.
+Сотрудники выбираются через автодополнение (employees.search) и здесь не
+кэшируются.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+
+from ..extensions import db
+from ..models import DeviceType, Location, ReferenceVersion, Warehouse
+
+logger = logging.getLogger(__name__)
+
+# Модель -> имя сущности для версий
+ENTITY_MODELS: dict[type, str] = {
+    DeviceType: "type",
+    Location: "location",
+    Warehouse: "warehouse",
+}
+# Список -> сущности, от которых он зависит
+_DEPENDENCIES: dict[str, tuple[str, ...]] = {
+    "types": ("type",),
+    "locations": ("location",),
+    "warehouses": ("warehouse", "location"),
+}
+_SESSION_KEY = "reference_data_changed"
+
+_lock = threading.Lock()
+# Список -> (версии зависимостей, время загрузки, элементы)
+_cache: dict[str, tuple[tuple[int, ...], float, tuple]] = {}
+# (время чтения, версии из reference_versions)
+_versions: tuple[float, dict[str, int]] | None = None
+
+
+@dataclass(frozen=True)
+class TypeOption:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class LocationOption:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class WarehouseOption:
+    id: int
+    name: str
+    location: LocationOption | None
+
+
+def _location(location_id: int | None, name: str | None) -> LocationOption | None:
+    return LocationOption(location_id, name) if location_id is not None else None
+
+
+def _load_types() -> tuple[TypeOption, ...]:
+    rows = db.session.execute(
+        select(DeviceType.id, DeviceType.name)
+        .where(DeviceType.deleted_at.is_(None))
+        .order_by(DeviceType.name)
+    )
+    return tuple(TypeOption(*row) for row in rows)
+
+
+def _load_locations() -> tuple[LocationOption, ...]:
+    rows = db.session.execute(
+        select(Location.id, Location.name)
+        .where(Location.deleted_at.is_(None))
+        .order_by(Location.name)
+    )
+    return tuple(LocationOption(*row) for row in rows)
+
+
+def _load_warehouses() -> tuple[WarehouseOption, ...]:
+    rows = db.session.execute(
+        select(Warehouse.id, Warehouse.name, Location.id, Location.name)
+        .outerjoin(Location, Warehouse.location_id == Location.id)
+        .where(Warehouse.deleted_at.is_(None))
+        .order_by(Warehouse.name)
+    )
+    return tuple(
+        WarehouseOption(warehouse_id, name, _location(location_id, location_name))
+        for warehouse_id, name, location_id, location_name in rows
+    )
+
+
+_LOADERS: dict[str, Callable[[], tuple]] = {
+    "types": _load_types,
+    "locations": _load_locations,
+    "warehouses": _load_warehouses,
+}
+
+
+def _shared_versions(now: float) -> dict[str, int]:
+    """Версии из reference_versions, прочитанные не раньше REFERENCE_VERSION_POLL_SECONDS назад."""
+    global _versions
+    interval = current_app.config.get("REFERENCE_VERSION_POLL_SECONDS", 0)
+    with _lock:
+        snapshot = _versions
+    if snapshot is not None and now - snapshot[0] < interval:
+        return snapshot[1]
+    versions = dict(db.session.execute(select(ReferenceVersion.entity, ReferenceVersion.version)).all())
+    with _lock:
+        _versions = (now, versions)
+    return versions
+
+
+def _get(name: str) -> tuple:
+    ttl = current_app.config.get("REFERENCE_CACHE_TTL", 0)
+    # Транзакция с незакоммиченными изменениями справочников должна видеть их,
+    # а список из неё после отката оказался бы в кэше под чужой версией
+    if not ttl or _SESSION_KEY in db.session.info:
+        return _LOADERS[name]()
+
+    # Версии читаются до загрузки: список, загруженный позже, может быть только новее своей метки
+    now = time.monotonic()
+    shared = _shared_versions(now)
+    versions = tuple(shared.get(entity, 0) for entity in _DEPENDENCIES[name])
+    with _lock:
+        cached = _cache.get(name)
+        if cached and cached[0] == versions and now - cached[1] < ttl:
+            return cached[2]
+
+    items = _LOADERS[name]()
+    with _lock:
+        _cache[name] = (versions, now, items)
+    return items
+
+
+def get_device_types() -> tuple[TypeOption, ...]:
+    return _get("types")
+
+
+def get_locations() -> tuple[LocationOption, ...]:
+    return _get("locations")
+
+
+def get_warehouses() -> tuple[WarehouseOption, ...]:
+    return _get("warehouses")
+
+
+def invalidate_reference_data(*entities: str) -> None:
+    """Сбрасывает кэш процесса для списков, зависящих от сущностей; без аргументов — весь."""
+    global _versions
+    with _lock:
+        # Следующее обращение перечитает версии и увидит собственный commit
+        _versions = None
+        for name, dependencies in _DEPENDENCIES.items():
+            if not entities or set(entities) & set(dependencies):
+                _cache.pop(name, None)
+    logger.debug("Справочники инвалидированы: %s", entities or "все")
+
+
+def _bump_versions(connection: Connection, entities: Iterable[str]) -> None:
+    """Поднимает общие версии сущностей в текущей транзакции."""
+    table = ReferenceVersion.__table__
+    # Фиксированный порядок исключает взаимные блокировки, как в counters.apply_deltas
+    rows = [{"entity": entity, "version": 1} for entity in sorted(entities)]
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.entity],
+            set_={"version": table.c.version + 1},
+        )
+        connection.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            table.update().where(table.c.entity == row["entity"]).values(version=table.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+
+def _after_flush(session, flush_context) -> None:
+    changed = {
+        ENTITY_MODELS[type(obj)]
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if type(obj) in ENTITY_MODELS
+    }
+    if changed:
+        _bump_versions(session.connection(), changed)
+        session.info.setdefault(_SESSION_KEY, set()).update(changed)
+
+
+def _after_commit(session) -> None:
+    changed = session.info.pop(_SESSION_KEY, None)
+    if changed:
+        # Старые списки больше не совпадут по версии: освобождаем память сразу
+        invalidate_reference_data(*changed)
+
+
+def _after_soft_rollback(session, previous_transaction) -> None:
+    # Откат savepoint не отменяет изменений, записанных ранее в той же транзакции;
+    # откат всей транзакции отменяет и подъём версий
+    if previous_transaction.parent is None:
+        session.info.pop(_SESSION_KEY, None)
+
+
+def register_reference_data_events() -> None:
+    if not event.contains(db.session, "after_commit", _after_commit):
+        event.listen(db.session, "after_flush", _after_flush)
+        event.listen(db.session, "after_commit", _after_commit)
+        event.listen(db.session, "after_soft_rollback", _after_soft_rollback)
@@ -0,0 +1,268 @@
+"""Глобальный полнотекстовый поиск по девайсам, сотрудникам и складам.
+
+Для каждой не удалённой сущности в таблице search_index хранится документ
+(заголовок, подзаголовок и текст из индексируемых полей). Слушатель after_flush
+обновляет документы в той же транзакции, что и сами сущности, только если
+изменились индексируемые поля или deleted_at; мягко удалённые сущности из
+индекса убираются. Операции в обход ORM (пакетный импорт девайсов) должны
+вызывать index_entities сами; полную пересборку делает `flask search-reindex`.
+
+Ранжирование: на PostgreSQL — ts_rank по tsvector плюс word_similarity из
+pg_trgm (фрагменты серийных номеров), на SQLite — bm25 по FTS5.
+"""
+from __future__ import annotations
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Mapping
+
+from sqlalchemy import column, delete, event, func, inspect, literal_column, or_, select, table, tuple_
+from sqlalchemy.engine import Connection
+
+from ..extensions import db
+from ..models import SEARCH_DOCUMENT, Device, Employee, SearchEntry, Warehouse
+from .excel import chunked
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_TERMS = 6
+# Поиск фрагмента внутри слов (триграммы) — только для запросов от этой длины
+MIN_FRAGMENT_LENGTH = 3
+REINDEX_BATCH_SIZE = 1000
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+_HIT_COLUMNS = (SearchEntry.entity_type, SearchEntry.entity_id, SearchEntry.title, SearchEntry.subtitle)
+_FTS = table("search_index_fts", column("rowid"))
+
+
+def _join(*parts: Any) -> str:
+    return " ".join(str(part) for part in parts if part)
+
+
+@dataclass(frozen=True)
+class EntitySpec:
+    """Как строить поисковый документ сущности из значений её колонок."""
+
+    entity_type: str
+    model: type
+    columns: tuple[str, ...]
+    title: Callable[[Mapping[str, Any]], str]
+    subtitle: Callable[[Mapping[str, Any]], str | None]
+
+    def document(self, entity_id: int, values: Mapping[str, Any]) -> dict[str, Any]:
+        return {
+            "entity_type": self.entity_type,
+            "entity_id": entity_id,
+            "title": self.title(values),
+            "subtitle": self.subtitle(values) or None,
+            "content": _join(*(values[name] for name in self.columns)),
+        }
+
+
+SPECS: dict[str, EntitySpec] = {
+    spec.entity_type: spec
+    for spec in (
+        EntitySpec(
+            "device",
+            Device,
+            ("inventory_number", "model", "serial_number", "notes"),
+            title=lambda v: _join(v["inventory_number"], v["model"]),
+            subtitle=lambda v: _join("S/N", v["serial_number"]) if v["serial_number"] else None,
+        ),
+        EntitySpec(
+            "employee",
+            Employee,
+            ("last_name", "first_name", "middle_name", "email", "phone", "telegram"),
+            title=lambda v: _join(v["last_name"], v["first_name"], v["middle_name"]),
+            subtitle=lambda v: " · ".join(p for p in (v["email"], v["phone"], v["telegram"]) if p),
+        ),
+        EntitySpec(
+            "warehouse",
+            Warehouse,
+            ("name", "address"),
+            title=lambda v: v["name"],
+            subtitle=lambda v: v["address"],
+        ),
+    )
+}
+_SPECS_BY_MODEL: dict[type, EntitySpec] = {spec.model: spec for spec in SPECS.values()}
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    entity_type: str
+    entity_id: int
+    title: str
+    subtitle: str | None
+    rank: float
+
+
+def write_documents(
+    connection: Connection,
+    removed: Iterable[tuple[str, int]],
+    documents: list[dict[str, Any]],
+) -> None:
+    """Удаляет документы по ключам (тип, id) и вставляет новые одной пачкой."""
+    keys = {*removed, *((d["entity_type"], d["entity_id"]) for d in documents)}
+    entries = SearchEntry.__table__
+    for batch in chunked(sorted(keys), REINDEX_BATCH_SIZE):
+        connection.execute(
+            delete(entries).where(tuple_(entries.c.entity_type, entries.c.entity_id).in_(batch))
+        )
+    if documents:
+        connection.execute(entries.insert(), documents)
+
+
+def _load_documents(connection: Connection, spec: EntitySpec, ids: Iterable[int] | None = None):
+    """Документы не удалённых сущностей (всех или с указанными id), порциями."""
+    model = spec.model
+    statement = select(model.id, *(getattr(model, name) for name in spec.columns)).where(
+        model.deleted_at.is_(None)
+    )
+    if ids is not None:
+        statement = statement.where(model.id.in_(ids))
+    result = connection.execute(statement.execution_options(yield_per=REINDEX_BATCH_SIZE))
+    for row in result:
+        values = row._asdict()
+        yield spec.document(values.pop("id"), values)
+
+
+def index_entities(entity_type: str, ids: Iterable[int]) -> None:
+    """Переиндексирует сущности по id в текущей транзакции (для записи в обход ORM)."""
+    ids = list(ids)
+    if not ids:
+        return
+    connection = db.session.connection()
+    spec = SPECS[entity_type]
+    for batch in chunked(ids, REINDEX_BATCH_SIZE):
+        documents = list(_load_documents(connection, spec, batch))
+        write_documents(connection, ((entity_type, entity_id) for entity_id in batch), documents)
+
+
+def rebuild_search_index() -> int:
+    """Пересобирает весь индекс с нуля. Returns: число документов."""
+    connection = db.session.connection()
+    connection.execute(delete(SearchEntry.__table__))
+    total = 0
+    for spec in SPECS.values():
+        for batch in chunked(_load_documents(connection, spec), REINDEX_BATCH_SIZE):
+            connection.execute(SearchEntry.__table__.insert(), batch)
+            total += len(batch)
+    db.session.commit()
+    logger.info("Поисковый индекс пересобран, документов: %s", total)
+    return total
+
+
+def _needs_reindex(obj, spec: EntitySpec) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[name].history.has_changes() for name in (*spec.columns, "deleted_at"))
+
+
+def _after_flush(session, flush_context) -> None:
+    removed: list[tuple[str, int]] = []
+    documents: list[dict[str, Any]] = []
+    for obj in (*session.new, *session.dirty):
+        spec = _SPECS_BY_MODEL.get(type(obj))
+        if spec is None or (obj not in session.new and not _needs_reindex(obj, spec)):
+            continue
+        if obj.deleted_at is None:
+            documents.append(spec.document(obj.id, {name: getattr(obj, name) for name in spec.columns}))
+        else:
+            removed.append((spec.entity_type, obj.id))
+    for obj in session.deleted:
+        spec = _SPECS_BY_MODEL.get(type(obj))
+        if spec is not None:
+            removed.append((spec.entity_type, obj.id))
+
+    if removed or documents:
+        write_documents(session.connection(), removed, documents)
+        logger.debug("Поисковый индекс: обновлено %s, удалено %s", len(documents), len(removed))
+
+
+def register_search_events() -> None:
+    if not event.contains(db.session, "after_flush", _after_flush):
+        event.listen(db.session, "after_flush", _after_flush)
+
+
+def _terms(query: str) -> list[str]:
+    return [term.lower() for term in _TERM_RE.findall(query)][:MAX_TERMS]
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _postgresql_query(query: str, terms: list[str]):
+    # Каждое слово — префикс (term:*), все слова обязательны
+    tsquery = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{term}:*" for term in terms))
+    matches = SEARCH_DOCUMENT.op("@@")(tsquery)
+    rank = func.ts_rank(SEARCH_DOCUMENT, tsquery)
+    fragment = query.strip()
+    if len(fragment) >= MIN_FRAGMENT_LENGTH:
+        matches = or_(
+            matches,
+            SearchEntry.content.ilike(f"%{_escape_like(fragment)}%", escape="\\"),
+        )
+        rank = rank + func.word_similarity(fragment, SearchEntry.content)
+    return select(*_HIT_COLUMNS, rank.label("rank")).where(matches).order_by(rank.desc(), SearchEntry.id)
+
+
+def _sqlite_query(terms: list[str]):
+    # Слова в кавычках: спецсимволы синтаксиса FTS5 в запросе не интерпретируются
+    match = " ".join(f'"{term}"*' for term in terms)
+    # bm25 тем меньше, чем релевантнее; совпадение в заголовке весит больше
+    rank = literal_column("bm25(search_index_fts, 10.0, 1.0)")
+    return (
+        select(*_HIT_COLUMNS, (-rank).label("rank"))
+        .join(_FTS, _FTS.c.rowid == SearchEntry.id)
+        .where(literal_column("search_index_fts").op("MATCH")(match))
+        .order_by(rank, SearchEntry.id)
+    )
+
+
+def _fallback_query(terms: list[str]):
+    conditions = [
+        func.lower(SearchEntry.content).like(f"%{_escape_like(term)}%", escape="\\") for term in terms
+    ]
+    return (
+        select(*_HIT_COLUMNS, literal_column("0.0").label("rank"))
+        .where(*conditions)
+        .order_by(SearchEntry.title, SearchEntry.id)
+    )
+
+
+def search(
+    query: str,
+    entity_types: Iterable[str] | None = None,
+    limit: int = DEFAULT_LIMIT,
+) -> list[SearchHit]:
+    """
+    Ищет по индексу: каждое слово запроса должно совпасть с началом слова документа.
+
+    Returns:
+        list: не более limit результатов, самые релевантные первыми
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = _postgresql_query(query, terms)
+    elif dialect == "sqlite":
+        statement = _sqlite_query(terms)
+    else:
+        statement = _fallback_query(terms)
+
+    types = [t for t in (entity_types or ()) if t in SPECS]
+    if types:
+        statement = statement.where(SearchEntry.entity_type.in_(types))
+
+    return [
+        SearchHit(entity_type, entity_id, title, subtitle, float(rank or 0))
+        for entity_type, entity_id, title, subtitle, rank in db.session.execute(statement.limit(limit))
+    ]
@@ -0,0 +1,263 @@
+"""Журнал медленных SQL-операторов с планами выполнения.
+
+Оператор, выполнявшийся дольше SLOW_QUERY_MS миллисекунд (слушатели
+before/after_cursor_execute на Engine), пишется в лог приложения и ставится в
+очередь потока slow-query-log; сам запрос план не ждёт. Поток получает план в
+отдельном соединении — EXPLAIN (ANALYZE off) на PostgreSQL, EXPLAIN QUERY PLAN
+на SQLite, оператор при этом повторно не выполняется — и дописывает запись
+JSON-строкой в <LOG_DIR>/slow_queries.jsonl: время, длительность, endpoint,
+форма оператора (services/query_stats.py), текст, параметры и план. Файл
+ротируется при SLOW_QUERY_LOG_MAX_BYTES (одна копия .1).
+
+Команда `flask slow-queries` сводит записи по форме оператора.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterator
+
+from flask import Flask, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .query_stats import statement_shape
+
+logger = logging.getLogger(__name__)
+
+LOG_NAME = "slow_queries.jsonl"
+QUEUE_SIZE = 1000
+_START_KEY = "slow_query_start"
+# Операторы, для которых EXPLAIN без выполнения имеет смысл
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+
+@dataclass(frozen=True)
+class SlowQuerySettings:
+    threshold: float
+    path: Path
+    max_bytes: int
+    explain: bool
+
+
+@dataclass
+class SlowQuerySummary:
+    shape: str
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    endpoints: Counter = field(default_factory=Counter)
+    # Самое медленное выполнение формы
+    statement: str | None = None
+    parameters: str | None = None
+    plan: str | None = None
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+
+_settings: SlowQuerySettings | None = None
+
+
+def _explain(engine: Engine, statement: str, parameters: Any) -> str | None:
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        prefix = "EXPLAIN (ANALYZE off) "
+    elif dialect == "sqlite":
+        # Другое соединение к базе в памяти — это другая (пустая) база
+        if engine.url.database in (None, "", ":memory:"):
+            return None
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        return None
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(prefix + statement, parameters).fetchall()
+        connection.rollback()
+    if dialect == "sqlite":
+        # (id, parent, notused, detail)
+        return "\n".join(str(row[-1]) for row in rows)
+    return "\n".join(str(row[0]) for row in rows)
+
+
+class SlowQueryLog:
+    """Очередь медленных операторов и поток, дописывающий их с планами в файл."""
+
+    def __init__(self) -> None:
+        self.pid = os.getpid()
+        self._queue: queue.Queue[dict[str, Any] | None] = queue.Queue(maxsize=QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="slow-query-log", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            logger.warning("Очередь журнала медленных запросов переполнена, запись отброшена")
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(item)
+            except Exception:
+                logger.exception("Ошибка записи журнала медленных запросов")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, item: dict[str, Any]) -> None:
+        engine = item.pop("engine")
+        settings: SlowQuerySettings = item.pop("settings")
+        parameters = item.pop("raw_parameters")
+        item["plan"] = None
+        # У executemany нет одного набора параметров для EXPLAIN
+        explainable = not item["executemany"] and item["statement"].lstrip().lower().startswith(_EXPLAINABLE)
+        if settings.explain and explainable:
+            try:
+                item["plan"] = _explain(engine, item["statement"], parameters)
+            except Exception as e:
+                item["plan"] = f"EXPLAIN не выполнен: {e}"
+        line = json.dumps(item, ensure_ascii=False, default=str) + "\n"
+        path = settings.path
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists() and path.stat().st_size + len(line) > settings.max_bytes:
+                os.replace(path, path.with_name(path.name + ".1"))
+            with open(path, "a", encoding="utf-8") as log_file:
+                log_file.write(line)
+
+    def flush(self) -> None:
+        self._queue.join()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+_log: SlowQueryLog | None = None
+_log_lock = threading.Lock()
+
+
+def _get_log() -> SlowQueryLog:
+    global _log
+    with _log_lock:
+        # После fork поток родителя в дочернем процессе не работает
+        if _log is None or _log.pid != os.getpid():
+            _log = SlowQueryLog()
+            atexit.register(_log.stop)
+        return _log
+
+
+def flush_slow_query_log() -> None:
+    """Дожидается записи поставленных операторов (команды CLI, тесты)."""
+    if _log is not None and _log.pid == os.getpid():
+        _log.flush()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.get(_START_KEY)
+    if not started:
+        return
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+    settings = _settings
+    if settings is None or elapsed_ms < settings.threshold:
+        return
+    # EXPLAIN самого журнала не записываем
+    if _log is not None and threading.current_thread() is _log._thread:
+        return
+
+    if has_request_context():
+        endpoint = request.endpoint or request.path
+    else:
+        # Фоновые потоки и команды CLI
+        endpoint = f"thread:{threading.current_thread().name}"
+    logger.warning("Медленный SQL %.0f мс в %s: %s", elapsed_ms, endpoint, statement[:300])
+    _get_log().submit(
+        {
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "ms": round(elapsed_ms, 1),
+            "endpoint": endpoint,
+            "shape": statement_shape(statement),
+            "statement": statement,
+            "parameters": repr(parameters)[:1000],
+            "executemany": executemany,
+            # Для EXPLAIN; в файл не пишутся
+            "raw_parameters": None if executemany else parameters,
+            "engine": conn.engine,
+            "settings": settings,
+        }
+    )
+
+
+def _handle_error(exception_context) -> None:
+    connection = exception_context.connection
+    if connection is not None and connection.info.get(_START_KEY):
+        connection.info[_START_KEY].pop()
+
+
+def register_slow_query_log(app: Flask) -> None:
+    """Включает журнал медленных операторов (SLOW_QUERY_MS > 0)."""
+    global _settings
+    threshold = app.config.get("SLOW_QUERY_MS", 0)
+    if threshold <= 0:
+        return
+    _settings = SlowQuerySettings(
+        threshold=threshold,
+        path=Path(app.config["LOG_DIR"]) / LOG_NAME,
+        max_bytes=app.config.get("SLOW_QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024),
+        explain=app.config.get("SLOW_QUERY_EXPLAIN", True),
+    )
+    if not event.contains(Engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+
+def _iter_entries(path: Path) -> Iterator[dict[str, Any]]:
+    for candidate in (path.with_name(path.name + ".1"), path):
+        if not candidate.exists():
+            continue
+        with open(candidate, encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # строка, оборванная при аварийной остановке
+
+
+def summarize_slow_queries(log_dir: str | Path, hours: float | None = None) -> list[SlowQuerySummary]:
+    """Сводка журнала по форме оператора, самые затратные (по суммарному времени) первыми."""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours) if hours else None
+    summaries: dict[str, SlowQuerySummary] = {}
+    for entry in _iter_entries(Path(log_dir) / LOG_NAME):
+        if since and datetime.fromisoformat(entry["at"]) < since:
+            continue
+        summary = summaries.setdefault(entry["shape"], SlowQuerySummary(entry["shape"]))
+        summary.count += 1
+        summary.total_ms += entry["ms"]
+        summary.endpoints[entry["endpoint"]] += 1
+        if entry["ms"] >= summary.max_ms:
+            summary.max_ms = entry["ms"]
+            summary.statement = entry["statement"]
+            summary.parameters = entry["parameters"]
+            summary.plan = entry.get("plan")
+    return sorted(summaries.values(), key=lambda s: s.total_ms, reverse=True)
@@ -4,8 +4,7 @@ import logging
 from sqlalchemy.orm import DeclarativeBase
 
 from ..extensions import db
-from ..models import AuditAction, utcnow
-from .audit import log_action
+from ..models import utcnow
 from .email import send_deletion_notification
 
 logger = logging.getLogger(__name__)
@@ -34,18 +33,10 @@ def soft_delete_entity(
     
     entity_id = entity.id
     
-    # Помечаем как удаленное
+    # Помечаем как удаленное; запись audit log создаёт services/audit_capture.py
     entity.deleted_at = utcnow()
     db.session.commit()
     
-    log_action(
-        AuditAction.DELETE,
-        entity_type,
-        entity_id=entity_id,
-        entity_name=entity_name,
-        changes={"deleted_by": current_user.email, "soft_delete": True},
-    )
-    
     # Отправляем уведомление на email
     try:
         send_deletion_notification(
@@ -94,16 +85,10 @@ def hard_delete_entity(
         except Exception:
             deleted_by_email = "system"
     
+    # Запись audit log создаёт services/audit_capture.py
     db.session.delete(entity)
     db.session.commit()
     
-    log_action(
-        AuditAction.DELETE,
-        entity_type,
-        entity_id=entity_id,
-        entity_name=entity_name,
-    )
-    
     # Отправляем уведомление на email
     try:
         send_deletion_notification(
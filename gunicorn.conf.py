@@ -0,0 +1,28 @@
+"""Настройки gunicorn (читаются автоматически при запуске из корня проекта).
+
+Параметры запуска (bind, workers и т.д.) передаются в командной строке; здесь
+только метрики Prometheus для нескольких воркеров (services/metrics.py).
+PROMETHEUS_MULTIPROC_DIR задаётся при чтении конфигурации, до импорта
+приложения и fork воркеров: prometheus_client выбирает хранение значений
+при импорте, и без каталога каждый воркер отдавал бы только свои счётчики.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+os.environ.setdefault(MULTIPROC_ENV, str(Path(tempfile.gettempdir()) / "da-prometheus-multiproc"))
+
+
+def on_starting(server):
+    # Файлы метрик прошлого запуска исказили бы счётчики
+    directory = Path(os.environ[MULTIPROC_ENV])
+    directory.mkdir(parents=True, exist_ok=True)
+    for path in directory.glob("*.db"):
+        path.unlink()
+
+
+def child_exit(server, worker):
+    from da.services.metrics import child_exit as mark_worker_dead
+
+    mark_worker_dead(server, worker)
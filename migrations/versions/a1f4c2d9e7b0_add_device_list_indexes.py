@@ -0,0 +1,42 @@
+"""Add partial indexes for keyset pagination of the device list
+
+Revision ID: a1f4c2d9e7b0
+Revises: 2cc3e299a376
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1f4c2d9e7b0'
+down_revision = '2cc3e299a376'
+branch_labels = None
+depends_on = None
+
+
+LIVE = sa.text('deleted_at IS NULL')
+
+INDEXES = {
+    'ix_devices_live_created': ['created_at', 'id'],
+    'ix_devices_live_model': ['model', 'id'],
+    'ix_devices_live_type': ['type_id', 'created_at', 'id'],
+    'ix_devices_live_status': ['status', 'created_at', 'id'],
+    'ix_devices_live_location': ['location_id', 'created_at', 'id'],
+    'ix_devices_live_warehouse': ['warehouse_id', 'created_at', 'id'],
+    'ix_devices_live_owner': ['owner_id', 'created_at', 'id'],
+}
+
+
+def upgrade():
+    for name, columns in INDEXES.items():
+        op.create_index(
+            name, 'devices', columns, unique=False,
+            postgresql_where=LIVE, sqlite_where=LIVE,
+        )
+
+
+def downgrade():
+    for name in reversed(list(INDEXES)):
+        op.drop_index(name, table_name='devices')
@@ -0,0 +1,123 @@
+"""Partition audit_logs by month (PostgreSQL)
+
+Существующая таблица не копируется: она становится партицией
+audit_logs_legacy с диапазоном до начала следующего месяца. Всё, что
+требует чтения всей таблицы (проверка границы партиции, уникальный индекс
+под новый первичный ключ), делается заранее вне транзакции миграции и не
+блокирует запись; под ACCESS EXCLUSIVE остаются только переименования и
+ATTACH PARTITION без сканирования. Месяцы audit_logs_legacy переносятся в
+архив `flask audit-archive` пакетным удалением, опустевшая партиция
+удаляется.
+
+Revision ID: a3c8e1f5b207
+Revises: f7d3b2c8a914
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c8e1f5b207'
+down_revision = 'f7d3b2c8a914'
+branch_labels = None
+depends_on = None
+
+
+# Партиции создаются и на несколько месяцев вперёд; дальше их создаёт `flask audit-archive`
+PARTITIONS_AHEAD = 3
+
+
+def _add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+LEGACY = 'audit_logs_legacy'
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # На SQLite секционирования нет: срок хранения обеспечивает пакетное удаление
+        return
+
+    now = datetime.utcnow()
+    # Граница в будущем: строки, вставленные до переключения, в неё попадают
+    boundary = _add_months(now, 1)
+
+    with op.get_context().autocommit_block():
+        # NOT VALID не сканирует таблицу; VALIDATE сканирует под SHARE UPDATE
+        # EXCLUSIVE, чтение и запись продолжаются. По этому ограничению
+        # ATTACH PARTITION и NOT NULL ключа не перепроверяют строки
+        exists = bind.execute(
+            sa.text("SELECT 1 FROM pg_constraint WHERE conname = 'audit_logs_legacy_bound'")
+        ).first()
+        if not exists:
+            op.execute(
+                "ALTER TABLE audit_logs ADD CONSTRAINT audit_logs_legacy_bound "
+                f"CHECK (created_at IS NOT NULL AND created_at < '{boundary:%Y-%m-%d}') NOT VALID"
+            )
+        op.execute("ALTER TABLE audit_logs VALIDATE CONSTRAINT audit_logs_legacy_bound")
+        # Индекс под первичный ключ (id, created_at) секционированной таблицы
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS audit_logs_legacy_id_created_at "
+            "ON audit_logs (id, created_at)"
+        )
+
+    op.execute(f"ALTER TABLE audit_logs RENAME TO {LEGACY}")
+    op.execute("ALTER INDEX ix_audit_logs_created_at RENAME TO ix_audit_logs_legacy_created_at")
+    op.execute(f"ALTER TABLE {LEGACY} RENAME CONSTRAINT audit_logs_pkey TO audit_logs_legacy_pkey")
+    op.execute(f"ALTER TABLE {LEGACY} RENAME CONSTRAINT audit_logs_user_id_fkey TO audit_logs_legacy_user_id_fkey")
+
+    # Ключ секционирования обязан входить в первичный ключ
+    op.execute(f"CREATE TABLE audit_logs (LIKE {LEGACY} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    op.execute("ALTER TABLE audit_logs ADD CONSTRAINT audit_logs_pkey PRIMARY KEY (id, created_at)")
+    op.execute(
+        "ALTER TABLE audit_logs ADD CONSTRAINT audit_logs_user_id_fkey "
+        "FOREIGN KEY (user_id) REFERENCES users (id)"
+    )
+    op.execute("CREATE INDEX ix_audit_logs_created_at ON audit_logs (created_at)")
+    # Индексы и внешний ключ партиции совпадают с родительскими и присоединяются к ним
+    op.execute(
+        f"ALTER TABLE audit_logs ATTACH PARTITION {LEGACY} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary:%Y-%m-%d}')"
+    )
+    op.execute(f"ALTER TABLE {LEGACY} DROP CONSTRAINT audit_logs_legacy_bound")
+
+    month = boundary
+    last = _add_months(now, PARTITIONS_AHEAD)
+    while month <= last:
+        end = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE audit_logs_p{month:%Y_%m} PARTITION OF audit_logs "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+        month = end
+    op.execute("CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT")
+
+    # Иначе последовательность удалится вместе с опустевшей audit_logs_legacy
+    op.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id")
+
+
+def downgrade():
+    # Копирует всю историю под блокировкой audit_logs: только в окно обслуживания
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute("CREATE TABLE audit_logs_plain (LIKE audit_logs INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO audit_logs_plain SELECT * FROM audit_logs")
+    op.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs_plain.id")
+    # Партиции удаляются вместе с родительской таблицей
+    op.execute("DROP TABLE audit_logs")
+    op.execute("ALTER TABLE audit_logs_plain RENAME TO audit_logs")
+    op.execute("ALTER TABLE audit_logs ADD CONSTRAINT audit_logs_pkey PRIMARY KEY (id)")
+    op.execute(
+        "ALTER TABLE audit_logs ADD CONSTRAINT audit_logs_user_id_fkey "
+        "FOREIGN KEY (user_id) REFERENCES users (id)"
+    )
+    op.execute("CREATE INDEX ix_audit_logs_created_at ON audit_logs (created_at)")
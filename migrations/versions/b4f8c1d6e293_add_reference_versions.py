@@ -0,0 +1,28 @@
+"""Add shared reference data versions
+
+Revision ID: b4f8c1d6e293
+Revises: a9d4e2b7c016
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4f8c1d6e293'
+down_revision = 'a9d4e2b7c016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reference_versions',
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('entity')
+    )
+
+
+def downgrade():
+    op.drop_table('reference_versions')
@@ -0,0 +1,33 @@
+"""Add composite indexes for filtering and paging the audit log
+
+Revision ID: b6d2f0a4c813
+Revises: a3c8e1f5b207
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2f0a4c813'
+down_revision = 'a3c8e1f5b207'
+branch_labels = None
+depends_on = None
+
+
+# На секционированной таблице (PostgreSQL) индекс создаётся на каждой партиции
+INDEXES = {
+    'ix_audit_logs_entity': ['entity_type', 'entity_id', 'created_at', 'id'],
+    'ix_audit_logs_user': ['user_id', 'created_at', 'id'],
+}
+
+
+def upgrade():
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'audit_logs', columns, unique=False)
+
+
+def downgrade():
+    for name in reversed(list(INDEXES)):
+        op.drop_index(name, table_name='audit_logs')
@@ -0,0 +1,56 @@
+"""Add inventory_counters table
+
+Revision ID: b7e2d5a8c3f1
+Revises: a1f4c2d9e7b0
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d5a8c3f1'
+down_revision = 'a1f4c2d9e7b0'
+branch_labels = None
+depends_on = None
+
+
+DIMENSION_COLUMNS = {
+    'warehouse': 'warehouse_id',
+    'owner': 'owner_id',
+    'location': 'location_id',
+    'type': 'type_id',
+}
+
+
+def upgrade():
+    op.create_table(
+        'inventory_counters',
+        sa.Column('dimension', sa.String(), nullable=False),
+        sa.Column('ref', sa.String(), nullable=False),
+        sa.Column('device_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('dimension', 'ref'),
+    )
+
+    # Начальное заполнение; дальше счётчики поддерживаются приложением
+    op.execute(
+        "INSERT INTO inventory_counters (dimension, ref, device_count) "
+        "SELECT 'total', 'all', COUNT(*) FROM devices WHERE deleted_at IS NULL"
+    )
+    for dimension, column in DIMENSION_COLUMNS.items():
+        op.execute(
+            "INSERT INTO inventory_counters (dimension, ref, device_count) "
+            f"SELECT '{dimension}', CAST({column} AS VARCHAR), COUNT(*) FROM devices "
+            f"WHERE deleted_at IS NULL AND {column} IS NOT NULL GROUP BY {column}"
+        )
+    # Enum хранится по имени (IN_STOCK), в счётчиках используется значение (in_stock)
+    op.execute(
+        "INSERT INTO inventory_counters (dimension, ref, device_count) "
+        "SELECT 'status', LOWER(status), COUNT(*) FROM devices "
+        "WHERE deleted_at IS NULL GROUP BY status"
+    )
+
+
+def downgrade():
+    op.drop_table('inventory_counters')
@@ -0,0 +1,43 @@
+"""Add case-insensitive unique indexes on employee contacts and name
+
+Revision ID: c4a9e1f6b2d8
+Revises: b7e2d5a8c3f1
+Create Date: 2026-10-17 12:00:00.000000
+
+Fails if the table already contains rows that differ only by letter case
+(or by NULL vs empty middle name); such duplicates must be merged first.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a9e1f6b2d8'
+down_revision = 'b7e2d5a8c3f1'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = {
+    'uq_employees_email_ci': ['lower(email)'],
+    'uq_employees_phone_ci': ['lower(phone)'],
+    'uq_employees_telegram_ci': ['lower(telegram)'],
+    'uq_employees_name_ci': [
+        'lower(last_name)',
+        'lower(first_name)',
+        "coalesce(lower(middle_name), '')",
+    ],
+}
+
+
+def upgrade():
+    for name, expressions in INDEXES.items():
+        op.create_index(
+            name, 'employees', [sa.text(expr) for expr in expressions], unique=True
+        )
+
+
+def downgrade():
+    for name in reversed(list(INDEXES)):
+        op.drop_index(name, table_name='employees')
@@ -0,0 +1,125 @@
+"""Store audit log changes as JSON (JSONB with GIN index on PostgreSQL)
+
+На PostgreSQL тип колонки не меняется через ALTER COLUMN TYPE: он
+переписал бы все партиции audit_logs, включая audit_logs_legacy, под
+ACCESS EXCLUSIVE. Вместо этого добавляется колонка changes_jsonb, триггер
+заполняет её у новых и изменённых строк, старые строки переносятся пачками
+по BATCH_SIZE id в отдельных транзакциях, затем колонки меняются местами
+(только изменения каталога). GIN-индекс строится CONCURRENTLY на каждой
+партиции и присоединяется к индексу родительской таблицы.
+
+Revision ID: c4e7a2d9f158
+Revises: b6d2f0a4c813
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7a2d9f158'
+down_revision = 'b6d2f0a4c813'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 10000
+
+# Строки, которые не разбираются как JSON, сохраняются как JSON-строка.
+# Функция общая (не pg_temp): её вызывает триггер в соединениях приложения
+PG_TO_JSONB = """
+CREATE OR REPLACE FUNCTION audit_changes_jsonb(value text) RETURNS jsonb AS $$
+BEGIN
+    RETURN value::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN to_jsonb(value);
+END
+$$ LANGUAGE plpgsql IMMUTABLE
+"""
+PG_SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION audit_changes_jsonb_sync() RETURNS trigger AS $$
+BEGIN
+    NEW.changes_jsonb := audit_changes_jsonb(NEW.changes);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def _upgrade_postgresql(bind):
+    with op.get_context().autocommit_block():
+        # Колонка без значения по умолчанию добавляется без перезаписи таблицы
+        op.execute("ALTER TABLE audit_logs ADD COLUMN IF NOT EXISTS changes_jsonb jsonb")
+        op.execute(PG_TO_JSONB)
+        op.execute(PG_SYNC_FUNCTION)
+        op.execute("DROP TRIGGER IF EXISTS audit_logs_changes_jsonb_sync ON audit_logs")
+        op.execute(
+            "CREATE TRIGGER audit_logs_changes_jsonb_sync BEFORE INSERT OR UPDATE OF changes "
+            "ON audit_logs FOR EACH ROW EXECUTE FUNCTION audit_changes_jsonb_sync()"
+        )
+
+        # Строки, вставленные после создания триггера, уже заполнены
+        low, high = bind.execute(sa.text("SELECT min(id), max(id) FROM audit_logs")).one()
+        start = low or 0
+        while high is not None and start <= high:
+            op.execute(
+                "UPDATE audit_logs SET changes_jsonb = audit_changes_jsonb(changes) "
+                f"WHERE id >= {start} AND id < {start + BATCH_SIZE} "
+                "AND changes IS NOT NULL AND changes_jsonb IS NULL"
+            )
+            start += BATCH_SIZE
+
+    # Только каталог: ACCESS EXCLUSIVE на время переименования
+    op.execute("DROP TRIGGER audit_logs_changes_jsonb_sync ON audit_logs")
+    op.execute("ALTER TABLE audit_logs DROP COLUMN changes")
+    op.execute("ALTER TABLE audit_logs RENAME COLUMN changes_jsonb TO changes")
+    op.execute("DROP FUNCTION audit_changes_jsonb_sync()")
+    op.execute("DROP FUNCTION audit_changes_jsonb(text)")
+
+    partitions = bind.execute(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'audit_logs'::regclass"
+    )).scalars().all()
+    with op.get_context().autocommit_block():
+        if not partitions:
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_audit_logs_changes "
+                "ON audit_logs USING gin (changes)"
+            )
+            return
+        # Индекс на родительской таблице без ONLY строился бы на всех партициях под блокировкой
+        op.execute("CREATE INDEX IF NOT EXISTS ix_audit_logs_changes ON ONLY audit_logs USING gin (changes)")
+        for partition in partitions:
+            index = f"{partition}_changes_idx"
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {partition} USING gin (changes)")
+            op.execute(f"ALTER INDEX ix_audit_logs_changes ATTACH PARTITION {index}")
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        _upgrade_postgresql(bind)
+        return
+
+    op.execute(
+        "UPDATE audit_logs SET changes = json_quote(changes) "
+        "WHERE changes IS NOT NULL AND NOT json_valid(changes)"
+    )
+    with op.batch_alter_table('audit_logs') as batch_op:
+        batch_op.alter_column('changes', type_=sa.JSON(), existing_nullable=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # Перезаписывает все партиции под ACCESS EXCLUSIVE: только в окно обслуживания
+        op.drop_index('ix_audit_logs_changes', table_name='audit_logs')
+        op.alter_column(
+            'audit_logs', 'changes', type_=sa.String(),
+            existing_type=postgresql.JSONB(), postgresql_using='changes::text',
+        )
+        return
+
+    with op.batch_alter_table('audit_logs') as batch_op:
+        batch_op.alter_column('changes', type_=sa.String(), existing_nullable=True)
@@ -0,0 +1,26 @@
+"""Add index for the device timeline on device_history
+
+Revision ID: d8f1b3e6a290
+Revises: c4e7a2d9f158
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f1b3e6a290'
+down_revision = 'c4e7a2d9f158'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_device_history_device', 'device_history', ['device_id', 'created_at', 'id'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_device_history_device', table_name='device_history')
@@ -0,0 +1,43 @@
+"""Add prefix search indexes on employee names and contacts
+
+Revision ID: e5c1a9d3f672
+Revises: d2b8f4a7c915
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c1a9d3f672'
+down_revision = 'd2b8f4a7c915'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = ('last_name', 'first_name', 'middle_name', 'email', 'telegram')
+
+
+def upgrade():
+    is_postgresql = op.get_bind().dialect.name == 'postgresql'
+    for column in COLUMNS:
+        name = f'ix_employees_{column}_prefix'
+        if is_postgresql:
+            # text_pattern_ops: LIKE 'abc%' использует индекс при любой collation
+            op.execute(
+                f'CREATE INDEX {name} ON employees (lower({column}) text_pattern_ops) '
+                'WHERE deleted_at IS NULL'
+            )
+        else:
+            op.create_index(
+                name,
+                'employees',
+                [sa.text(f'lower({column})')],
+                sqlite_where=sa.text('deleted_at IS NULL'),
+            )
+
+
+def downgrade():
+    for column in reversed(COLUMNS):
+        op.drop_index(f'ix_employees_{column}_prefix', table_name='employees')
@@ -0,0 +1,39 @@
+"""Add deletion notices for digest emails
+
+Revision ID: f3b7d1a8c524
+Revises: e2a9c4f7b311
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b7d1a8c524'
+down_revision = 'e2a9c4f7b311'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('deletion_notices',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recipient', sa.String(), nullable=False),
+    sa.Column('entity_type', sa.String(), nullable=False),
+    sa.Column('entity_name', sa.String(), nullable=False),
+    sa.Column('deleted_by', sa.String(), nullable=False),
+    sa.Column('is_soft_delete', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('email_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['email_id'], ['email_outbox.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_deletion_notices_pending', 'deletion_notices', ['email_id', 'recipient', 'created_at'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_deletion_notices_pending', table_name='deletion_notices')
+    op.drop_table('deletion_notices')
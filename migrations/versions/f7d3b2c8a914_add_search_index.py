@@ -0,0 +1,91 @@
+"""Add full-text search index for devices, employees and warehouses
+
+Revision ID: f7d3b2c8a914
+Revises: e5c1a9d3f672
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7d3b2c8a914'
+down_revision = 'e5c1a9d3f672'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_FTS = (
+    "CREATE VIRTUAL TABLE search_index_fts USING fts5("
+    "title, content, content='search_index', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER search_index_ai AFTER INSERT ON search_index BEGIN "
+    "INSERT INTO search_index_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER search_index_ad AFTER DELETE ON search_index BEGIN "
+    "INSERT INTO search_index_fts(search_index_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER search_index_au AFTER UPDATE ON search_index BEGIN "
+    "INSERT INTO search_index_fts(search_index_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO search_index_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+)
+
+# Начальное заполнение; точный формат документов задаёт services/search.py
+# (`flask search-reindex` пересобирает индекс тем же кодом, что и приложение)
+POPULATE = (
+    "INSERT INTO search_index (entity_type, entity_id, title, subtitle, content) "
+    "SELECT 'device', id, inventory_number || ' ' || model, "
+    "CASE WHEN serial_number IS NOT NULL AND serial_number != '' THEN 'S/N ' || serial_number END, "
+    "trim(inventory_number || ' ' || model || ' ' || coalesce(serial_number, '') || ' ' || coalesce(notes, '')) "
+    "FROM devices WHERE deleted_at IS NULL",
+    "INSERT INTO search_index (entity_type, entity_id, title, subtitle, content) "
+    "SELECT 'employee', id, trim(last_name || ' ' || first_name || ' ' || coalesce(middle_name, '')), "
+    "email || ' · ' || phone || coalesce(' · ' || telegram, ''), "
+    "trim(last_name || ' ' || first_name || ' ' || coalesce(middle_name, '') || ' ' || email || ' ' "
+    "|| phone || ' ' || coalesce(telegram, '')) "
+    "FROM employees WHERE deleted_at IS NULL",
+    "INSERT INTO search_index (entity_type, entity_id, title, subtitle, content) "
+    "SELECT 'warehouse', id, name, address, trim(name || ' ' || coalesce(address, '')) "
+    "FROM warehouses WHERE deleted_at IS NULL",
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    op.create_table('search_index',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity_type', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('subtitle', sa.String(), nullable=True),
+    sa.Column('content', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('entity_type', 'entity_id', name='uq_search_index_entity')
+    )
+
+    if dialect == 'postgresql':
+        op.execute(
+            "CREATE INDEX ix_search_index_document ON search_index "
+            "USING gin (to_tsvector('simple', content))"
+        )
+        op.execute('CREATE INDEX ix_search_index_trgm ON search_index USING gin (content gin_trgm_ops)')
+    elif dialect == 'sqlite':
+        for statement in SQLITE_FTS:
+            op.execute(statement)
+
+    for statement in POPULATE:
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_search_index_trgm', table_name='search_index')
+        op.drop_index('ix_search_index_document', table_name='search_index')
+    elif dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS search_index_fts')
+    op.drop_table('search_index')
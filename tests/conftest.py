@@ -0,0 +1,21 @@
+import pytest
+
+from da import create_app
+from da.extensions import db as _db
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOG_DIR", str(tmp_path))
+    app = create_app("testing")
+    app.config["LOG_DIR"] = tmp_path
+    with app.app_context():
+        _db.create_all()
+        yield app
+        _db.session.remove()
+        _db.drop_all()
+
+
+@pytest.fixture()
+def db(app):
+    return _db
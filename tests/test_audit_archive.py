@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from da.services import audit_archive
+
+
+class _LockNotAvailable(Exception):
+    pgcode = audit_archive.LOCK_NOT_AVAILABLE
+
+
+class _FakeEngine:
+    """Записывает операторы; первые `busy` попыток DETACH не получают блокировку."""
+
+    def __init__(self, busy: int) -> None:
+        self.busy = busy
+        self.statements: list[str] = []
+
+    @contextmanager
+    def begin(self):
+        connection = SimpleNamespace(execute=self._execute)
+        yield connection
+
+    def _execute(self, statement) -> None:
+        sql = str(statement)
+        self.statements.append(sql)
+        if "DETACH" in sql and self.busy:
+            self.busy -= 1
+            raise OperationalError(sql, {}, _LockNotAvailable())
+
+
+def _fake_db(monkeypatch, engine):
+    session = SimpleNamespace(commit=lambda: None)
+    monkeypatch.setattr(audit_archive, "db", SimpleNamespace(engine=engine, session=session))
+    monkeypatch.setattr(audit_archive, "DETACH_RETRY_DELAY", 0)
+
+
+def test_drop_partition_detaches_without_concurrently_and_retries(monkeypatch):
+    engine = _FakeEngine(busy=2)
+    _fake_db(monkeypatch, engine)
+
+    audit_archive._drop_partition("audit_logs_p2024_01")
+
+    detaches = [sql for sql in engine.statements if "DETACH" in sql]
+    assert len(detaches) == 3
+    assert all("CONCURRENTLY" not in sql for sql in detaches)
+    assert engine.statements[-1] == "DROP TABLE audit_logs_p2024_01"
+    assert engine.statements.count(f"SET LOCAL lock_timeout = '{audit_archive.DETACH_LOCK_TIMEOUT}'") == 3
+
+
+def test_drop_partition_gives_up_after_attempts(monkeypatch):
+    engine = _FakeEngine(busy=audit_archive.DETACH_ATTEMPTS)
+    _fake_db(monkeypatch, engine)
+
+    with pytest.raises(OperationalError):
+        audit_archive._drop_partition("audit_logs_p2024_01")
+    assert not any(sql.startswith("DROP") for sql in engine.statements)
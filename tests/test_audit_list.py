@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from da.models import AuditAction, AuditLog
+from da.services.audit import insert_audit_rows
+from da.services.audit_list import field_changed
+
+
+def _postgresql(monkeypatch, db):
+    dialect = postgresql.dialect()
+    monkeypatch.setattr(db.session, "get_bind", lambda *args, **kwargs: SimpleNamespace(dialect=dialect))
+    return dialect
+
+
+def _sql(statement, dialect) -> str:
+    return str(select(AuditLog.id).where(statement).compile(dialect=dialect))
+
+
+def test_field_changed_postgresql_uses_jsonb_operators(monkeypatch, db):
+    dialect = _postgresql(monkeypatch, db)
+
+    assert "audit_logs.changes ? %(param_1)s" in _sql(field_changed("owner_id"), dialect)
+
+    sql = _sql(field_changed("owner_id", 42), dialect)
+    # {"owner_id": {"new": 42}} у изменения и {"owner_id": 42} у создания
+    assert sql.count("audit_logs.changes @> %(param_") == 2
+    assert "LIKE" not in sql
+
+
+def test_changes_index_supports_key_exists_operator():
+    index = next(index for index in AuditLog.__table__.indexes if index.name == "ix_audit_logs_changes")
+    ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+    assert "USING gin (changes)" in ddl
+    assert "jsonb_path_ops" not in ddl
+
+
+def test_field_changed_sqlite(db):
+    rows = [
+        {"user_id": 1, "action": AuditAction.UPDATE, "entity_type": "device", "entity_id": 1,
+         "changes": {"owner_id": {"old": None, "new": 42}}},
+        {"user_id": 1, "action": AuditAction.CREATE, "entity_type": "device", "entity_id": 2,
+         "changes": {"owner_id": 42}},
+        {"user_id": 1, "action": AuditAction.UPDATE, "entity_type": "device", "entity_id": 3,
+         "changes": {"model": {"old": "A", "new": "B"}}},
+    ]
+    insert_audit_rows(rows)
+
+    def entity_ids(condition):
+        return sorted(db.session.scalars(select(AuditLog.entity_id).where(condition)))
+
+    assert entity_ids(field_changed("owner_id")) == [1, 2]
+    assert entity_ids(field_changed("owner_id", 42)) == [1, 2]
+    assert entity_ids(field_changed("model", "B")) == [3]
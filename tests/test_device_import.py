@@ -0,0 +1,80 @@
+from io import BytesIO
+
+import openpyxl
+
+from da.models import Device, DeviceStatus, DeviceType, Employee, Location, Warehouse
+from da.services.inventory import InventoryService
+
+
+def _xlsx(*rows) -> BytesIO:
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    # 0: Inv Number, 1: Model, 2: Type, 3: Location, 4: Serial, 5: Notes, 6: Employee
+    ws.append(["Инв. номер", "Модель", "Тип", "Локация", "Серийный номер", "Примечания", "Сотрудник"])
+    for row in rows:
+        ws.append(row)
+    stream = BytesIO()
+    wb.save(stream)
+    stream.seek(0)
+    return stream
+
+
+def _setup(db):
+    office = Location(name="Офис")
+    remote = Location(name="Удалённо")
+    db.session.add_all([office, remote])
+    db.session.flush()
+    laptop = DeviceType(name="Laptop")
+    warehouse = Warehouse(name="Склад 1", location_id=office.id)
+    employee = Employee(
+        first_name="Иван",
+        last_name="Иванов",
+        position="dev",
+        email="ivanov@example.com",
+        phone="+70000000000",
+        location_id=remote.id,
+    )
+    db.session.add_all([laptop, warehouse, employee])
+    db.session.flush()
+    device = Device(
+        inventory_number="INV-1",
+        model="Old",
+        type_id=laptop.id,
+        warehouse_id=warehouse.id,
+        location_id=office.id,
+        status=DeviceStatus.IN_STOCK,
+    )
+    db.session.add(device)
+    db.session.commit()
+    return device, warehouse, employee
+
+
+def test_reimport_with_owner_assigns_device(db):
+    device, _, employee = _setup(db)
+
+    result = InventoryService.import_devices_from_excel(
+        _xlsx(["INV-1", "New", "Laptop", "Офис", "SN", None, "ivanov@example.com"])
+    )
+
+    assert result["updated"] == 1
+    db.session.expire_all()
+    device = db.session.get(Device, device.id)
+    assert device.model == "New"
+    assert device.owner_id == employee.id
+    assert device.warehouse_id is None
+    assert device.status == DeviceStatus.ASSIGNED
+    assert device.location_id == employee.location_id
+
+
+def test_reimport_without_owner_keeps_placement(db):
+    device, warehouse, _ = _setup(db)
+
+    InventoryService.import_devices_from_excel(_xlsx(["INV-1", "New", "Laptop", "Удалённо", "SN", None, None]))
+
+    db.session.expire_all()
+    device = db.session.get(Device, device.id)
+    assert device.model == "New"
+    assert device.owner_id is None
+    assert device.warehouse_id == warehouse.id
+    assert device.status == DeviceStatus.IN_STOCK
+    assert device.location_id == warehouse.location_id
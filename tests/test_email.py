@@ -0,0 +1,77 @@
+import threading
+from datetime import datetime, timedelta
+
+from da.models import DeletionNotice, EmailOutbox
+from da.services import email
+from da.services.email import flush_deletion_digests, start_email_sender
+
+T0 = datetime(2026, 10, 1, 12, 0, 0)
+
+
+def _notice(db, name, created_at, recipient="admin@example.ru", entity_type="device", soft=True):
+    notice = DeletionNotice(
+        recipient=recipient,
+        entity_type=entity_type,
+        entity_name=name,
+        deleted_by="user@example.ru",
+        is_soft_delete=soft,
+        created_at=created_at,
+    )
+    db.session.add(notice)
+    db.session.commit()
+    return notice
+
+
+def test_digest_waits_for_window_from_first_notice(app, db):
+    app.config["DELETION_DIGEST_MINUTES"] = 5
+    first = _notice(db, "INV-1", T0)
+    second = _notice(db, "Иванов Иван", T0 + timedelta(minutes=3), entity_type="employee", soft=False)
+
+    assert flush_deletion_digests(now=T0 + timedelta(minutes=4, seconds=59)) == 0
+    assert db.session.query(EmailOutbox).count() == 0
+
+    assert flush_deletion_digests(now=T0 + timedelta(minutes=5)) == 1
+    item = db.session.query(EmailOutbox).one()
+    assert item.recipient == "admin@example.ru"
+    assert item.subject == "Уведомление об удалении: 2 объектов"
+    assert "INV-1" in item.body and "Иванов Иван" in item.body
+    assert {first.email_id, second.email_id} == {item.id}
+
+    # Собранные уведомления второй раз не отправляются
+    assert flush_deletion_digests(now=T0 + timedelta(hours=1)) == 0
+
+
+def test_single_notice_is_sent_as_plain_notification(app, db):
+    app.config["DELETION_DIGEST_MINUTES"] = 5
+    _notice(db, "INV-7", T0)
+    _notice(db, "Склад 2", T0 + timedelta(minutes=10), recipient="other@example.ru", entity_type="warehouse")
+
+    assert flush_deletion_digests(now=T0 + timedelta(minutes=6)) == 1
+    item = db.session.query(EmailOutbox).one()
+    assert item.subject == "Уведомление об удалении: device"
+    assert "Название: INV-7" in item.body
+    # Окно второго получателя ещё не истекло
+    assert db.session.query(DeletionNotice).filter(DeletionNotice.email_id.is_(None)).count() == 1
+
+
+def test_sender_starts_with_app_and_drains_without_new_mail(app, monkeypatch):
+    polled = threading.Event()
+    monkeypatch.setattr(email, "send_pending_emails", polled.set)
+    monkeypatch.setattr(email, "_sender", None)
+    app.config["EMAIL_SENDER_THREAD"] = True
+    app.config["EMAIL_POLL_INTERVAL"] = 60
+
+    start_email_sender(app)
+    try:
+        assert polled.wait(5)
+    finally:
+        email._sender.stop()
+
+
+def test_sender_not_started_when_disabled(app, monkeypatch):
+    monkeypatch.setattr(email, "_sender", None)
+    app.config["EMAIL_SENDER_THREAD"] = False
+
+    start_email_sender(app)
+
+    assert email._sender is None
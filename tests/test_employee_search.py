@@ -0,0 +1,47 @@
+from itertools import count
+
+from da.models import Employee, Location, User, UserRole
+from da.services.employee_search import search_employees
+
+_phones = count(1)
+
+
+def _employee(db, last_name, first_name, email=None):
+    location = Location.query.first()
+    if location is None:
+        location = Location(name="Офис")
+        db.session.add(location)
+        db.session.flush()
+    employee = Employee(
+        last_name=last_name,
+        first_name=first_name,
+        position="Инженер",
+        email=email or f"user{next(_phones)}@example.ru",
+        phone=f"+7900{next(_phones):07}",
+        location_id=location.id,
+    )
+    db.session.add(employee)
+    db.session.commit()
+    return employee
+
+
+def test_search_matches_cyrillic_in_any_case(db):
+    employee = _employee(db, "Иванов", "Пётр", email="ivanov@example.ru")
+    _employee(db, "Петров", "Иван")
+
+    for query in ("Иванов", "иванов", "ИВАН пёт", "ivanov"):
+        assert [row["id"] for row in search_employees(query)] == [employee.id], query
+    assert {row["full_name"] for row in search_employees("иван")} == {"Иванов Пётр", "Петров Иван"}
+
+
+def test_search_route_returns_cyrillic_match(app, db):
+    user = User(email="admin@example.ru", full_name="Admin", role=UserRole.SUPER_ADMIN)
+    user.set_password("password1")
+    db.session.add(user)
+    _employee(db, "Иванов", "Пётр", email="p.ivanov@example.ru")
+    client = app.test_client()
+    client.post("/auth/login", data={"email": "admin@example.ru", "password": "password1"})
+
+    response = client.get("/employees/search", query_string={"q": "Иванов"})
+
+    assert [row["full_name"] for row in response.get_json()["results"]] == ["Иванов Пётр"]
@@ -0,0 +1,63 @@
+import os
+import runpy
+import subprocess
+import sys
+from pathlib import Path
+
+from da.services.metrics import MULTIPROC_ENV
+
+ROOT = Path(__file__).resolve().parents[1]
+
+WORKER = """
+from da import create_app
+app = create_app("testing")
+client = app.test_client()
+for _ in range(2):
+    client.get("/metrics")
+"""
+
+
+def test_metrics_closed_without_token(app):
+    app.config["METRICS_TOKEN"] = None
+    client = app.test_client()
+
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"Authorization": "Bearer "}).status_code == 403
+
+
+def test_metrics_with_token(app):
+    app.config["METRICS_TOKEN"] = "secret"
+    client = app.test_client()
+
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert b"da_http_requests_total" in response.data
+
+
+def test_metrics_aggregate_worker_processes(app, tmp_path, monkeypatch):
+    # Воркеры — отдельные процессы: prometheus_client читает каталог при импорте
+    directory = tmp_path / "multiproc"
+    directory.mkdir()
+    env = {**os.environ, MULTIPROC_ENV: str(directory), "LOG_DIR": str(tmp_path)}
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", WORKER], env=env, cwd=ROOT, check=True)
+    monkeypatch.setenv(MULTIPROC_ENV, str(directory))
+    app.config["METRICS_TOKEN"] = "secret"
+
+    response = app.test_client().get("/metrics", headers={"Authorization": "Bearer secret"})
+
+    assert 'da_http_requests_total{endpoint="metrics",method="GET",status="403"} 4.0' in response.text
+
+
+def test_gunicorn_config_sets_multiproc_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(MULTIPROC_ENV, "unset")
+    monkeypatch.delenv(MULTIPROC_ENV)
+    config = runpy.run_path(str(ROOT / "gunicorn.conf.py"))
+    directory = Path(os.environ[MULTIPROC_ENV])
+    assert directory.name == "da-prometheus-multiproc"
+
+    monkeypatch.setenv(MULTIPROC_ENV, str(tmp_path))
+    (tmp_path / "counter_1.db").touch()
+    config["on_starting"](None)
+    assert not list(tmp_path.glob("*.db"))
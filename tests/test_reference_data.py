@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import event
+
+from da.models import Location, Warehouse
+from da.services import reference_data
+from da.services.reference_data import get_device_types, get_locations, get_warehouses
+
+
+@pytest.fixture()
+def clock(app, monkeypatch):
+    # Кэш модульный: списки прошлых тестов не должны совпасть по версиям
+    reference_data.invalidate_reference_data()
+    now = [1000.0]
+    monkeypatch.setattr(reference_data.time, "monotonic", lambda: now[0])
+    app.config["REFERENCE_CACHE_TTL"] = 3600
+    app.config["REFERENCE_VERSION_POLL_SECONDS"] = 2
+    yield now
+    reference_data.invalidate_reference_data()
+
+
+@pytest.fixture()
+def version_queries(db):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and "reference_versions" in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(db.engine, "before_cursor_execute", record)
+
+
+def _names():
+    return {warehouse.name for warehouse in get_warehouses()}
+
+
+def test_versions_read_once_per_poll_interval(db, clock, version_queries):
+    for _ in range(3):
+        get_device_types(), get_locations(), get_warehouses()
+
+    assert len(version_queries) == 1
+
+    clock[0] += 2
+    get_locations()
+    assert len(version_queries) == 2
+
+
+def test_other_process_change_visible_after_poll_interval(db, clock):
+    location = Location(name="Офис")
+    db.session.add_all([location, Warehouse(name="W1", location=location)])
+    db.session.commit()
+    assert _names() == {"W1"}
+
+    # Другой процесс: вставка и подъём версии мимо сессии этого процесса
+    with db.engine.begin() as conn:
+        conn.execute(Warehouse.__table__.insert().values(name="W2", location_id=location.id))
+        reference_data._bump_versions(conn, ["warehouse"])
+
+    assert _names() == {"W1"}
+    clock[0] += 2
+    assert _names() == {"W1", "W2"}
+
+
+def test_own_commit_visible_immediately(db, clock):
+    location = Location(name="Офис")
+    db.session.add(location)
+    db.session.commit()
+    assert _names() == set()
+
+    db.session.add(Warehouse(name="W1", location=location))
+    db.session.flush()
+    # Незакоммиченное изменение видно своей транзакции, но не кэшируется
+    assert _names() == {"W1"}
+    db.session.rollback()
+    assert _names() == set()
+
+    db.session.add(Warehouse(name="W2", location=location))
+    db.session.commit()
+    assert _names() == {"W2"}